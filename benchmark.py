@@ -0,0 +1,216 @@
+"""性能基准：用合成的大规模数据测量各热点路径，结果输出为 JSON
+
+用法:
+    python benchmark.py --sizes 100 1000 10000 --output bench.json
+    python benchmark.py --sizes 100000 --storage sqlite
+
+每个规模会在临时目录中生成 filaments.json / models.json / print_history.json，
+记录每项操作的耗时（秒，取 repeat 次中的最小值）和 tracemalloc 峰值内存（字节）。
+会修改数据的操作（打印扣料）只计时一轮。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from cost import compute_cost
+from filament import FilamentManager
+from history import PrintHistoryManager, TIME_FORMAT
+from model import ModelManager
+from service import PrintService
+from snapshot import to_binary
+from storage import JsonStorage, SqliteStorage, import_json
+import views
+
+CATEGORIES = ["PLA", "ABS", "PETG", "TPU", "ASA", "PC", "尼龙", "其他"]
+
+
+def generate(directory: str, size: int, seed: int = 0):
+    """在 directory 下生成 size 条耗材、模型和打印历史"""
+    rng = random.Random(seed)
+    filaments = [
+        {
+            "name": f"耗材{i:07d}",
+            "category": rng.choice(CATEGORIES),
+            "total_price": round(rng.uniform(30, 300), 2),
+            "initial_amount": rng.choice([250, 500, 1000, 3000]),
+            "remaining": round(rng.uniform(0, 1000), 2),
+        }
+        for i in range(size)
+    ]
+    models = [
+        {
+            "name": f"模型{i:07d}",
+            "materials": [
+                {"filament": filaments[rng.randrange(size)]["name"], "weight": round(rng.uniform(1, 200), 2)}
+                for _ in range(rng.randint(1, 4))
+            ],
+            "quantity": rng.randint(1, 8),
+        }
+        for i in range(size)
+    ]
+    start = datetime(2020, 1, 1)
+    history = []
+    for i in range(size):
+        model = models[rng.randrange(size)]
+        history.append({
+            "id": i + 1,
+            "model_name": model["name"],
+            "used_materials": model["materials"],
+            "timestamp": (start + timedelta(minutes=37 * i)).strftime(TIME_FORMAT),
+        })
+    for name, data in (("filaments.json", filaments), ("models.json", models),
+                       ("print_history.json", history)):
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump(data, f, indent=4 if name == "print_history.json" else None)
+
+
+def measure(fn, repeat: int = 3) -> dict:
+    """运行 fn repeat 次取最短耗时；再单独运行一次（开启 tracemalloc）记录峰值内存"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def retained(factory) -> int:
+    """factory() 创建的对象在返回后仍占用的内存（字节）"""
+    tracemalloc.start()
+    obj = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def open_backend(kind: str, directory: str):
+    files = dict(
+        filaments_file=os.path.join(directory, "filaments.json"),
+        models_file=os.path.join(directory, "models.json"),
+        history_file=os.path.join(directory, "print_history.json"),
+    )
+    if kind == "json":
+        return JsonStorage(**files)
+    if kind == "binary":
+        to_binary(directory)
+        return JsonStorage(binary=True, **files)
+    storage = SqliteStorage(os.path.join(directory, "printing.db"))
+    if storage.is_empty():
+        import_json(storage, JsonStorage(**files))
+    return storage
+
+
+def run_size(size: int, kind: str, repeat: int, lookups: int, prints: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        generate(directory, size)
+        storage = open_backend(kind, directory)
+        rng = random.Random(1)
+
+        # 加载 / 保存
+        fm = FilamentManager(storage=storage)
+        mm = ModelManager(storage=storage, filament_manager=fm)
+        hm = PrintHistoryManager(storage=storage)
+        results["filaments.load_data"] = measure(fm.load_data, repeat)
+        results["models.load_data"] = measure(mm.load_data, repeat)
+        results["history.load_data"] = measure(hm.load_data, repeat)
+        results["filaments.save_data"] = measure(fm.save_data, repeat)
+        results["models.save_data"] = measure(mm.save_data, repeat)
+        results["history.save_data"] = measure(hm.save_data, repeat)
+
+        # 常驻内存：加载后各管理器持有的对象大小（用单独的存储实例，不影响上面的管理器）
+        scratch = open_backend(kind, directory)
+        results["filaments.retained_bytes"] = retained(lambda: FilamentManager(storage=scratch))
+        results["models.retained_bytes"] = retained(lambda: ModelManager(storage=scratch))
+        results["history.retained_bytes"] = retained(lambda: PrintHistoryManager(storage=scratch))
+        scratch.close()
+
+        # 查找
+        filament_names = [rng.choice(fm.filaments).name for _ in range(lookups)]
+        model_names = [rng.choice(mm.models).name for _ in range(lookups)]
+        results[f"find_filament x{lookups}"] = measure(
+            lambda: [fm.find_filament(n) for n in filament_names], repeat)
+        results[f"find_model x{lookups}"] = measure(
+            lambda: [mm.find_model(n) for n in model_names], repeat)
+
+        # 成本
+        results["cost.all_models.uncached"] = measure(
+            lambda: [compute_cost(m, fm) for m in mm.models], repeat)
+
+        def cold_cached():
+            mm.costs.clear()
+            for m in mm.models:
+                mm.cost(m)
+        results["cost.all_models.cold_cache"] = measure(cold_cached, repeat)
+        results["cost.all_models.warm_cache"] = measure(lambda: [mm.cost(m) for m in mm.models], repeat)
+        try:
+            from bulk import CostMatrix
+        except ImportError:
+            results["cost.all_models.bulk"] = {"skipped": "numpy 未安装"}
+        else:
+            matrix = CostMatrix(fm, mm)
+            results["cost.all_models.bulk"] = measure(matrix.compute, repeat)
+
+        # 刷新列表所需的数据准备（不含 Tk 插入）
+        results["refresh_filaments.rows"] = measure(
+            lambda: [views.filament_row(f) for f in sorted(fm.filaments, key=lambda f: -f.remaining)], repeat)
+        results["refresh_models.rows"] = measure(
+            lambda: [views.model_row(m, mm.cost(m)) for m in mm.models], repeat)
+        results["refresh_print_history.rows.first_page"] = measure(
+            lambda: [views.history_row(e) for e in hm.page(0, 100)], repeat)
+        results["refresh_print_history.rows.all"] = measure(
+            lambda: [views.history_row(e) for e in reversed(hm.history)], repeat)
+
+        # 打印扣料（与 use_model 相同的路径），先把库存设为足够大，避免耗材不足
+        service = PrintService(storage)
+        for f in service.filaments.filaments:
+            f.remaining = 10 ** 9
+        jobs = [(rng.choice(service.models.models).name, 1) for _ in range(prints)]
+        results[f"use_model x{prints}"] = measure(
+            lambda: [service.use_model(name, count) for name, count in jobs], 1)
+        results[f"run_jobs batch of {prints}"] = measure(lambda: service.run_jobs(jobs), 1)
+        storage.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="3D打印耗材管理 性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--storage", choices=["json", "binary", "sqlite"], default="json")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--prints", type=int, default=20)
+    parser.add_argument("--output", default="bench.json")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created": datetime.now().strftime(TIME_FORMAT),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "storage": args.storage,
+        "results": {},
+    }
+    for size in args.sizes:
+        print(f"size={size} ...", file=sys.stderr)
+        report["results"][str(size)] = run_size(size, args.storage, args.repeat, args.lookups, args.prints)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
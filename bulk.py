@@ -0,0 +1,141 @@
+"""批量成本计算：模型 × 耗材 的稀疏用量矩阵（需要 numpy）
+
+用量矩阵以 COO 三元组（行=模型，列=耗材名称，值=重量）存放在可增长的数组中，
+每克单价是按列排列的向量；一次 np.bincount 就得到全部模型的总成本与总重量。
+模型新增/修改/删除时只追加或作废对应模型的三元组，不重建整个矩阵。
+结果与 cost.compute_cost 的逐模型计算完全一致（同样的乘法、同样的累加顺序）。
+"""
+from collections import namedtuple
+import numpy as np
+from events import ADDED, UPDATED, REMOVED, RESET
+
+BulkCost = namedtuple("BulkCost", ["total", "unit", "weight"])
+
+
+class CostMatrix:
+    def __init__(self, filament_manager, model_manager):
+        self.filament_manager = filament_manager
+        self.model_manager = model_manager
+        filament_manager.subscribe(self.on_filament_changed)
+        model_manager.subscribe(self.on_model_changed)
+        self.rebuild()
+
+    # ------------------ 构建 ------------------
+    def rebuild(self):
+        """从当前的模型和耗材重新构建矩阵"""
+        self._columns = {}  # 耗材名称 -> 列号
+        self._prices = np.zeros(0)  # 每克单价（按列）
+        self._found = np.zeros(0, dtype=bool)  # 该列名称是否有对应耗材
+        self._rows = {}  # id(model) -> 行号
+        self._spans = []  # 行号 -> 该行三元组的 [start, end)
+        self._models = []  # 行号 -> 模型（已删除的行为 None）
+        self._quantity = np.zeros(0)
+        self._size = 0  # 三元组数量
+        self._dead = 0  # 已作废的三元组数量
+        self._r = np.zeros(0, dtype=np.int64)
+        self._c = np.zeros(0, dtype=np.int64)
+        self._w = np.zeros(0)
+        for model in self.model_manager.models:
+            self._add_model(model)
+
+    def _column(self, name: str) -> int:
+        col = self._columns.get(name)
+        if col is None:
+            col = len(self._columns)
+            self._columns[name] = col
+            if col >= len(self._prices):
+                capacity = max(16, 2 * len(self._prices))
+                self._prices = np.resize(self._prices, capacity)
+                self._found = np.resize(self._found, capacity)
+            self._set_price(name, col)
+        return col
+
+    def _set_price(self, name: str, col: int):
+        filament = self.filament_manager.find_filament(name)
+        self._prices[col] = filament.price if filament else 0.0
+        self._found[col] = filament is not None
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed > len(self._w):
+            capacity = max(64, needed, 2 * len(self._w))
+            self._r = np.resize(self._r, capacity)
+            self._c = np.resize(self._c, capacity)
+            self._w = np.resize(self._w, capacity)
+
+    def _add_model(self, model):
+        row = len(self._models)
+        self._models.append(model)
+        self._rows[id(model)] = row
+        if row >= len(self._quantity):
+            self._quantity = np.resize(self._quantity, max(16, 2 * len(self._quantity)))
+        self._quantity[row] = model.quantity
+        self._reserve(len(model.materials))
+        self._spans.append((self._size, self._size + len(model.materials)))
+        for mat in model.materials:
+            self._r[self._size] = row
+            self._c[self._size] = self._column(mat.filament)
+            self._w[self._size] = mat.weight
+            self._size += 1
+
+    def _remove_model(self, model):
+        row = self._rows.pop(id(model), None)
+        if row is None:
+            return
+        self._models[row] = None
+        self._quantity[row] = 0
+        # 作废该行的三元组：重量置零不影响累加结果
+        start, end = self._spans[row]
+        self._w[start:end] = 0.0
+        self._dead += end - start
+
+    def _compact(self):
+        """作废的三元组超过一半时重建（须在一次更新全部完成之后调用，重建会从管理器重新加入全部模型）"""
+        if self._dead > self._size // 2:
+            self.rebuild()
+
+    # ------------------ 增量更新 ------------------
+    def on_model_changed(self, event):
+        if event.action == RESET:
+            self.rebuild()
+        elif event.action == ADDED:
+            self._add_model(event.obj)
+        elif event.action == UPDATED:
+            self._remove_model(event.obj)
+            self._add_model(event.obj)
+            self._compact()
+        elif event.action == REMOVED:
+            self._remove_model(event.obj)
+            self._compact()
+
+    def on_filament_changed(self, event):
+        if event.action == RESET:
+            self.rebuild()
+            return
+        for name in {event.key, event.old_key} - {None}:
+            col = self._columns.get(name)
+            if col is not None:
+                self._set_price(name, col)
+
+    # ------------------ 计算 ------------------
+    def compute(self):
+        """一次向量化计算全部模型，返回 (模型列表, 总成本, 单个成本, 总重量) 数组"""
+        n = len(self._models)
+        r = self._r[:self._size]
+        c = self._c[:self._size]
+        w = self._w[:self._size]
+        total = np.bincount(r, weights=w * self._prices[c], minlength=n)
+        weight = np.bincount(r, weights=np.where(self._found[c], w, 0.0), minlength=n)
+        quantity = self._quantity[:n]
+        unit = np.divide(total, quantity, out=np.zeros(n), where=quantity > 0)
+        alive = [i for i, m in enumerate(self._models) if m is not None]
+        models = [self._models[i] for i in alive]
+        return models, total[alive], unit[alive], weight[alive]
+
+    def results(self) -> dict:
+        """模型名称 -> BulkCost(total, unit, weight)"""
+        models, total, unit, weight = self.compute()
+        return {
+            m.name: BulkCost(float(t), float(u), float(w))
+            for m, t, u, w in zip(models, total.tolist(), unit.tolist(), weight.tolist())
+        }
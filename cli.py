@@ -0,0 +1,379 @@
+"""命令行入口（不加载图形界面），用于脚本化和批量操作
+
+示例:
+    python cli.py filaments
+    python cli.py add-filament "PLA 白" PLA 89 1000
+    python cli.py print 齿轮 -n 3
+    python cli.py queue jobs.csv          # 每行: 模型名称,盘数
+    python cli.py history --latest 50
+    python cli.py search 白 --in filaments models
+    python cli.py stats --by filament --period month --last 12
+    python cli.py forecast
+    python cli.py add-spool "PLA 白" 79 1000     # 同一种耗材入库新的一卷
+    python cli.py spools "PLA 白"
+    python cli.py import 切片目录/ --map "Bambu PLA Basic=PLA 白"
+    python cli.py printers P1 P2 P3            # 设置打印农场的打印机
+    python cli.py farm-import backlog.csv      # 每行: 模型名称,盘数,每盘分钟[,打印机;打印机]
+    python cli.py schedule                     # 排产计划；farm-start 开始、farm-done P1 完成
+    python cli.py --storage sqlite models
+"""
+import argparse
+import csv
+import sys
+from printqueue import format_shortfalls
+from rollup import recent_start
+from service import PrintService
+from storage import open_storage
+import views
+
+
+def cmd_filaments(service, args):
+    filaments = service.filaments.find_by_category(args.category) if args.category else service.filaments.filaments
+    for f in filaments:
+        print(f"{f.name}\t{f.category}\t{f.total_price:.2f}\t{f.price:.4f}\t{f.initial_amount}\t{f.remaining:.2f}")
+
+
+def cmd_add_filament(service, args):
+    service.add_filament(args.name, args.category, args.total_price, args.initial_amount)
+
+
+def cmd_delete_filament(service, args):
+    affected = service.delete_filament(args.name)
+    if affected:
+        print(f"警告：以下 {len(affected)} 个模型引用了该耗材，成本将不再包含它：", file=sys.stderr)
+        for m in affected:
+            print(f"  {m.name}", file=sys.stderr)
+
+
+def cmd_spools(service, args):
+    for i, spool in enumerate(service.spools(args.name), 1):
+        text, values, _ = views.spool_row(spool, i if spool.remaining > 0 else None)
+        print("\t".join(str(v) for v in (text,) + values))
+
+
+def cmd_add_spool(service, args):
+    spool = service.add_spool(args.name, args.price, args.amount)
+    print(f"已入库，卷编号 {spool.id}")
+
+
+def cmd_delete_spool(service, args):
+    service.delete_spool(args.name, args.id)
+
+
+def cmd_models(service, args):
+    costs = service.bulk_costs()
+    for m in service.models.models:
+        cost = costs[m.name]
+        print(f"{m.name}\t{cost.weight:.2f}g\t{m.quantity}\t{cost.total:.2f}\t{cost.unit:.2f}")
+
+
+def cmd_add_model(service, args):
+    materials = []
+    for spec in args.material:
+        filament, _, weight = spec.rpartition(":")
+        materials.append({"filament": filament, "weight": float(weight)})
+    service.add_model(args.name, materials, args.quantity)
+
+
+def cmd_import(service, args):
+    aliases = {}
+    for spec in args.map:
+        source, sep, target = spec.partition("=")
+        if not sep:
+            raise ValueError(f"--map 的格式应为 切片耗材名=库存耗材名: {spec}")
+        aliases[source.strip()] = target.strip()
+    report = service.import_sliced(args.paths, aliases, args.quantity, args.jobs)
+    for m in report.created:
+        print(f"已创建\t{m.name}\t{', '.join(f'{mat.filament}({mat.weight}g)' for mat in m.materials)}")
+    for name in report.skipped:
+        print(f"已存在\t{name}", file=sys.stderr)
+    for path, message in report.failed:
+        print(f"失败\t{path}\t{message}", file=sys.stderr)
+    if report.unmatched:
+        print(f"以下耗材在库存中没有对应项（可用 --map 指定）：{', '.join(sorted(report.unmatched))}", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+def cmd_delete_model(service, args):
+    service.delete_model(args.name)
+
+
+def _report(result) -> int:
+    if not result.ok:
+        print(f"耗材不足：\n{format_shortfalls(result.shortfalls)}", file=sys.stderr)
+        return 1
+    for name, amount in result.requirements.items():
+        print(f"{name}: 使用 {amount:.2f}g")
+    return 0
+
+
+def cmd_print(service, args):
+    return _report(service.use_model(args.model, args.count))
+
+
+def cmd_queue(service, args):
+    with open(args.file, newline='', encoding='utf-8') as f:
+        jobs = [(row[0], int(row[1]) if len(row) > 1 else 1) for row in csv.reader(f) if row]
+    return _report(service.run_jobs(jobs))
+
+
+def cmd_history(service, args):
+    if args.since or args.until:
+        entries = service.history_between(args.since, args.until, args.model, args.filament)[::-1]
+    else:
+        entries = service.latest_history(args.latest, args.model, args.filament)
+    for entry in entries[:args.latest]:
+        materials = ", ".join(f"{mat.filament}({mat.weight}g)" for mat in entry.used_materials)
+        print(f"{entry.id}\t{entry.time_str()}\t{entry.model_name}\t{materials}")
+
+
+def cmd_delete_history(service, args):
+    service.delete_history(args.id)
+
+
+def cmd_search(service, args):
+    if "filaments" in args.targets:
+        for f in service.search_filaments(args.query, args.limit):
+            print(f"耗材\t{f.name}\t{f.category}\t{f.remaining:.2f}")
+    if "models" in args.targets:
+        for m in service.search_models(args.query, args.limit):
+            print(f"模型\t{m.name}\t{', '.join(mat.filament for mat in m.materials)}")
+    if "history" in args.targets:
+        for entry in service.search_history(args.query, args.limit):
+            print(f"历史\t{entry.time_str()}\t{entry.model_name}")
+
+
+def cmd_stats(service, args):
+    since = recent_start(args.period, args.last) if args.last else args.since
+    for name, usage in service.usage(args.by, args.period, since, args.until)[:args.limit]:
+        print(f"{name}\t{usage.grams:.2f}g\t{usage.cost:.2f}\t{usage.prints}")
+
+
+def cmd_forecast(service, args):
+    for message in service.stock_warnings():
+        print(f"预警: {message}")
+    for m, capacity in service.capacity_report()[:args.limit]:
+        print(f"模型\t{m.name}\t{capacity.prints}盘\t{capacity.limiting or '-'}")
+    for f, outlook in service.depletion_report()[:args.limit]:
+        if outlook.days_left is None:
+            print(f"耗材\t{f.name}\t{outlook.remaining:.2f}g\t近期无消耗")
+        else:
+            print(f"耗材\t{f.name}\t{outlook.remaining:.2f}g\t{outlook.rate:.2f}g/天\t"
+                  f"{outlook.days_left:.1f}天\t{outlook.depletion:%Y-%m-%d}")
+
+
+def cmd_printers(service, args):
+    if args.names:
+        service.set_printers(args.names)
+    for name in service.printers():
+        print(name)
+
+
+def cmd_farm_add(service, args):
+    job = service.add_farm_job(args.model, args.count, args.minutes, args.printers)
+    print(f"已加入任务 {job.id}")
+
+
+def cmd_farm_import(service, args):
+    with open(args.file, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if row]
+    jobs = []
+    for row in rows:
+        if len(row) < 3:
+            raise ValueError(f"格式应为 模型名称,盘数,每盘分钟[,打印机;打印机]: {','.join(row)}")
+        printers = [p.strip() for p in row[3].split(";") if p.strip()] if len(row) > 3 else []
+        jobs.append((row[0], int(row[1]), float(row[2]), printers))
+    print(f"已加入 {len(service.add_farm_jobs(jobs))} 个任务")
+
+
+def cmd_farm_jobs(service, args):
+    for job in service.farm_jobs():
+        text, values, _ = views.farm_job_row(job)
+        print("\t".join(str(v) for v in (text,) + values))
+
+
+def cmd_farm_remove(service, args):
+    service.remove_farm_job(args.id)
+
+
+def cmd_schedule(service, args):
+    schedule = service.plan_farm()
+    for a in schedule.running + schedule.assignments[:args.limit]:
+        state = "打印中" if a.job is None else f"任务{a.job}"
+        print(f"{a.printer}\t{a.model}\t{a.start:%Y-%m-%d %H:%M}\t{a.end:%Y-%m-%d %H:%M}\t{state}")
+    if len(schedule.assignments) > args.limit:
+        print(f"……另有 {len(schedule.assignments) - args.limit} 盘")
+    for u in schedule.unscheduled:
+        print(f"未排产\t任务{u.job}\t{u.model}\t{u.count}盘\t{u.reason}")
+    if schedule.makespan is not None:
+        print(f"全部完成: {schedule.makespan:%Y-%m-%d %H:%M}")
+
+
+def cmd_farm_start(service, args):
+    result, plates = service.start_farm()
+    if not result.ok:
+        return _report(result)
+    for a in plates:
+        print(f"{a.printer}\t开始 {a.model}\t预计 {a.end:%Y-%m-%d %H:%M} 完成")
+    if not plates:
+        print("没有可以开始的盘")
+
+
+def cmd_farm_done(service, args):
+    plate = service.complete_farm_plate(args.printer)
+    print(f"{plate.printer}\t{plate.model} 已完成")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="3D打印耗材管理（命令行）")
+    parser.add_argument("--storage", choices=["json", "binary", "shared", "sqlite"], help="存储后端（默认读取 PRINTING_STORAGE）")
+    parser.add_argument("--db", help="SQLite 数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("filaments", help="列出耗材")
+    p.add_argument("--category")
+    p.set_defaults(func=cmd_filaments)
+
+    p = sub.add_parser("add-filament", help="添加耗材")
+    p.add_argument("name")
+    p.add_argument("category")
+    p.add_argument("total_price", type=float)
+    p.add_argument("initial_amount", type=int)
+    p.set_defaults(func=cmd_add_filament)
+
+    p = sub.add_parser("delete-filament", help="删除耗材")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_delete_filament)
+
+    p = sub.add_parser("spools", help="列出耗材的各卷（按扣料顺序）")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_spools)
+
+    p = sub.add_parser("add-spool", help="为耗材入库新的一卷")
+    p.add_argument("name")
+    p.add_argument("price", type=float, help="整卷价格")
+    p.add_argument("amount", type=float, help="整卷克数")
+    p.set_defaults(func=cmd_add_spool)
+
+    p = sub.add_parser("delete-spool", help="删除耗材的一卷（卷编号见 spools 输出第一列）")
+    p.add_argument("name")
+    p.add_argument("id", type=int)
+    p.set_defaults(func=cmd_delete_spool)
+
+    p = sub.add_parser("models", help="列出模型及成本")
+    p.set_defaults(func=cmd_models)
+
+    p = sub.add_parser("add-model", help="添加模型，耗材格式为 名称:克数")
+    p.add_argument("name")
+    p.add_argument("material", nargs="+")
+    p.add_argument("-q", "--quantity", type=int, default=1)
+    p.set_defaults(func=cmd_add_model)
+
+    p = sub.add_parser("import", help="从切片文件（G-code / 3MF，可为目录）批量创建模型")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--map", action="append", default=[], metavar="切片耗材名=库存耗材名",
+                   help="耗材名称对应关系，可重复")
+    p.add_argument("-q", "--quantity", type=int, default=1, help="单盘数量")
+    p.add_argument("-j", "--jobs", type=int, help="并行进程数（默认 CPU 核数）")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("delete-model", help="删除模型")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_delete_model)
+
+    p = sub.add_parser("print", help="打印模型（扣除耗材并记录历史）")
+    p.add_argument("model")
+    p.add_argument("-n", "--count", type=int, default=1, help="盘数")
+    p.set_defaults(func=cmd_print)
+
+    p = sub.add_parser("queue", help="批量打印，CSV 每行: 模型名称,盘数")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_queue)
+
+    p = sub.add_parser("printers", help="列出打印农场的打印机，给出名称时设置打印机列表")
+    p.add_argument("names", nargs="*")
+    p.set_defaults(func=cmd_printers)
+
+    p = sub.add_parser("farm-add", help="排产队列加入任务")
+    p.add_argument("model")
+    p.add_argument("count", type=int, help="盘数")
+    p.add_argument("minutes", type=float, help="每盘分钟数")
+    p.add_argument("-p", "--printers", nargs="+", default=[], help="只能使用这些打印机（默认不限）")
+    p.set_defaults(func=cmd_farm_add)
+
+    p = sub.add_parser("farm-import", help="从 CSV 加入排产任务，每行: 模型名称,盘数,每盘分钟[,打印机;打印机]")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_farm_import)
+
+    p = sub.add_parser("farm-jobs", help="列出排产队列（尚未开始的盘数）")
+    p.set_defaults(func=cmd_farm_jobs)
+
+    p = sub.add_parser("farm-remove", help="按 ID 删除排产任务（ID 见 farm-jobs 输出第一列）")
+    p.add_argument("id", type=int)
+    p.set_defaults(func=cmd_farm_remove)
+
+    p = sub.add_parser("schedule", help="打印农场排产计划：各打印机的盘、排不进的盘和全部完成时间")
+    p.add_argument("--limit", type=int, default=200)
+    p.set_defaults(func=cmd_schedule)
+
+    p = sub.add_parser("farm-start", help="空闲的打印机开始计划中的下一盘（扣除耗材并记录历史）")
+    p.set_defaults(func=cmd_farm_start)
+
+    p = sub.add_parser("farm-done", help="打印机上的一盘已完成")
+    p.add_argument("printer")
+    p.set_defaults(func=cmd_farm_done)
+
+    p = sub.add_parser("history", help="查看打印历史")
+    p.add_argument("--latest", type=int, default=20)
+    p.add_argument("--model")
+    p.add_argument("--filament")
+    p.add_argument("--since", help="起始时间（含），格式 YYYY-MM-DD[ HH:MM:SS]")
+    p.add_argument("--until", help="结束时间（不含）")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser("delete-history", help="按 ID 删除打印记录（ID 见 history 输出第一列）")
+    p.add_argument("id", type=int)
+    p.set_defaults(func=cmd_delete_history)
+
+    p = sub.add_parser("stats", help="用量统计：时间范围内各耗材/模型的用量、成本和打印次数")
+    p.add_argument("--by", choices=["filament", "model"], default="filament")
+    p.add_argument("--period", choices=["day", "week", "month"], default="month",
+                   help="按哪种汇总表统计（决定 --since/--until 的粒度）")
+    p.add_argument("--since", help="起始时间（所在的周期包含在内）")
+    p.add_argument("--until", help="结束时间（所在的周期包含在内）")
+    p.add_argument("--last", type=int, help="最近 N 个周期（含当前周期），代替 --since")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("forecast", help="库存预测：模型可打印盘数、耗材预计用完日期和预警")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_forecast)
+
+    p = sub.add_parser("search", help="按名称搜索耗材、模型和打印历史")
+    p.add_argument("query")
+    p.add_argument("--in", dest="targets", nargs="+", choices=["filaments", "models", "history"],
+                   default=["filaments", "models", "history"])
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_search)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    service = PrintService(open_storage(args.storage, args.db))
+    try:
+        status = args.func(service, args) or 0
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        status = 1
+    finally:
+        try:
+            service.close()
+        except OSError as e:  # 后台写入失败：修改没有落盘
+            print(f"错误: 保存失败: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
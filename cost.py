@@ -0,0 +1,141 @@
+import threading
+from collections import namedtuple
+from events import ChangeNotifier, UPDATED, REMOVED, RESET
+from instrument import timed
+
+# total: 每盘总成本；unit: 单个成本（总成本/数量）；weight: 已找到耗材的总重量
+# materials: [(耗材名称, 重量, 成本, 单个成本), ...]，只包含存在的耗材
+ModelCost = namedtuple("ModelCost", ["total", "unit", "weight", "materials"])
+
+
+def compute_cost(model, filament_manager) -> ModelCost:
+    """不带缓存地计算一个模型的成本"""
+    total_weight = 0
+    total_cost = 0
+    materials = []
+    for mat in model.materials:
+        filament = filament_manager.find_filament(mat.filament)
+        if filament:
+            material_cost = filament.price * mat.weight
+            total_weight += mat.weight
+            total_cost += material_cost
+            materials.append((mat.filament, mat.weight, material_cost,
+                              material_cost / model.quantity if model.quantity > 0 else 0))
+    unit = total_cost / model.quantity if model.quantity > 0 else 0
+    return ModelCost(total_cost, unit, total_weight, materials)
+
+
+class CostEngine(ChangeNotifier):
+    """按需计算并缓存模型成本，记录每个模型依赖的耗材
+
+    耗材单价（total_price / initial_amount）或名称变化时，只让引用它的模型失效；
+    仅剩余量变化不会影响成本。缓存失效的模型会以 UPDATED 事件广播出去。
+    界面在线程池中预先填充缓存，而失效发生在写线程上：缓存由锁保护，每次失效递增代数，
+    开始计算之后发生过失效或单价变化的结果只返回、不写入缓存，避免旧单价算出的成本留在缓存中。
+    """
+
+    def __init__(self, filament_manager, model_manager):
+        self.filament_manager = filament_manager
+        self.model_manager = model_manager
+        self._cache = {}  # id(model) -> ModelCost
+        self._deps = {}  # 耗材名称 -> {id(model): model}
+        self._model_deps = {}  # id(model) -> 依赖的耗材名称集合
+        self._prices = {}  # 耗材名称 -> 计算时使用的单价
+        self._lock = threading.RLock()
+        self._generation = 0  # 每次失效加一
+        filament_manager.subscribe(self.on_filament_changed)
+        model_manager.subscribe(self.on_model_changed)
+
+    @timed()
+    def cost(self, model) -> ModelCost:
+        with self._lock:
+            result = self._cache.get(id(model))
+            if result is not None:
+                return result
+            generation = self._generation
+        # 单价在计算前后各取一次，不同说明计算期间改过价；之后再改价时事件会发现单价不同而使缓存失效
+        prices = self._current_prices(model)
+        result = compute_cost(model, self.filament_manager)
+        with self._lock:
+            if self._generation == generation and self._current_prices(model) == prices:
+                self._cache[id(model)] = result
+                self._track(model, prices)
+        return result
+
+    def total_cost(self, model) -> float:
+        return self.cost(model).total
+
+    def unit_cost(self, model) -> float:
+        return self.cost(model).unit
+
+    def dependents(self, filament_name: str) -> list:
+        """引用了该耗材名称的模型"""
+        with self._lock:
+            return list(self._deps.get(filament_name, {}).values())
+
+    def _current_prices(self, model) -> dict:
+        prices = {}
+        for mat in model.materials:
+            filament = self.filament_manager.find_filament(mat.filament)
+            prices[mat.filament] = filament.price if filament else None
+        return prices
+
+    def _track(self, model, prices: dict):
+        self._untrack(model)
+        self._model_deps[id(model)] = set(prices)
+        for name, price in prices.items():
+            self._deps.setdefault(name, {})[id(model)] = model
+            self._prices[name] = price
+
+    def _untrack(self, model):
+        for name in self._model_deps.pop(id(model), ()):
+            bucket = self._deps.get(name)
+            if bucket is not None:
+                bucket.pop(id(model), None)
+                if not bucket:
+                    del self._deps[name]
+                    self._prices.pop(name, None)
+
+    def invalidate(self, model):
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(id(model), None)
+            self._untrack(model)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._deps.clear()
+            self._model_deps.clear()
+            self._prices.clear()
+
+    def _invalidate_filament(self, name):
+        with self._lock:
+            models = self.dependents(name)
+            for model in models:
+                self.invalidate(model)
+        for model in models:
+            self._emit(UPDATED, model.name, model)
+
+    def on_filament_changed(self, event):
+        if event.action == RESET:
+            self.clear()
+            self._emit(RESET)
+            return
+        if event.action == UPDATED and event.key == event.old_key:
+            # 只有单价变化才影响成本（剩余量变化不需要重算）
+            price = event.obj.price
+            with self._lock:
+                unchanged = self._prices.get(event.key, price) == price
+            if unchanged:
+                return
+        names = {event.key, event.old_key} - {None}
+        for name in names:
+            self._invalidate_filament(name)
+
+    def on_model_changed(self, event):
+        if event.action == RESET:
+            self.clear()
+        elif event.action in (UPDATED, REMOVED):
+            self.invalidate(event.obj)
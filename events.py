@@ -0,0 +1,29 @@
+from collections import namedtuple
+
+# 变更事件类型
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+RESET = "reset"  # 整体重新加载（load_data 之后）
+
+# key: 实体键（耗材/模型名称，历史记录为记录对象本身）
+# obj: 发生变化的实体对象；old_key: 改名前的键
+ChangeEvent = namedtuple("ChangeEvent", ["action", "key", "obj", "old_key"])
+
+
+class ChangeNotifier:
+    """为管理器提供订阅/广播变更事件的能力"""
+
+    def subscribe(self, callback):
+        """注册回调 callback(event: ChangeEvent)"""
+        self.__dict__.setdefault("_listeners", []).append(callback)
+
+    def unsubscribe(self, callback):
+        listeners = self.__dict__.get("_listeners", [])
+        if callback in listeners:
+            listeners.remove(callback)
+
+    def _emit(self, action, key=None, obj=None, old_key=None):
+        event = ChangeEvent(action, key, obj, old_key)
+        for callback in list(self.__dict__.get("_listeners", [])):
+            callback(event)
@@ -1,26 +1,69 @@
-import json
+from sys import intern
 from typing import List, Dict
+from events import ChangeNotifier, ADDED, UPDATED, REMOVED, RESET
+from storage import JsonStorage, FILAMENTS
+from instrument import timed
+from spool import Spool, SpoolPool, SPOOLS
 
 class Filament:
-    def __init__(self, name: str, category: str, total_price: float, initial_amount: int, remaining: int = None):
-        self.name = name
-        self.category = category
-        self.total_price = total_price
-        self.initial_amount = initial_amount
-        self.remaining = remaining if remaining is not None else initial_amount
+    __slots__ = ("id", "name", "category", "stock")
+
+    def __init__(self, name: str, category: str, total_price: float, initial_amount: int, remaining: int = None,
+                 filament_id: int = None, spools: List[Spool] = None):
+        """
+        :param spools: 各卷库存；不传时按 total_price/initial_amount/remaining 作为一卷
+        """
+        self.id = filament_id  # 稳定的唯一 ID，加入管理器时分配；模型和历史按 ID 引用耗材
+        self.name = intern(name)
+        self.category = intern(category)
+        self.stock = SpoolPool(spools or [Spool(total_price, initial_amount, remaining)])
+
+    # 总价/总量/剩余量是各卷的合计（增量维护）；只有一卷时可以直接修改
+    @property
+    def total_price(self) -> float:
+        return self.stock.total_price
+
+    @total_price.setter
+    def total_price(self, value: float):
+        self.stock.set_total("total_price", value)
+
+    @property
+    def initial_amount(self):
+        return self.stock.initial_amount
+
+    @initial_amount.setter
+    def initial_amount(self, value):
+        self.stock.set_total("initial_amount", value)
+
+    @property
+    def remaining(self):
+        return self.stock.remaining
+
+    @remaining.setter
+    def remaining(self, value):
+        self.stock.set_total("remaining", value)
 
     @property
     def price(self) -> float:
         return self.total_price / self.initial_amount if self.initial_amount > 0 else 0
 
+    @property
+    def spools(self) -> List[Spool]:
+        return self.stock.spools
+
     def to_dict(self) -> Dict:
-        return {
+        data = {
+            "id": self.id,
             "name": self.name,
             "category": self.category,
             "total_price": self.total_price,
             "initial_amount": self.initial_amount,
             "remaining": self.remaining
         }
+        # 只有一卷的耗材与旧格式相同
+        if len(self.spools) > 1 or self.spools[0].id is not None:
+            data["spools"] = [s.to_dict() for s in self.spools]
+        return data
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'Filament':
@@ -29,30 +72,225 @@ class Filament:
             category=data.get("category", "未分类"),
             total_price=data["total_price"],
             initial_amount=data["initial_amount"],
-            remaining=data.get("remaining", data["initial_amount"])
+            remaining=data.get("remaining", data["initial_amount"]),
+            filament_id=data.get("id"),
+            spools=[Spool.from_dict(s) for s in data.get("spools") or ()]
         )
 
-class FilamentManager:
-    def __init__(self, filename: str = "filaments.json"):
+class FilamentManager(ChangeNotifier):
+    def __init__(self, filename: str = "filaments.json", storage=None, autoload: bool = True):
         self.filaments = []
         self.filename = filename
-        self.load_data()
+        self.storage = storage or JsonStorage(filaments_file=filename)
+        self.storage.bind(FILAMENTS, lambda: [f.to_dict() for f in self.filaments])
+        self.storage.watch(FILAMENTS, self.sync)
+        self._by_name = {}  # 名称 -> 耗材
+        self._by_category = {}  # 种类 -> {名称: 耗材}
+        self._by_id = {}  # ID -> 耗材
+        self._next_id = 1
+        self._next_spool_id = 1
+        if autoload:
+            self.load_data()
+
+    def _index(self, filament: Filament):
+        self._by_id[filament.id] = filament
+        # 同名耗材只索引第一个，与原先线性查找的结果保持一致
+        if filament.name not in self._by_name:
+            self._by_name[filament.name] = filament
+            self._by_category.setdefault(filament.category, {})[filament.name] = filament
+
+    def _unindex(self, filament: Filament):
+        if self._by_name.get(filament.name) is not filament:
+            return
+        del self._by_name[filament.name]
+        bucket = self._by_category.get(filament.category)
+        if bucket is not None:
+            bucket.pop(filament.name, None)
+            if not bucket:
+                del self._by_category[filament.category]
+        # 若存在同名耗材，让下一个顶上
+        for other in self.filaments:
+            if other is not filament and other.name == filament.name:
+                self._index(other)
+                break
+
+    def _rebuild_index(self):
+        self._by_name = {}
+        self._by_category = {}
+        self._by_id = {}
+        for filament in self.filaments:
+            self._index(filament)
+        self._next_id = max(self._by_id, default=0) + 1
+        self._next_spool_id = max((s.id for f in self.filaments for s in f.spools if s.id is not None),
+                                  default=0) + 1
 
     def add_filament(self, filament: Filament):
+        if filament.id is None or filament.id in self._by_id:
+            # 共享存储由所有进程统一分配，避免不同进程新建的耗材 ID 相同
+            filament.id = self.storage.allocate_id(FILAMENTS, self._next_id)
+        self._next_id = max(self._next_id, filament.id + 1)
         self.filaments.append(filament)
-        self.save_data()
+        self._index(filament)
+        self.storage.put(FILAMENTS, filament.name, filament.to_dict())
+        self._emit(ADDED, filament.name, filament)
 
+    @timed()
     def find_filament(self, name: str) -> Filament:
-        return next((f for f in self.filaments if f.name == name), None)
+        return self._by_name.get(name)
+
+    def find_by_id(self, filament_id: int) -> Filament:
+        return self._by_id.get(filament_id)
 
+    @timed()
+    def find_by_category(self, category: str) -> List[Filament]:
+        return list(self._by_category.get(category, {}).values())
+
+    def update_filament(self, filament: Filament, **changes):
+        """修改耗材属性并只保存这一条记录，名称或种类变化时同步更新索引
+
+        总价/总量/剩余量只能在只有一卷时直接修改（多卷请用 update_spool），否则抛出 ValueError
+        """
+        if len(filament.spools) > 1 and any(
+                field in changes and changes[field] != getattr(filament, field)
+                for field in ("total_price", "initial_amount", "remaining")):
+            raise ValueError(f"耗材 {filament.name} 有多卷，请在卷管理中修改各卷的价格和剩余量")
+        old_name = filament.name
+        reindex = ("name" in changes and changes["name"] != filament.name) or \
+                  ("category" in changes and changes["category"] != filament.category)
+        if reindex:
+            self._unindex(filament)
+        for field, value in changes.items():
+            setattr(filament, field, value)
+        if reindex:
+            self._index(filament)
+        self.storage.put(FILAMENTS, filament.name, filament.to_dict(), old_key=old_name)
+        self._emit(UPDATED, filament.name, filament, old_key=old_name)
+
+    # ------------------ 多卷库存 ------------------
+    def _save_stock(self, filament: Filament):
+        self.storage.put(FILAMENTS, filament.name, filament.to_dict(), old_key=filament.name)
+        self._emit(UPDATED, filament.name, filament, old_key=filament.name)
+
+    def _spool_id(self) -> int:
+        spool_id = self.storage.allocate_id(SPOOLS, self._next_spool_id)
+        self._next_spool_id = max(self._next_spool_id, spool_id + 1)
+        return spool_id
+
+    def consume(self, filament: Filament, grams: float) -> list:
+        """按扣料策略从各卷扣除 grams 克，返回 [(卷, 克), ...]；剩余量不足时抛出 ValueError 且不做修改"""
+        allocations = filament.stock.allocate(grams)
+        self._save_stock(filament)
+        return allocations
+
+    def add_spool(self, filament: Filament, spool: Spool):
+        """入库一卷；原来没有 ID 的单卷同时补发 ID"""
+        for existing in filament.spools:
+            if existing.id is None:
+                existing.id = self._spool_id()
+        if spool.id is None:
+            spool.id = self._spool_id()
+        filament.stock.add(spool)
+        self._save_stock(filament)
+
+    def update_spool(self, filament: Filament, spool: Spool, **changes):
+        filament.stock.update(spool, **changes)
+        self._save_stock(filament)
+
+    def remove_spool(self, filament: Filament, spool: Spool):
+        filament.stock.remove(spool)
+        self._save_stock(filament)
+
+    def delete_filament(self, name: str):
+        removed = [f for f in self.filaments if f.name == name]
+        if not removed:
+            return
+        self.filaments = [f for f in self.filaments if f.name != name]
+        self._by_name.pop(name, None)
+        for filament in removed:
+            self._by_id.pop(filament.id, None)
+            bucket = self._by_category.get(filament.category)
+            if bucket is not None and bucket.get(name) is filament:
+                del bucket[name]
+                if not bucket:
+                    del self._by_category[filament.category]
+        self.storage.delete(FILAMENTS, name)
+        for filament in removed:
+            self._emit(REMOVED, name, filament)
+
+    @timed()
     def save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump([filament.to_dict() for filament in self.filaments], f)
+        self.storage.save_all(FILAMENTS)
+
+    @timed()
+    def read_data(self) -> List[Filament]:
+        """读取并解析全部耗材，不修改管理器状态（可在后台线程调用）"""
+        columns = self.storage.load_columns(FILAMENTS)
+        if columns is not None:
+            with columns:  # 二进制快照：整列读取，不逐条解析
+                filaments = [Filament(n, c, p, a, r, i) for i, n, c, p, a, r in zip(
+                    columns.ids("id"), columns.texts("name"), columns.texts("category"),
+                    columns.column("total_price"), columns.column("initial_amount"), columns.column("remaining"))]
+                for filament, spools in zip(filaments, columns.spools() or ()):
+                    if spools:
+                        filament.stock = SpoolPool(spools)
+                return filaments
+        return [Filament.from_dict(item) for item in self.storage.load(FILAMENTS)]
+
+    @timed()
+    def install(self, filaments: List[Filament]):
+        """用 read_data 的结果替换当前数据并广播 RESET
 
+        旧数据没有 ID 时按文件顺序补发 ID 并立即写回
+        """
+        self.filaments = filaments
+        ids = [f.id for f in filaments if f.id is not None]
+        next_id = max(ids, default=0) + 1
+        missing = len(set(ids)) < len(filaments)
+        if missing:
+            seen = set()
+            for filament in filaments:
+                if filament.id is None or filament.id in seen:
+                    filament.id = next_id
+                    next_id += 1
+                seen.add(filament.id)
+        self._rebuild_index()
+        if missing:
+            self.storage.save_all(FILAMENTS)
+        self._emit(RESET)
+
+    @timed()
     def load_data(self):
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-                self.filaments = [Filament.from_dict(item) for item in data]
-        except FileNotFoundError:
-            self.filaments = []
+        self.install(self.read_data())
+
+    @timed()
+    def sync(self, records: List[Dict]):
+        """采用其他进程保存的耗材列表（由共享存储回调，不写回存储）
+
+        按 ID 原地更新已有的耗材对象（其他进程改名后仍是同一个对象，模型的引用和成本缓存不失效），
+        没有 ID 的旧数据按名称对应；只为实际变化的耗材广播事件，改名的 UPDATED 事件带 old_key
+        """
+        by_id = {f.id: f for f in self.filaments if f.id is not None}
+        by_name = {}
+        for f in self.filaments:
+            by_name.setdefault(f.name, f)
+        unmatched = {id(f): f for f in self.filaments}
+        filaments, events = [], []
+        for data in records:
+            incoming = Filament.from_dict(data)
+            filament = by_id.get(incoming.id) if incoming.id is not None else by_name.get(incoming.name)
+            if filament is None or unmatched.pop(id(filament), None) is None:
+                filaments.append(incoming)
+                events.append((ADDED, incoming, None))
+                continue
+            filaments.append(filament)
+            if filament.to_dict() != incoming.to_dict():
+                old_name = filament.name
+                for field in Filament.__slots__:
+                    setattr(filament, field, getattr(incoming, field))
+                events.append((UPDATED, filament, old_name))
+        self.filaments = filaments
+        self._rebuild_index()
+        for filament in unmatched.values():
+            self._emit(REMOVED, filament.name, filament)
+        for action, filament, old_name in events:
+            self._emit(action, filament.name, filament, old_key=old_name)
@@ -0,0 +1,189 @@
+"""库存预测：每个模型用现有库存还能打印几盘，每种耗材按近期消耗速度预计何时用完
+
+两部分都按需计算并缓存，随管理器的变更事件增量更新：
+- 耗材剩余量变化只重算引用它的模型的可打印盘数；
+- 新增/删除打印记录只重算该记录用到的耗材的消耗速度（读取按天汇总的用量表）。
+结果变化时以 UPDATED 事件广播，key 为 ("model", 名称) 或 ("filament", 名称)。
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from events import ChangeNotifier, ADDED, UPDATED, REMOVED, RESET
+from rollup import bucket_keys
+from timeutil import to_seconds
+
+WINDOW_DAYS = 30  # 按最近多少天的用量估算消耗速度
+LOW_PRINTS = 3  # 可打印盘数低于此值时提示
+LOW_DAYS = 14  # 预计用完天数低于此值时提示
+
+# prints: 还能打印的盘数；limiting: 最先用完的耗材（None 表示模型没有耗材）
+ModelCapacity = namedtuple("ModelCapacity", ["prints", "limiting"])
+# rate: 近期平均用量（克/天）；days_left / depletion: 预计还能用的天数和用完日期（没有消耗时为 None）
+FilamentOutlook = namedtuple("FilamentOutlook", ["remaining", "rate", "days_left", "depletion"])
+
+
+def compute_capacity(model, filament_manager) -> ModelCapacity:
+    """不带缓存地计算一个模型还能打印的盘数：各耗材 剩余量 / 每盘用量 的最小值"""
+    required = {}
+    for mat in model.materials:
+        required[mat.filament] = required.get(mat.filament, 0) + mat.weight
+    prints, limiting = None, None
+    for name, grams in required.items():
+        if grams <= 0:
+            continue
+        filament = filament_manager.find_filament(name)
+        count = int((filament.remaining + 1e-9) // grams) if filament else 0
+        if prints is None or count < prints:
+            prints, limiting = count, name
+    return ModelCapacity(prints or 0, limiting)
+
+
+class Forecast(ChangeNotifier):
+    def __init__(self, filament_manager, model_manager, history_manager, window_days: int = WINDOW_DAYS):
+        self.filament_manager = filament_manager
+        self.model_manager = model_manager
+        self.history_manager = history_manager
+        self.window_days = window_days
+        self._capacity = {}  # id(model) -> ModelCapacity
+        self._deps = {}  # 耗材名称 -> {id(model): model}
+        self._model_deps = {}  # id(model) -> 依赖的耗材名称集合
+        self._rates = {}  # 耗材名称 -> 克/天
+        self._window = (None, ())  # (今天的天数, 窗口内的日桶键)
+        filament_manager.subscribe(self.on_filament_changed)
+        model_manager.subscribe(self.on_model_changed)
+        history_manager.subscribe(self.on_history_changed)
+
+    # ------------------ 可打印盘数 ------------------
+    def capacity(self, model) -> ModelCapacity:
+        result = self._capacity.get(id(model))
+        if result is None:
+            result = compute_capacity(model, self.filament_manager)
+            self._capacity[id(model)] = result
+            self._track(model)
+        return result
+
+    def _track(self, model):
+        self._untrack(model)
+        names = {mat.filament for mat in model.materials}
+        self._model_deps[id(model)] = names
+        for name in names:
+            self._deps.setdefault(name, {})[id(model)] = model
+
+    def _untrack(self, model):
+        for name in self._model_deps.pop(id(model), ()):
+            bucket = self._deps.get(name)
+            if bucket is not None:
+                bucket.pop(id(model), None)
+                if not bucket:
+                    del self._deps[name]
+
+    def _recompute_capacity(self, model):
+        """已缓存的模型重算，结果变化时广播；未缓存的等到用到时再算"""
+        old = self._capacity.get(id(model))
+        if old is None:
+            return
+        new = compute_capacity(model, self.filament_manager)
+        self._capacity[id(model)] = new
+        if new != old:
+            self._emit(UPDATED, ("model", model.name), model)
+
+    # ------------------ 消耗速度与用完日期 ------------------
+    def _window_keys(self) -> tuple:
+        """最近 window_days 天的日桶键；日期变化后旧的速度全部作废"""
+        today = to_seconds(datetime.now()) // 86400
+        if self._window[0] != today:
+            keys = tuple(bucket_keys((today - i) * 86400)[0] for i in range(self.window_days))
+            self._window = (today, keys)
+            self._rates.clear()
+        return self._window[1]
+
+    def _compute_rate(self, name: str) -> float:
+        buckets = self.history_manager.rollups.tables["day"]["filament"].get(name, {})
+        grams = 0
+        for key in self._window_keys():
+            row = buckets.get(key)
+            if row is not None:
+                grams += row[0]
+        return grams / self.window_days
+
+    def rate(self, name: str) -> float:
+        """近期平均用量（克/天）"""
+        self._window_keys()
+        result = self._rates.get(name)
+        if result is None:
+            result = self._rates[name] = self._compute_rate(name)
+        return result
+
+    def outlook(self, filament) -> FilamentOutlook:
+        rate = self.rate(filament.name)
+        if rate <= 0:
+            return FilamentOutlook(filament.remaining, rate, None, None)
+        days_left = filament.remaining / rate
+        return FilamentOutlook(filament.remaining, rate, days_left, datetime.now() + timedelta(days=days_left))
+
+    # ------------------ 预警 ------------------
+    @staticmethod
+    def is_low_capacity(capacity: ModelCapacity) -> bool:
+        return capacity.limiting is not None and capacity.prints < LOW_PRINTS
+
+    @staticmethod
+    def is_running_out(outlook: FilamentOutlook) -> bool:
+        return outlook.days_left is not None and outlook.days_left < LOW_DAYS
+
+    def warnings(self) -> list:
+        """库存预警文字：可打印盘数不足的模型、即将用完的耗材"""
+        messages = []
+        for f in self.filament_manager.filaments:
+            outlook = self.outlook(f)
+            if self.is_running_out(outlook):
+                messages.append(f"耗材 {f.name} 预计 {outlook.days_left:.1f} 天后用完"
+                                f"（{outlook.depletion:%Y-%m-%d}，近期每天 {outlook.rate:.1f}g）")
+        for m in self.model_manager.models:
+            capacity = self.capacity(m)
+            if self.is_low_capacity(capacity):
+                messages.append(f"模型 {m.name} 只能再打印 {capacity.prints} 盘（受限于 {capacity.limiting}）")
+        return messages
+
+    def _clear_capacity(self):
+        self._capacity.clear()
+        self._deps.clear()
+        self._model_deps.clear()
+
+    def clear(self):
+        self._clear_capacity()
+        self._rates.clear()
+
+    # ------------------ 事件 ------------------
+    def on_filament_changed(self, event):
+        if event.action == RESET:
+            self._clear_capacity()
+            self._emit(RESET)
+            return
+        for name in {event.key, event.old_key} - {None}:
+            for model in list(self._deps.get(name, {}).values()):
+                self._recompute_capacity(model)
+        self._emit(event.action, ("filament", event.key), event.obj)  # 剩余量变化即用完日期变化
+
+    def on_model_changed(self, event):
+        if event.action == RESET:
+            self._clear_capacity()
+            self._emit(RESET)
+            return
+        model = event.obj
+        self._capacity.pop(id(model), None)
+        self._untrack(model)
+        self._emit(event.action, ("model", model.name), model)
+
+    def on_history_changed(self, event):
+        if event.action == RESET:
+            self._rates.clear()
+            self._emit(RESET)
+            return
+        if event.action not in (ADDED, REMOVED):
+            return
+        for name in {mat.filament for mat in event.obj.used_materials}:
+            old = self._rates.pop(name, None)
+            if old is None:
+                continue
+            filament = self.filament_manager.find_filament(name)
+            if filament is not None and self.rate(name) != old:
+                self._emit(UPDATED, ("filament", name), filament)
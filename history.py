@@ -0,0 +1,453 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from sys import intern
+from storage import JsonStorage, HISTORY
+from events import ChangeNotifier, ADDED, UPDATED, REMOVED, RESET
+from material import pack_materials, unpack_materials, link_materials
+from spool import pack_uses, unpack_uses
+from timeutil import TIME_FORMAT, to_seconds, from_seconds, parse_time, as_seconds
+from rollup import Rollups
+from instrument import timed
+
+def _order(entry) -> tuple:
+    """历史记录的排序键：时间相同的按 ID（即加入顺序）"""
+    return entry.ts, entry.id
+
+
+def _ts(entry) -> int:
+    return entry.ts
+
+
+class PrintHistoryEntry:
+    __slots__ = ("id", "model_name", "_used_materials", "ts", "spools")
+
+    def __init__(self, model_name, used_materials, timestamp, entry_id: int = None, spools=()):
+        self.id = entry_id  # 稳定的唯一 ID，加入管理器时分配
+        self.model_name = intern(model_name)
+        self.used_materials = used_materials  # 耗材名称和用量（Material 元组）
+        # 时间保存为整数秒，timestamp 属性按需转换为 datetime
+        self.ts = timestamp if isinstance(timestamp, int) else to_seconds(timestamp)
+        self.spools = pack_uses(spools)  # 实际扣料的卷及成本（SpoolUse 元组），旧记录为空
+
+    def cost_by_filament(self) -> dict:
+        """耗材 ID -> 按实际扣料的卷计算的成本（旧记录没有分卷成本时为空）"""
+        costs = {}
+        for use in self.spools:
+            costs[use.filament_id] = costs.get(use.filament_id, 0) + use.cost
+        return costs
+
+    @property
+    def used_materials(self) -> tuple:
+        return self._used_materials
+
+    @used_materials.setter
+    def used_materials(self, value):
+        self._used_materials = pack_materials(value)
+
+    @property
+    def timestamp(self) -> datetime:
+        return from_seconds(self.ts)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime):
+        self.ts = to_seconds(value)
+
+    def time_str(self) -> str:
+        return self.timestamp.strftime(TIME_FORMAT)
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "model_name": self.model_name,
+            "used_materials": unpack_materials(self.used_materials),
+            "timestamp": self.time_str()
+        }
+        if self.spools:
+            data["spools"] = unpack_uses(self.spools)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["model_name"],
+            data["used_materials"],
+            parse_time(data["timestamp"]),
+            data.get("id"),
+            data.get("spools", ())
+        )
+
+class HistoryCursor:
+    """按时间倒序（从最新记录往前）分页读取打印历史的游标
+
+    offset 记录已经取出的条数；新记录加入或已取出的记录被删除时，
+    由调用方通过 shift() 修正，保证下一页从正确的位置继续。
+    """
+
+    def __init__(self, manager: 'PrintHistoryManager', page_size: int = 100):
+        self.manager = manager
+        self.page_size = page_size
+        self.offset = 0
+
+    def has_more(self) -> bool:
+        return self.offset < len(self.manager.history)
+
+    def next_page(self) -> list:
+        page = self.manager.page(self.offset, self.page_size)
+        self.offset += len(page)
+        return page
+
+    def shift(self, delta: int):
+        self.offset = max(0, self.offset + delta)
+
+class PrintHistoryManager(ChangeNotifier):
+    """打印历史：history 按 (时间, ID) 有序，另有按 ID、模型、耗材的索引
+
+    时间范围、最新 n 条、按模型/耗材的查询都用二分查找定位；删除按 ID 查找，
+    不需要遍历或格式化整个列表。rollups 是按日/周/月汇总的用量表（见 rollup.py），
+    price_fn(耗材名称) 提供计算成本用的单价。
+    """
+
+    def __init__(self, filename: str = "print_history.json", storage=None, compact_threshold: int = 1000,
+                 autoload: bool = True, price_fn=None, filament_manager=None):
+        self.filename = filename
+        self.storage = storage or JsonStorage(history_file=filename, compact_threshold=compact_threshold)
+        self.storage.bind(HISTORY, lambda: [entry.to_dict() for entry in self.history])
+        self.storage.watch(HISTORY, self.sync)
+        self.history = []
+        self._by_id = {}
+        self._by_model = {}     # 模型名称 -> 有序记录列表
+        self._by_filament = {}  # 耗材名称 -> 有序记录列表
+        self._next_id = 1
+        self._filament_names = {}  # 耗材 ID -> 记录中使用的名称，用于发现改名
+        self.rollups = Rollups(price_fn)
+        # 传入耗材管理器时记录按耗材 ID 关联，耗材改名后同步更新记录中的名称
+        self.filament_manager = filament_manager
+        if filament_manager is not None:
+            filament_manager.subscribe(self.on_filament_changed)
+        if autoload:
+            self.load_data()
+
+    # ------------------ 索引 ------------------
+    def _index(self, entry):
+        self._by_id[entry.id] = entry
+        _insert_sorted(self._by_model.setdefault(entry.model_name, []), entry)
+        for name in {mat.filament for mat in entry.used_materials}:
+            _insert_sorted(self._by_filament.setdefault(name, []), entry)
+        for mat in entry.used_materials:
+            if mat.filament_id is not None:
+                self._filament_names[mat.filament_id] = mat.filament
+
+    def _unindex(self, entry):
+        del self._by_id[entry.id]
+        _remove_sorted(self._by_model, entry.model_name, entry)
+        for name in {mat.filament for mat in entry.used_materials}:
+            _remove_sorted(self._by_filament, name, entry)
+
+    def _rebuild_index(self):
+        self.history.sort(key=_order)
+        self._by_id, self._by_model, self._by_filament = {}, {}, {}
+        self._filament_names = {}
+        materials = set()
+        for entry in self.history:  # 已按时间排序，索引列表直接追加即有序
+            self._by_id[entry.id] = entry
+            self._by_model.setdefault(entry.model_name, []).append(entry)
+            for name in {mat.filament for mat in entry.used_materials}:
+                self._by_filament.setdefault(name, []).append(entry)
+            materials.add(entry.used_materials)  # 同一模型的记录共享耗材元组，只需看一次
+        for used in materials:
+            for mat in used:
+                if mat.filament_id is not None:
+                    self._filament_names[mat.filament_id] = mat.filament
+
+    def _entries(self, model_name: str = None, filament: str = None) -> list:
+        """按条件选出要查询的有序列表（同时指定时取较短的，再逐条过滤另一个条件）"""
+        if model_name is not None and filament is not None:
+            by_model = self._by_model.get(model_name, [])
+            by_filament = self._by_filament.get(filament, [])
+            if len(by_model) <= len(by_filament):
+                return [e for e in by_model if any(m.filament == filament for m in e.used_materials)]
+            return [e for e in by_filament if e.model_name == model_name]
+        if model_name is not None:
+            return self._by_model.get(model_name, [])
+        if filament is not None:
+            return self._by_filament.get(filament, [])
+        return self.history
+
+    # ------------------ 增删 ------------------
+    @timed()
+    def add_entry(self, entry: PrintHistoryEntry):
+        if entry.id is None or entry.id in self._by_id:
+            # 共享存储由所有进程统一分配，避免不同进程的新记录 ID 相同
+            entry.id = self.storage.allocate_id(HISTORY, self._next_id)
+        self._insert(entry)
+        self.storage.append(HISTORY, entry.to_dict())
+        self._emit(ADDED, entry, entry)
+
+    def _insert(self, entry):
+        self._next_id = max(self._next_id, entry.id + 1)
+        _insert_sorted(self.history, entry)
+        self._index(entry)
+        self.rollups.add(entry)
+
+    def _discard(self, entry):
+        _remove_sorted_list(self.history, entry)
+        self._unindex(entry)
+        self.rollups.remove(entry)
+
+    def get(self, entry_id: int):
+        return self._by_id.get(entry_id)
+
+    @timed()
+    def delete_entry(self, entry_id: int) -> bool:
+        """按 ID 删除一条记录，返回是否存在"""
+        entry = self._by_id.get(entry_id)
+        if entry is None:
+            return False
+        self._discard(entry)
+        self.storage.delete(HISTORY, entry.id)
+        self._emit(REMOVED, entry, entry)
+        return True
+
+    # ------------------ 查询 ------------------
+    def between(self, start=None, end=None, model_name: str = None, filament: str = None) -> list:
+        """时间在 [start, end) 内的记录（按时间正序）；start/end 可为 datetime、时间字符串或整数秒"""
+        entries = self._entries(model_name, filament)
+        lo = 0 if start is None else bisect_left(entries, as_seconds(start), key=_ts)
+        hi = len(entries) if end is None else bisect_left(entries, as_seconds(end), key=_ts)
+        return entries[lo:hi]
+
+    def latest(self, n: int, model_name: str = None, filament: str = None) -> list:
+        """最新的 n 条记录（最新的在前）"""
+        entries = self._entries(model_name, filament)
+        return entries[max(0, len(entries) - n):][::-1] if n > 0 else []
+
+    def for_model(self, model_name: str) -> list:
+        return list(self._by_model.get(model_name, []))
+
+    def for_filament(self, filament: str) -> list:
+        return list(self._by_filament.get(filament, []))
+
+    def page(self, offset: int, limit: int) -> list:
+        """按时间倒序返回第 offset 条起的 limit 条记录（只切片，不遍历全部历史）"""
+        end = len(self.history) - offset
+        if end <= 0:
+            return []
+        return self.history[max(0, end - limit):end][::-1]
+
+    def cursor(self, page_size: int = 100) -> HistoryCursor:
+        return HistoryCursor(self, page_size)
+
+    # ------------------ 读写 ------------------
+    @timed()
+    def compact(self):
+        """把日志合并进快照（仅 JSON 存储需要），同时保存用量汇总表"""
+        self.storage.compact()
+        self.save_rollups()
+
+    @timed()
+    def save_data(self):
+        self.storage.save_all(HISTORY)
+        self.save_rollups()
+
+    @timed()
+    def save_rollups(self):
+        if self.history or self.rollups.entries:  # 尚未加载时不覆盖已保存的汇总表
+            self.storage.save_document("rollups", self.rollups.to_dict())
+
+    def rebuild_rollups(self):
+        """丢弃汇总表，从全部历史重新汇总（成本按当前单价）并保存"""
+        self.rollups.rebuild(self.history)
+        self.save_rollups()
+
+    def _load_rollups(self):
+        """读取保存的汇总表；与当前历史不一致（如异常退出未保存）时重新汇总"""
+        data = self.storage.load_document("rollups")
+        if data is not None:
+            try:
+                self.rollups.load(data)
+                if self.rollups.matches(self.history):
+                    return
+            except (KeyError, TypeError, AttributeError):
+                pass
+        self.rebuild_rollups()
+
+    @timed()
+    def read_data(self) -> list:
+        """读取并解析全部历史，不修改管理器状态（可在后台线程调用）"""
+        columns = self.storage.load_columns(HISTORY)
+        if columns is not None:
+            with columns:
+                return _read_columns(columns)
+        return [PrintHistoryEntry.from_dict(item) for item in self.storage.load(HISTORY)]
+
+    @timed()
+    def install(self, history: list):
+        """用 read_data 的结果替换当前数据并广播 RESET
+
+        旧数据没有 ID 时按文件顺序补发 ID 并立即写回，之后的删除都按 ID 进行；
+        耗材已加载时按耗材 ID 关联记录中的耗材，按名称引用的旧记录补上耗材 ID 后同样写回
+        """
+        self.history = history
+        linked = self._link_entries(history)
+        ids = [entry.id for entry in history if entry.id is not None]
+        self._next_id = max(ids, default=0) + 1
+        missing = len(ids) < len(history)
+        if missing:
+            for entry in history:
+                if entry.id is None:
+                    entry.id = self._next_id
+                    self._next_id += 1
+        self._rebuild_index()
+        if missing or linked:
+            self.storage.save_all(HISTORY)
+        self._load_rollups()
+        self._emit(RESET)
+
+    def _link_entries(self, entries) -> bool:
+        """按耗材 ID 刷新记录中的耗材名称，旧记录按名称补上耗材 ID；返回是否有变化"""
+        if self.filament_manager is None:
+            return False
+        linked = {}  # 原耗材元组 -> 关联后的元组（同一模型的记录共享元组，只关联一次）
+        changed = False
+        for entry in entries:
+            used = entry.used_materials
+            result = linked.get(used)
+            if result is None:
+                result = linked[used] = link_materials(used, self.filament_manager)
+            if result is not used:
+                entry._used_materials = result
+                changed = True
+        return changed
+
+    def on_filament_changed(self, event):
+        """耗材改名时只更新引用它的记录（按名称索引定位），不扫描全部历史"""
+        if event.action == RESET:
+            if self.history and self._link_entries(self.history):
+                self._rebuild_index()
+                self.rebuild_rollups()
+                self._emit(RESET)
+            return
+        if event.action not in (ADDED, UPDATED):
+            return  # 删除耗材不影响历史记录
+        filament = event.obj
+        old = self._filament_names.get(filament.id)
+        if old is None or old == filament.name:
+            return
+        self._rename_filament(filament.id, old, filament.name)
+
+    def _rename_filament(self, filament_id: int, old: str, new: str):
+        entries = self._by_filament.get(old, [])
+        moved = [e for e in entries if any(mat.filament_id == filament_id for mat in e.used_materials)]
+        renamed = {}  # 原耗材元组 -> 改名后的元组
+        for entry in moved:
+            used = entry.used_materials
+            result = renamed.get(used)
+            if result is None:
+                result = renamed[used] = tuple(
+                    mat._replace(filament=new) if mat.filament_id == filament_id else mat for mat in used)
+            entry._used_materials = result
+        self._filament_names[filament_id] = new
+        if len(moved) == len(entries):
+            self._by_filament.pop(old, None)
+            self.rollups.rename("filament", old, new)
+        else:
+            # 还有同名但属于其他（已删除）耗材的记录：索引拆分，汇总表重新计算
+            moved_ids = {id(e) for e in moved}
+            self._by_filament[old] = [e for e in entries if id(e) not in moved_ids]
+            self.rollups.rebuild(self.history)
+        if moved:
+            merged = self._by_filament.get(new, []) + moved
+            merged.sort(key=_order)
+            self._by_filament[new] = merged
+        for entry in moved:
+            self._emit(UPDATED, entry, entry)
+
+    @timed()
+    def load_data(self):
+        self.install(self.read_data())
+
+    @timed()
+    def sync(self, records: list = None, ops: list = None):
+        """采用其他进程写入的打印历史（由共享存储回调，不写回存储）
+
+        ops 为其他进程新追加的日志操作 [("add", 记录) / ("delete", ID)]，逐条应用并广播；
+        其他进程压缩过日志时改为传入完整的 records，整体重新安装
+        """
+        if records is not None:
+            self.install([PrintHistoryEntry.from_dict(item) for item in records])
+            return
+        for kind, payload in ops:
+            if kind == "add":
+                entry = PrintHistoryEntry.from_dict(payload)
+                if entry.id is None or entry.id in self._by_id:
+                    continue
+                self._insert(entry)
+                self._emit(ADDED, entry, entry)
+            elif kind == "delete" and isinstance(payload, int):
+                entry = self._by_id.get(payload)
+                if entry is not None:
+                    self._discard(entry)
+                    self._emit(REMOVED, entry, entry)
+
+
+def _read_columns(columns) -> list:
+    """从二进制快照构建历史记录：时间已是整数秒，不解析时间字符串；
+    同一耗材用量组合的记录共用一个 Material 元组。之后重放快照之后的日志操作。
+    """
+    history = []
+    new = PrintHistoryEntry.__new__
+    sets = columns.material_sets()
+    for entry_id, ts, name, m in zip(columns.ids("id"), columns.column("ts"), columns.texts("model"),
+                                     columns.column("materials")):
+        entry = new(PrintHistoryEntry)
+        entry.id = entry_id
+        entry.model_name = name
+        entry._used_materials = sets[m]
+        entry.ts = ts
+        entry.spools = ()
+        history.append(entry)
+    for entry, uses in zip(history, columns.spool_uses() or ()):
+        entry.spools = uses
+
+    # 墓碑只删除它之前加入的记录：键 -> 删除时的记录数
+    deleted = {}
+    for op in columns.journal:
+        if op.get("op") == "add":
+            history.append(PrintHistoryEntry.from_dict(op["data"]))
+        elif op.get("op") == "delete":
+            key = op["key"]
+            deleted[tuple(key) if isinstance(key, list) else key] = len(history)
+    if not deleted:
+        return history
+    legacy = any(isinstance(key, tuple) for key in deleted)
+    kept = []
+    for i, entry in enumerate(history):
+        if i < deleted.get(entry.id, 0):
+            continue
+        if legacy and i < deleted.get((entry.model_name, entry.time_str()), 0):
+            continue
+        kept.append(entry)
+    return kept
+
+
+def _insert_sorted(entries: list, entry):
+    """按时间插入；新记录通常最新，直接追加"""
+    if not entries or _order(entries[-1]) <= _order(entry):
+        entries.append(entry)
+    else:
+        insort(entries, entry, key=_order)
+
+
+def _remove_sorted_list(entries: list, entry):
+    i = bisect_left(entries, _order(entry), key=_order)
+    if i < len(entries) and entries[i] is entry:
+        del entries[i]
+    else:
+        entries.remove(entry)  # 不应发生：索引与列表不一致时退回线性删除
+
+
+def _remove_sorted(index: dict, key, entry):
+    entries = index[key]
+    _remove_sorted_list(entries, entry)
+    if not entries:
+        del index[key]
@@ -0,0 +1,138 @@
+"""性能埋点：热点函数的调用次数、累计耗时、p50/p99 延迟和写入字节数
+
+设置环境变量 PRINTING_PROFILE=1 启用（PRINTING_PROFILE=cprofile 时同时在主线程运行 cProfile）。
+未启用时 timed 直接返回原函数、add_bytes 立即返回，几乎没有额外开销。
+PRINTING_PROFILE_OUTPUT=路径 时在退出时导出 JSON（启用 cProfile 时另存 路径.prof）。
+
+图形界面在启用时提供“性能统计”窗口（F12），也可调用 export_json / dump_profile 导出。
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+MODE = os.environ.get("PRINTING_PROFILE", "").strip().lower()
+ENABLED = MODE not in ("", "0", "false", "off")
+MAX_SAMPLES = 10000  # 每项只保留最近的耗时样本用于计算分位数
+
+
+class Stat:
+    __slots__ = ("count", "total", "bytes", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.bytes = 0
+        self.samples = deque(maxlen=MAX_SAMPLES)
+
+
+_stats = {}  # 名称 -> Stat
+_lock = threading.Lock()
+_profiler = None
+
+
+def _stat(name: str) -> Stat:
+    stat = _stats.get(name)
+    if stat is None:
+        stat = _stats[name] = Stat()
+    return stat
+
+
+def record(name: str, seconds: float):
+    with _lock:
+        stat = _stat(name)
+        stat.count += 1
+        stat.total += seconds
+        stat.samples.append(seconds)
+
+
+def timed(name: str = None):
+    """装饰器：统计函数的调用次数和耗时，name 默认为函数的限定名"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def add_bytes(name: str, size: int):
+    """记录写入的字节数（调用方传入已编码的长度）"""
+    if not ENABLED:
+        return
+    with _lock:
+        _stat(name).bytes += size
+
+
+def _percentile(ordered: list, q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def snapshot() -> list:
+    """当前统计 [{name, count, total, mean, p50, p99, bytes}, ...]，按累计耗时降序；时间单位为秒"""
+    with _lock:
+        items = [(name, stat.count, stat.total, stat.bytes, sorted(stat.samples))
+                 for name, stat in _stats.items()]
+    rows = []
+    for name, count, total, size, ordered in items:
+        rows.append({
+            "name": name,
+            "count": count,
+            "total": total,
+            "mean": total / count if count else 0.0,
+            "p50": _percentile(ordered, 0.50),
+            "p99": _percentile(ordered, 0.99),
+            "bytes": size,
+        })
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def export_json(path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"stats": snapshot()}, f, ensure_ascii=False, indent=2)
+
+
+def profiling() -> bool:
+    return _profiler is not None
+
+
+def dump_profile(path: str):
+    """保存 cProfile 结果（可用 pstats / snakeviz 查看）；需以 PRINTING_PROFILE=cprofile 启动"""
+    if _profiler is None:
+        raise RuntimeError("未启用 cProfile（请以 PRINTING_PROFILE=cprofile 启动）")
+    _profiler.dump_stats(path)  # 导出时会暂停采样，之后继续
+    _profiler.enable()
+
+
+def _export_on_exit(path: str):
+    export_json(path)
+    if _profiler is not None:
+        _profiler.dump_stats(path + ".prof")
+
+
+if ENABLED:
+    if MODE == "cprofile":
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if os.environ.get("PRINTING_PROFILE_OUTPUT"):
+        atexit.register(_export_on_exit, os.environ["PRINTING_PROFILE_OUTPUT"])
@@ -0,0 +1,142 @@
+import json
+import os
+from typing import Callable, Dict, List
+import instrument
+from instrument import timed
+from writebehind import atomic_dump
+
+
+class Journal:
+    """快照 + 追加日志的存储引擎
+
+    快照文件是普通的 JSON 列表（与旧版文件格式相同，旧文件直接当作快照使用）；
+    日志文件每行一条记录：{"op": "add", "data": {...}} 或墓碑 {"op": "delete", "key": 记录键}。
+    加载时先读快照再重放日志，压缩时把当前数据整体写回快照并清空日志。
+    read_snapshot(path) / write_snapshot(path, records) 可替换快照的格式（如二进制快照）。
+    """
+
+    def __init__(self, snapshot_path: str, journal_path: str = None, compact_threshold: int = 1000,
+                 read_snapshot: Callable = None, write_snapshot: Callable = None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".journal"
+        self.compact_threshold = compact_threshold
+        self.read_snapshot = read_snapshot or _read_json
+        self.write_snapshot = write_snapshot or (lambda path, records: atomic_dump(path, records, indent=4))
+        self.pending = 0  # 日志中尚未压缩的记录数
+
+    def load(self, key_fn: Callable[[Dict], list]) -> List[Dict]:
+        """读取快照并重放日志，返回当前有效的记录列表
+
+        key_fn(record) 返回该记录可被墓碑匹配的所有键（列表会转为元组）
+        """
+        records = self.read_snapshot(self.snapshot_path)
+        alive = [True] * len(records)
+        positions = {}
+        for i, data in enumerate(records):
+            for key in key_fn(data):
+                positions.setdefault(_hashable(key), []).append(i)
+
+        self.pending = 0
+        for op in self._read_journal():
+            self.pending += 1
+            if op.get("op") == "add":
+                for key in key_fn(op["data"]):
+                    positions.setdefault(_hashable(key), []).append(len(records))
+                records.append(op["data"])
+                alive.append(True)
+            elif op.get("op") == "delete":
+                for i in positions.pop(_hashable(op["key"]), []):
+                    alive[i] = False
+
+        return [data for data, ok in zip(records, alive) if ok]
+
+    def read_ops(self) -> list:
+        """只读取日志中的操作（快照由调用方自行读取）"""
+        ops = list(self._read_journal())
+        self.pending = len(ops)
+        return ops
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+        yield from self._parse(raw)
+
+    def read_from(self, offset: int) -> tuple:
+        """读取 offset 字节之后新增的完整日志行，返回 (操作列表, 新的偏移)
+
+        用于跟上其他进程追加的内容；调用方需持有共享锁，保证不会读到写了一半的行
+        """
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                raw = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = raw.rfind(b"\n") + 1
+        ops = list(self._parse(raw[:end]))
+        self.pending += len(ops)
+        return ops, offset + end
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _parse(self, raw: bytes):
+        # 崩溃时最后一行可能只写了一半：截掉它，保证后续追加从新行开始
+        end = raw.rfind(b"\n") + 1
+        if end != len(raw):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(end)
+        for line in raw[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+    @timed("Journal.append")
+    def _append(self, op: Dict):
+        line = json.dumps(op, ensure_ascii=False) + "\n"
+        if instrument.ENABLED:
+            instrument.add_bytes(f"写入 {os.path.basename(self.journal_path)}", len(line.encode('utf-8')))
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending += 1
+
+    def append(self, data: Dict):
+        """追加一条新增记录"""
+        self._append({"op": "add", "data": data})
+
+    def delete(self, key):
+        """追加一条删除墓碑"""
+        self._append({"op": "delete", "key": key})
+
+    def needs_compaction(self) -> bool:
+        return self.pending >= self.compact_threshold
+
+    def compact(self, records: List[Dict]):
+        """把完整数据写成新快照（临时文件 + 原子替换），然后清空日志"""
+        self.write_snapshot(self.snapshot_path, records)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.pending = 0
+
+
+def _read_json(path: str) -> List[Dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def _hashable(key):
+    return tuple(key) if isinstance(key, list) else key
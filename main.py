@@ -1,53 +1,32 @@
-import json
-from tkinter import messagebox
-from datetime import datetime
+import os
+from tkinter import messagebox, filedialog
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-from filament import Filament, FilamentManager
-from model import Model, ModelManager
-
-class PrintHistoryEntry:
-    def __init__(self, model_name, used_materials, timestamp):
-        self.model_name = model_name
-        self.used_materials = used_materials  # 列表，包含耗材名称和用量
-        self.timestamp = timestamp
-
-    def to_dict(self):
-        return {
-            "model_name": self.model_name,
-            "used_materials": self.used_materials,
-            "timestamp": self.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-    @classmethod
-    def from_dict(cls, data):
-        return cls(
-            data["model_name"],
-            data["used_materials"],
-            datetime.strptime(data["timestamp"], "%Y-%m-%d %H:%M:%S")
-        )
-
-class PrintHistoryManager:
-    def __init__(self, filename: str = "print_history.json"):
-        self.filename = filename
-        self.history = []
-        self.load_data()
-
-    def add_entry(self, entry: PrintHistoryEntry):
-        self.history.append(entry)
-        self.save_data()
-
-    def save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump([entry.to_dict() for entry in self.history], f, indent=4)
-
-    def load_data(self):
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-                self.history = [PrintHistoryEntry.from_dict(item) for item in data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.history = []
+from events import ADDED, UPDATED, REMOVED, RESET
+from treesync import TreeSync
+from service import PrintService
+from tasks import TaskRunner
+from printqueue import format_shortfalls
+from rollup import recent_start
+from forecast import Forecast
+from instrument import timed
+from slicer import read_file
+import instrument
+import views
+
+HISTORY_PAGE_SIZE = 100  # 打印历史每次加载的行数
+PROGRESS_STEP = 500  # 后台计算成本时每处理多少个模型汇报一次进度
+SEARCH_LIMIT = 1000  # 搜索结果最多显示的行数
+SEARCH_DELAY = 150  # 输入停顿多久（毫秒）后执行搜索
+SYNC_INTERVAL = 2000  # 共享数据文件时检查其他进程写入的间隔（毫秒）
+PROFILE_REFRESH = 1000  # 性能统计窗口的自动刷新间隔（毫秒）
+FARM_PLATE_ROWS = 50  # 排产窗口中每台打印机最多列出的盘数
+USAGE_RANGES = {  # 用量统计的时间范围：(汇总周期, 周期数)，None 表示全部
+    "最近7天": ("day", 7),
+    "最近4周": ("week", 4),
+    "最近12个月": ("month", 12),
+    "全部": ("month", None),
+}
 
 class App(ttk.Window):
     def __init__(self):
@@ -55,50 +34,265 @@ class App(ttk.Window):
         self.title("3D打印耗材管理系统")
         self.geometry("1500x780")
 
-        # 初始化数据管理
-        self.filament_manager = FilamentManager()
-        self.model_manager = ModelManager()
-        self.print_history_manager = PrintHistoryManager()
+        # 初始化数据管理：业务逻辑都在 PrintService 中，界面只负责展示和输入
+        # 数据在窗口显示后由后台线程加载（见 start_loading）
+        self.service = PrintService(autoload=False)
+        self.filament_manager = self.service.filaments
+        self.model_manager = self.service.models
+        self.print_history_manager = self.service.history
+
+        # 耗时操作在后台线程执行，结果通过 after() 轮询交回主线程
+        self.tasks = TaskRunner(self)
 
         # 创建界面组件
         self.create_widgets()
 
-        # 初始化数据刷新
-        self.refresh_filaments()
-        self.refresh_models()
-        self.refresh_print_history()
+        # 树形列表按管理器的变更事件增量更新；事件可能由后台线程发出，统一转交主线程处理
+        self.filament_sync = TreeSync(self.filament_tree, views.filament_row,
+                                      sort_key=lambda f: -f.remaining)  # 按剩余量降序
+        self.model_sync = TreeSync(self.model_tree, self._model_row)
+        self.history_sync = TreeSync(self.history_tree, views.history_row, position=0)  # 最新的在最上面
+        self.filament_manager.subscribe(self.tasks.marshal(self.on_filament_changed))
+        self.model_manager.subscribe(self.tasks.marshal(self.on_model_changed))
+        self.model_manager.costs.subscribe(self.tasks.marshal(self.on_model_cost_changed))
+        self.print_history_manager.subscribe(self.tasks.marshal(self.on_history_changed))
+
+        # 先显示窗口，再分阶段加载数据：耗材和模型并行读取，历史最后加载
+        self.history_cursor = self.print_history_manager.cursor(HISTORY_PAGE_SIZE)
+        self.start_loading()
+
+        # 退出时关闭存储（JSON 存储会把打印历史日志合并进快照）
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 以 PRINTING_PROFILE=1 启动时按 F12 打开性能统计
+        if instrument.ENABLED:
+            self.bind("<F12>", lambda _: self.show_profile())
+
+    # ------------------ 后台加载 ------------------
+    def start_loading(self):
+        """在后台线程读取耗材和模型；解析结果回到主线程后再安装"""
+        self._loaded = set()
+        for panel in ("filaments", "models", "history"):
+            self._set_panel_loading(panel, True)
+        self._load_in_background("filaments", self.filament_manager)
+        self._load_in_background("models", self.model_manager)
+
+    def _load_in_background(self, name, manager):
+        def on_error(error):
+            messagebox.showerror("错误", f"加载数据失败：{str(error)}")
+            self._on_loaded(name, manager, [])
+        self.tasks.submit(manager.read_data, key=f"load-{name}",
+                          on_done=lambda data: self._on_loaded(name, manager, data),
+                          on_error=on_error)
+
+    def _on_loaded(self, name, manager, data):
+        """主线程：安装读取完成的数据并填充对应面板"""
+        manager.install(data)  # RESET 事件会刷新对应面板
+        self._loaded.add(name)
+        # 搜索索引在后台预先建立，首次搜索不必等待
+        index = {"filaments": self.service.filament_index,
+                 "models": self.service.model_index,
+                 "history": self.service.history_index}[name]
+        self.tasks.submit(index.build)
+        if name != "models":
+            self._set_panel_loading(name, False)
+
+        # 模型成本依赖耗材：两者都就绪后模型面板才可用（行由 RESET 事件填充），然后再加载历史
+        if name in ("filaments", "models") and {"filaments", "models"} <= self._loaded:
+            self._set_panel_loading("models", False)
+            self._load_in_background("history", self.print_history_manager)
+
+        # 与其他进程共用数据文件时，全部加载完成后开始定期检查它们的写入
+        if name == "history" and self.service.storage.shared:
+            self.after(SYNC_INTERVAL, self._poll_shared)
+
+    def _poll_shared(self):
+        """在写线程上检查其他进程的写入（与本进程的修改串行），变化经管理器事件刷新界面"""
+        if self.tasks.closed:
+            return
+        if not self.tasks.busy("poll-shared"):
+            self.tasks.submit(self.service.storage.poll, key="poll-shared", write=True)
+        self.after(SYNC_INTERVAL, self._poll_shared)
+
+    def _set_panel_loading(self, panel, loading):
+        """切换面板的加载状态：标题提示、占位行、禁用按钮"""
+        frame, title, tree, buttons = self._panels[panel]
+        frame.configure(text=f"{title}（加载中…） " if loading else title)
+        if loading:
+            tree.delete(*tree.get_children())
+            tree.insert("", END, iid=f"loading-{panel}", text="加载中…", values=("加载中…",))
+        elif tree.exists(f"loading-{panel}"):
+            tree.delete(f"loading-{panel}")
+        if buttons is not None:
+            for button in buttons.winfo_children():
+                button.configure(state=DISABLED if loading else NORMAL)
+
+    # ------------------ 后台任务 ------------------
+    def run_action(self, fn, *args, on_done=None, error_title="错误", error_prefix="", **kwargs):
+        """在后台写线程执行修改数据的操作；完成或出错时在主线程回调/提示"""
+        def on_error(error):
+            self.clear_status()
+            messagebox.showerror(error_title, f"{error_prefix}{str(error)}")
+
+        def finished(result):
+            self.clear_status()
+            if on_done is not None:
+                on_done(result)
+
+        self.show_status("正在处理…")
+        return self.tasks.submit(fn, *args, write=True, on_done=finished, on_error=on_error, **kwargs)
+
+    def show_status(self, message, done=None, total=None):
+        """状态栏显示当前后台操作及进度"""
+        self.status_var.set(message)
+        if total:
+            self.progress.configure(mode="determinate", maximum=total, value=done)
+        else:
+            self.progress.configure(mode="indeterminate")
+            self.progress.start(20)
+
+    def clear_status(self):
+        self.progress.stop()
+        self.progress.configure(mode="determinate", value=0)
+        self.status_var.set("就绪")
 
+    def on_close(self):
+        """关闭窗口前等待后台写操作完成，再关闭存储后端；后台保存失败时提示用户"""
+        try:
+            self.tasks.shutdown(wait=True)
+            self.service.close()
+        except OSError as e:
+            messagebox.showerror("保存失败", f"数据没有完整写入磁盘，最近的修改可能丢失：{str(e)}")
+        finally:
+            self.destroy()
+
+    # ------------------ 搜索过滤 ------------------
+    def _create_filter_box(self, parent, panel):
+        """列表上方的搜索框：输入停顿后用搜索索引过滤对应面板"""
+        frame = ttk.Frame(parent)
+        frame.pack(side=TOP, fill=X, padx=5, pady=(5, 0))
+        ttk.Label(frame, text="搜索:").pack(side=LEFT)
+        query_var = ttk.StringVar()
+        ttk.Entry(frame, textvariable=query_var).pack(side=LEFT, fill=X, expand=True, padx=2)
+        count_label = ttk.Label(frame, text="")
+        count_label.pack(side=LEFT, padx=2)
+        query_var.trace_add("write", lambda *_: self._schedule_filter(panel))
+        self._filters[panel] = {"var": query_var, "label": count_label, "after": None}
+
+    def _filter_query(self, panel):
+        return self._filters[panel]["var"].get().strip()
+
+    def _schedule_filter(self, panel):
+        """合并连续输入/变更，停顿 SEARCH_DELAY 毫秒后刷新面板"""
+        state = self._filters[panel]
+        if state["after"] is not None:
+            self.after_cancel(state["after"])
+        refresh = {"filaments": self.refresh_filaments,
+                   "models": self.refresh_models,
+                   "history": self.refresh_print_history}[panel]
+
+        def run():
+            state["after"] = None
+            refresh()
+        state["after"] = self.after(SEARCH_DELAY, run)
+
+    def _visible_rows(self, panel, rows):
+        """面板应显示的记录：无搜索词时为 rows，否则为搜索结果（最多 SEARCH_LIMIT 条）"""
+        query = self._filter_query(panel)
+        label = self._filters[panel]["label"]
+        if not query:
+            label.configure(text="")
+            return rows
+        search = {"filaments": self.service.search_filaments,
+                  "models": self.service.search_models,
+                  "history": self.service.search_history}[panel]
+        matches = search(query)
+        if len(matches) > SEARCH_LIMIT:
+            label.configure(text=f"{len(matches)} 条（显示前 {SEARCH_LIMIT} 条）")
+        else:
+            label.configure(text=f"{len(matches)} 条")
+        return matches[:SEARCH_LIMIT]
+
+    @timed()
     def refresh_filaments(self):
-        """刷新耗材列表"""
-        self.filament_tree.delete(*self.filament_tree.get_children())  # Clear existing entries
-
-        # Sort filaments by remaining amount in descending order
-        sorted_filaments = sorted(self.filament_manager.filaments, key=lambda f: f.remaining, reverse=True)
-
-        for f in sorted_filaments:
-            # 四舍五入到小数点后两位显示
-            total_price = round(f.total_price, 2)
-            price_per_g = round(f.price, 4)  # 确保每克的价格四舍五入到小数点后 4 位
-            remaining = round(f.remaining, 2)
-
-            # 插入排序后的耗材
-            self.filament_tree.insert("", END, text=f.name, values=(
-                f.category,
-                f"{total_price:.2f}",
-                f"{price_per_g:.4f}",
-                f.initial_amount,
-                f"{remaining:.2f}"
-            ))
+        """全量刷新耗材列表（按剩余量降序）"""
+        self.filament_sync.reset(self._visible_rows("filaments", self.filament_manager.filaments))
+
+    def on_filament_changed(self, event):
+        """耗材变更：只更新对应的行（受影响的模型由成本引擎通知）"""
+        if self._filter_query("filaments"):
+            self._schedule_filter("filaments")  # 过滤中：变更后重新搜索（改名可能改变匹配结果）
+            return
+        self.filament_sync.apply(event, self.filament_manager.filaments)
+
+    def on_model_cost_changed(self, event):
+        """成本缓存失效的模型重新渲染（只涉及引用了变化耗材的模型）"""
+        if event.action == RESET:
+            if "models" in self._loaded:
+                self.refresh_models()
+        elif self.model_sync.item_for(event.obj) is not None:  # 被过滤掉的模型不显示
+            self.model_sync.update(event.obj)
+
+    def on_model_changed(self, event):
+        if event.action == RESET:
+            if "filaments" in self._loaded:  # 成本依赖耗材，耗材加载完成后再统一刷新
+                self.refresh_models()
+            return
+        if self._filter_query("models"):
+            self._schedule_filter("models")
+            return
+        self.model_sync.apply(event, self.model_manager.models)
+
+    def on_history_changed(self, event):
+        """历史变更：只处理已加载的那部分行，并修正分页游标"""
+        if event.action == RESET:
+            self.refresh_print_history()
+            return
+        if self._filter_query("history"):
+            self._schedule_filter("history")
+            return
+        if event.action == ADDED:
+            self.history_cursor.shift(1)
+        elif event.action == REMOVED and self.history_sync.item_for(event.obj) is not None:
+            self.history_cursor.shift(-1)
+        elif event.action == UPDATED:
+            # 耗材改名后的记录：只重绘已加载的行（未加载的页不插入）
+            if self.history_sync.item_for(event.obj) is not None:
+                self.history_sync.update(event.obj)
+            return
+        self.history_sync.apply(event)
+
+    def load_more_history(self):
+        """滚动到底部时加载下一页历史记录（搜索结果不分页）"""
+        if not self._filter_query("history") and self.history_cursor.has_more():
+            self.history_sync.extend(self.history_cursor.next_page())
+
+    def on_history_scroll(self, first, last):
+        """历史列表滚动回调：同步滚动条，接近底部时加载更多"""
+        self.history_scrollbar.set(first, last)
+        if float(last) >= 0.95 and self.history_cursor.has_more():
+            self.after_idle(self.load_more_history)
 
     def create_widgets(self):
         """创建主界面布局"""
+        # ================= 底部状态栏（后台任务进度）=================
+        status_bar = ttk.Frame(self)
+        status_bar.pack(side=BOTTOM, fill=X, padx=10, pady=(0, 5))
+        self.status_var = ttk.StringVar(value="就绪")
+        ttk.Label(status_bar, textvariable=self.status_var, anchor=W).pack(side=LEFT, fill=X, expand=True)
+        self.progress = ttk.Progressbar(status_bar, length=200, bootstyle=INFO)
+        self.progress.pack(side=RIGHT)
+
         # ================= 左侧容器（耗材管理 + 打印历史）=================
         left_container = ttk.Frame(self)
         left_container.pack(side=LEFT, fill=Y, padx=10, pady=10)
 
         # 耗材管理面板
         filament_frame = ttk.Labelframe(left_container, text=" 耗材管理 ", bootstyle=INFO)
+        self._panels = {}
+        self._filters = {}
         filament_frame.pack(side=TOP, fill=BOTH, expand=True)
+        self._create_filter_box(filament_frame, "filaments")
 
         # 耗材树形列表
         self.filament_tree = ttk.Treeview(
@@ -130,11 +324,17 @@ class App(ttk.Window):
                    bootstyle=WARNING).pack(side=LEFT, expand=True, padx=2)
         ttk.Button(btn_frame, text="删除耗材", command=self.delete_filament,
                    bootstyle=DANGER).pack(side=LEFT, expand=True, padx=2)
+        ttk.Button(btn_frame, text="卷管理", command=self.show_spools,
+                   bootstyle=INFO).pack(side=LEFT, expand=True, padx=2)
+        ttk.Button(btn_frame, text="库存预测", command=self.show_forecast,
+                   bootstyle=INFO).pack(side=LEFT, expand=True, padx=2)
+        self._panels["filaments"] = (filament_frame, " 耗材管理 ", self.filament_tree, btn_frame)
 
         # 打印历史面板
         history_frame = ttk.Labelframe(left_container, text=" 打印历史 ", bootstyle=INFO)
         history_frame = ttk.Labelframe(left_container, text=" 打印历史 ", bootstyle=DANGER)
         history_frame.pack(side=TOP, fill=BOTH, expand=True)
+        self._create_filter_box(history_frame, "history")
 
         # 历史记录列表
         self.history_tree = ttk.Treeview(
@@ -153,7 +353,19 @@ class App(ttk.Window):
         for col_id, text, width, anchor in history_columns:
             self.history_tree.heading(col_id, text=text, anchor=anchor)
             self.history_tree.column(col_id, width=width, anchor=anchor)
+
+        # 历史记录按页加载：滚动接近底部时再取下一页
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient=VERTICAL, command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=self.on_history_scroll)
+        # 历史操作按钮
+        history_btn_frame = ttk.Frame(history_frame)
+        history_btn_frame.pack(side=BOTTOM, fill=X, pady=5)
+        ttk.Button(history_btn_frame, text="用量统计", command=self.show_usage_stats,
+                   bootstyle=INFO).pack(side=LEFT, expand=True, padx=2)
+
+        self.history_scrollbar.pack(side=RIGHT, fill=Y)
         self.history_tree.pack(fill=BOTH, expand=True)
+        self._panels["history"] = (history_frame, " 打印历史 ", self.history_tree, history_btn_frame)
 
         def on_right_click(event):
             """Handler for right-click events on the history tree."""
@@ -170,19 +382,13 @@ class App(ttk.Window):
             selected = self.history_tree.selection()
             if not selected:
                 return
-            # Get the selected item's values
-            model_name = self.history_tree.item(selected[0], "values")[0]
-            timestamp = self.history_tree.item(selected[0], "values")[2]
-
-            # Remove the entry from the history
-            self.print_history_manager.history = [
-                entry for entry in self.print_history_manager.history
-                if not (entry.model_name == model_name and entry.timestamp.strftime("%Y-%m-%d %H:%M:%S") == timestamp)
-            ]
-            self.print_history_manager.save_data()
-
-            # Refresh the history display
-            self.refresh_print_history()
+            entry = self.history_sync.obj_for(selected[0])
+            if entry is None:
+                return
+
+            # Remove the entry by its ID (written as a tombstone to the journal);
+            # the removal event deletes the matching row
+            self.run_action(self.service.delete_history, entry.id)
 
         # Create the context menu for deleting history entry
         self.history_menu = ttk.Menu(self, tearoff=0)
@@ -194,6 +400,7 @@ class App(ttk.Window):
         # ================= 右侧模型管理面板 =================
         right_frame = ttk.Labelframe(self, text=" 模型管理 ", bootstyle=WARNING)
         right_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=10, pady=10)
+        self._create_filter_box(right_frame, "models")
 
         # 模型树形列表
         self.model_tree = ttk.Treeview(
@@ -234,6 +441,13 @@ class App(ttk.Window):
                    bootstyle=DANGER).pack(side=LEFT, expand=True, padx=2)
         ttk.Button(btn_frame, text="执行打印", command=self.use_model,
                    bootstyle=INFO).pack(side=LEFT, expand=True, padx=2)
+        ttk.Button(btn_frame, text="批量打印", command=self.show_print_queue,
+                   bootstyle=INFO).pack(side=LEFT, expand=True, padx=2)
+        ttk.Button(btn_frame, text="导入切片", command=self.import_sliced,
+                   bootstyle=SECONDARY).pack(side=LEFT, expand=True, padx=2)
+        ttk.Button(btn_frame, text="打印农场", command=self.show_farm,
+                   bootstyle=PRIMARY).pack(side=LEFT, expand=True, padx=2)
+        self._panels["models"] = (right_frame, " 模型管理 ", self.model_tree, btn_frame)
 
     def toggle_selection(self, event):
         """切换选中状态，点击非展开区域时切换选择"""
@@ -253,69 +467,44 @@ class App(ttk.Window):
                 widget.selection_set(item)
         return "break"  # 阻止默认选择行为
 
+    @timed()
     def refresh_models(self):
-        """刷新模型列表（支持多耗材展开显示）"""
-        self.model_tree.delete(*self.model_tree.get_children())
-
-        for m in self.model_manager.models:
+        """全量刷新模型列表（支持多耗材展开显示）
+
+        成本先在后台线程算好并缓存，再回到主线程渲染；新的刷新会取消尚未完成的旧刷新
+        """
+        models = list(self._visible_rows("models", self.model_manager.models))
+        self.tasks.submit(self._compute_costs, models, key="refresh-models", pass_task=True,
+                          on_done=self._show_models,
+                          on_progress=lambda done, total, _: self.show_status("正在计算模型成本…", done, total))
+
+    @timed()
+    def _compute_costs(self, task, models):
+        """工作线程：预先计算（缓存）每个模型的成本"""
+        total = len(models)
+        for i, m in enumerate(models):
+            if task.cancelled:
+                return None
+            if i % PROGRESS_STEP == 0:
+                task.progress(i, total)
             try:
-                total_weight = 0  # 初始化总重量
-                total_cost = 0  # 初始化总成本
-
-                # 插入父项（模型基本信息）
-                parent = self.model_tree.insert(
-                    "", END,
-                    text=m.name,
-                    values=(
-                        f"{len(m.materials)}种耗材",  # 显示耗材数量
-                        m.quantity,
-                        self._calculate_total_cost(m),  # 总成本（每个耗材的成本累加）
-                        ""  # 单价列留空
-                    ),
-                    open=False  # 默认折叠状态
-                )
-
-                # 插入子项（耗材详情）
-                for mat in m.materials:
-                    filament = self.filament_manager.find_filament(mat["filament"])
-                    if filament:
-                        material_cost = filament.price * mat["weight"]  # 单个耗材的成本
-                        material_unit_cost = material_cost / m.quantity  # 计算子项单价
-                        total_weight += mat["weight"]  # 累加耗材重量
-                        total_cost += material_cost  # 累加总成本
-
-                        self.model_tree.insert(
-                            parent, END,
-                            text="→ " + mat["filament"],
-                            values=(
-                                f"{mat['weight']}g",  # 显示耗材重量
-                                1,  # 单耗材数量固定为1
-                                f"{material_cost:.2f}",  # 显示单个耗材成本
-                                f"{material_unit_cost:.2f}"  # 显示子项的单价（总价/数量）
-                            ),
-                            tags=("child",)  # 添加标签用于样式控制
-                        )
-
-                # 更新父项（模型）中的"使用耗材"和"单价"信息
-                parent_unit_cost = total_cost / m.quantity  # 计算父项的单价（总价/数量）
-                self.model_tree.item(parent, values=(
-                    f"{total_weight:.2f}g",  # 显示所有耗材的总重量
-                    m.quantity,
-                    f"{total_cost:.2f}",  # 更新总成本
-                    f"{parent_unit_cost:.2f}"  # 更新父项的单价（总成本/数量）
-                ))
-
-            except Exception as e:
-                print(f"加载模型 {m.name} 出错: {str(e)}")
-
-    def _calculate_total_cost(self, model):
-        """计算模型总成本"""
-        total = 0
-        for mat in model.materials:
-            filament = self.filament_manager.find_filament(mat["filament"])
-            if filament:
-                total += filament.price * mat["weight"] * model.quantity
-        return f"{total:.2f}"
+                self.model_manager.cost(m)
+            except Exception:
+                pass  # 渲染时再报告错误
+        return models
+
+    @timed()
+    def _show_models(self, _):
+        self.clear_status()
+        self.model_sync.reset(self._visible_rows("models", self.model_manager.models))
+
+    def _model_row(self, m):
+        """生成模型父项及其耗材子项的显示内容（成本来自缓存）"""
+        try:
+            return views.model_row(m, self.model_manager.cost(m))
+        except Exception as e:
+            print(f"加载模型 {m.name} 出错: {str(e)}")
+            return m.name, (f"{len(m.materials)}种耗材", m.quantity, "", ""), []
 
     # ------------------ 功能弹窗 ------------------
     def show_add_filament(self):
@@ -337,17 +526,18 @@ class App(ttk.Window):
 
         name_entry, category_combo, price_entry, amount_entry = [w for _, w in fields]
 
+        @timed()
         def on_submit():
             try:
-                filament = Filament(
+                self.run_action(
+                    self.service.add_filament,
                     name=name_entry.get(),
                     category=category_combo.get(),
                     total_price=float(price_entry.get()),
-                    initial_amount=int(amount_entry.get())
+                    initial_amount=int(amount_entry.get()),
+                    on_done=lambda _: dialog.destroy(),
+                    error_prefix="输入无效: "
                 )
-                self.filament_manager.add_filament(filament)
-                self.refresh_filaments()
-                dialog.destroy()
             except ValueError as e:
                 messagebox.showerror("错误", f"输入无效: {str(e)}")
 
@@ -395,25 +585,24 @@ class App(ttk.Window):
             ttk.Label(dialog, text=label).pack(pady=2)
             widget.pack(fill=X, padx=10, pady=2)
 
+        # 多卷耗材的总价/总量/剩余量是各卷的合计，只能在卷管理中修改
+        multi_spool = len(filament.spools) > 1
+        if multi_spool:
+            for _, widget in fields[2:]:
+                widget.configure(state=DISABLED)
+            ttk.Label(dialog, text=f"该耗材有 {len(filament.spools)} 卷，价格和剩余量请在“卷管理”中修改",
+                      bootstyle=INFO).pack(pady=2)
+
+        @timed()
         def on_submit():
             try:
-                # 获取并验证输入
+                # 获取输入（数据验证由 PrintService.update_filament 完成）
                 new_name = name_var.get().strip()
                 new_category = category_var.get()
                 new_price = float(price_var.get())
                 new_initial = float(initial_var.get())
                 new_remaining = float(remaining_var.get())
 
-                # 数据验证
-                if not new_name:
-                    raise ValueError("名称不能为空")
-                if new_price <= 0:
-                    raise ValueError("总价必须大于0")
-                if new_initial <= 0:
-                    raise ValueError("总量必须大于0")
-                if new_remaining < 0:
-                    raise ValueError("剩余量不能为负数")
-
                 # 保持小数点后两位
                 new_remaining = round(new_remaining, 2)  # Round remaining value to 2 decimal places
 
@@ -421,30 +610,37 @@ class App(ttk.Window):
                 new_initial = int(round(new_initial))  # Remaining logic unchanged
 
                 # 自动调整剩余量逻辑
-                if filament.initial_amount > 0 and new_initial != filament.initial_amount:
+                if not multi_spool and filament.initial_amount > 0 and new_initial != filament.initial_amount:
                     ratio = filament.remaining / filament.initial_amount
                     adjusted_remaining = int(round(new_initial * ratio))
                     if new_remaining != adjusted_remaining:
                         if messagebox.askyesno("提示",
                                                f"总量变化将自动调整剩余量为{adjusted_remaining}g\n是否继续？"):
                             new_remaining = adjusted_remaining
+            except ValueError as e:
+                messagebox.showerror("输入错误", f"无效输入：{str(e)}")
+                return
 
-                # 更新数据
-                filament.name = new_name
-                filament.category = new_category
-                filament.total_price = new_price
-                filament.initial_amount = new_initial
-                filament.remaining = new_remaining  # Save the remaining with decimal
-
-                self.filament_manager.save_data()
-                self.refresh_filaments()
+            def on_done(_):
                 dialog.destroy()
                 messagebox.showinfo("成功", "耗材信息已更新！")
 
-            except ValueError as e:
-                messagebox.showerror("输入错误", f"无效输入：{str(e)}")
-            except Exception as e:
-                messagebox.showerror("错误", f"更新失败：{str(e)}")
+            stock = {} if multi_spool else dict(
+                total_price=new_price,
+                initial_amount=new_initial,
+                remaining=new_remaining,  # Save the remaining with decimal
+            )
+            # 更新数据（名称/种类变化时由管理器维护索引）
+            self.run_action(
+                self.service.update_filament,
+                filament.name,
+                name=new_name,
+                category=new_category,
+                **stock,
+                on_done=on_done,
+                error_title="输入错误",
+                error_prefix="无效输入："
+            )
 
         ttk.Button(dialog, text="保存修改", command=on_submit, bootstyle=SUCCESS).pack(pady=10)
 
@@ -458,7 +654,7 @@ class App(ttk.Window):
         material_frame.pack(fill=X, pady=10)
 
         # 初始的“添加耗材”行按钮
-        def add_material_row():
+        def add_material_row(filament="", weight=None):
             """添加耗材行（将输入框放在顶部）"""
             row_frame = ttk.Frame(material_frame)
             row_frame.pack(fill=X, pady=2)
@@ -466,10 +662,13 @@ class App(ttk.Window):
             # 耗材选择框
             filament_combo = ttk.Combobox(row_frame, values=[f.name for f in self.filament_manager.filaments])
             filament_combo.pack(side=LEFT, padx=2, fill=X, expand=True)
+            filament_combo.set(filament)
 
             # 重量输入框
             weight_entry = ttk.Entry(row_frame)
             weight_entry.pack(side=LEFT, padx=2, fill=X, expand=True)
+            if weight is not None:
+                weight_entry.insert(0, str(weight))
 
             # 删除按钮
             ttk.Button(row_frame, text="×", command=lambda: row_frame.destroy(),
@@ -478,9 +677,42 @@ class App(ttk.Window):
         # 默认添加一个耗材行
         add_material_row()
 
+        def load_sliced():
+            """从切片文件（G-code / 3MF）读取耗材用量，填入耗材行和模型名称"""
+            path = filedialog.askopenfilename(parent=dialog, filetypes=[("切片文件", "*.gcode *.gco *.g *.3mf"),
+                                                                        ("所有文件", "*.*")])
+            if not path:
+                return
+
+            def fill(result):
+                self.clear_status()
+                if not dialog.winfo_exists():
+                    return
+                materials, unmatched = self.service.slice_materials(result)
+                for row in material_frame.winfo_children():
+                    row.destroy()
+                for mat in materials:
+                    add_material_row(mat["filament"], mat["weight"])
+                if not name_entry.get():
+                    name_entry.insert(0, result.name)
+                if unmatched:
+                    messagebox.showwarning("提示", "以下耗材在库存中没有对应项，请手动选择：\n"
+                                           + "\n".join(sorted(unmatched)), parent=dialog)
+
+            def on_error(error):
+                self.clear_status()
+                messagebox.showerror("读取失败", str(error), parent=dialog)
+
+            self.show_status("正在读取切片文件…")
+            self.tasks.submit(read_file, path, on_done=fill, on_error=on_error)
+
         # 添加耗材按钮，点击时会增加新的输入框
-        ttk.Button(dialog, text="+ 添加耗材", command=add_material_row,
-                   bootstyle=SECONDARY).pack(anchor=W, pady=5)
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill=X, pady=5)
+        ttk.Button(buttons, text="+ 添加耗材", command=add_material_row,
+                   bootstyle=SECONDARY).pack(side=LEFT)
+        ttk.Button(buttons, text="从切片文件读取…", command=load_sliced,
+                   bootstyle=SECONDARY).pack(side=LEFT, padx=5)
 
         # 模型基本信息部分
         main_frame = ttk.Frame(dialog)
@@ -493,6 +725,7 @@ class App(ttk.Window):
         quantity_entry = ttk.Entry(main_frame, width=8)
         quantity_entry.pack(side=LEFT)
 
+        @timed()
         def on_submit():
             try:
                 # 收集所有耗材数据
@@ -501,42 +734,74 @@ class App(ttk.Window):
                     # 获取每一行的耗材和重量
                     combo = row.winfo_children()[0]  # Combobox for filament
                     entry = row.winfo_children()[1]  # Entry for weight
-                    filament_name = combo.get()
-                    weight = float(entry.get())
-
-                    if not filament_name or weight <= 0:
-                        raise ValueError("耗材信息不完整")
-
                     material_list.append({
-                        "filament": filament_name,
-                        "weight": round(weight, 2)
+                        "filament": combo.get(),
+                        "weight": float(entry.get())
                     })
 
-                # 创建模型
-                model = Model(
+                # 创建模型（耗材信息由 PrintService 校验）
+                self.run_action(
+                    self.service.add_model,
                     name=name_entry.get(),
                     materials=material_list,
-                    quantity=int(quantity_entry.get())
+                    quantity=int(quantity_entry.get()),
+                    on_done=lambda _: dialog.destroy(),
+                    error_prefix="输入无效: "
                 )
-                self.model_manager.add_model(model)
-                self.refresh_models()
-                dialog.destroy()
             except Exception as e:
                 messagebox.showerror("错误", f"输入无效: {str(e)}")
 
         ttk.Button(dialog, text="提交", command=on_submit, bootstyle=SUCCESS).pack(pady=10)
 
+    def import_sliced(self):
+        """从一个目录的切片文件批量创建模型（多进程解析，模型名称取文件名）"""
+        directory = filedialog.askdirectory(title="选择切片文件（G-code / 3MF）所在目录")
+        if not directory:
+            return
+
+        def on_done(report):
+            self.clear_status()
+            lines = [f"已创建 {len(report.created)} 个模型"]
+            if report.skipped:
+                lines.append(f"已存在而跳过 {len(report.skipped)} 个：{'、'.join(report.skipped[:10])}")
+            if report.failed:
+                lines.append(f"失败 {len(report.failed)} 个：")
+                lines.extend(f"  {os.path.basename(path)}: {message}" for path, message in report.failed[:10])
+            if report.unmatched:
+                lines.append("以下耗材在库存中没有对应项，已按切片软件中的名称保存（添加同名耗材后自动关联）：")
+                lines.append("、".join(sorted(report.unmatched)))
+            messagebox.showinfo("导入完成", "\n".join(lines))
+
+        def on_error(error):
+            self.clear_status()
+            messagebox.showerror("导入失败", str(error))
+
+        def on_parsed(parsed):
+            # 解析在线程池中完成，写线程只负责创建模型的事务，期间其他修改不必等待解析
+            if self.tasks.closed:
+                return
+            self.show_status("正在创建模型…")
+            self.tasks.submit(self.service.create_sliced, *parsed, write=True,
+                              on_done=on_done, on_error=on_error)
+
+        self.show_status("正在解析切片文件…")
+        self.tasks.submit(lambda task: self.service.read_sliced([directory], on_progress=task.progress),
+                          pass_task=True, on_done=on_parsed, on_error=on_error,
+                          on_progress=lambda done, total, _: self.show_status("正在解析切片文件…", done, total))
+
     # ------------------ 操作功能 ------------------
     def delete_filament(self):
         """删除选中耗材"""
         if selected := self.filament_tree.selection():
             name = self.filament_tree.item(selected[0], "text")
-            if messagebox.askyesno("确认", f"确定删除耗材 {name} 吗？"):
-                self.filament_manager.filaments = [
-                    f for f in self.filament_manager.filaments if f.name != name
-                ]
-                self.filament_manager.save_data()
-                self.refresh_filaments()
+            affected = self.service.filament_dependents(name)
+            message = f"确定删除耗材 {name} 吗？"
+            if affected:
+                shown = "、".join(m.name for m in affected[:10])
+                more = f" 等 {len(affected)} 个模型" if len(affected) > 10 else ""
+                message += f"\n\n以下模型引用了该耗材，删除后其成本将不再包含它：\n{shown}{more}"
+            if messagebox.askyesno("确认", message):
+                self.run_action(self.service.delete_filament, name)
         else:
             messagebox.showwarning("提示", "请先选择要删除的耗材！")
 
@@ -545,26 +810,18 @@ class App(ttk.Window):
         if selected := self.model_tree.selection():
             name = self.model_tree.item(selected[0], "text")
             if messagebox.askyesno("确认", f"确定删除模型 {name} 吗？"):
-                self.model_manager.models = [
-                    m for m in self.model_manager.models if m.name != name
-                ]
-                self.model_manager.save_data()
-                self.refresh_models()
+                self.run_action(self.service.delete_model, name)
         else:
             messagebox.showwarning("提示", "请先选择要删除的模型！")
 
+    @timed()
     def refresh_print_history(self):
-        """刷新打印历史记录"""
-        self.history_tree.delete(*self.history_tree.get_children())  # Clear existing entries
-
-        # Reverse the order of the history list to show the latest entry first
-        for entry in reversed(self.print_history_manager.history):
-            materials_str = ", ".join(
-                [f"{mat['filament']}({mat['weight']}g)" for mat in entry.used_materials]
-            )
-            time_str = entry.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            self.history_tree.insert("", END, values=(entry.model_name, materials_str, time_str))
+        """刷新打印历史记录（只加载最新的一页，其余滚动时再加载）"""
+        # Latest entry first
+        self.history_cursor = self.print_history_manager.cursor(HISTORY_PAGE_SIZE)
+        self.history_sync.reset(self._visible_rows("history", self.history_cursor.next_page()))
 
+    @timed()
     def use_model(self):
         """执行打印操作（支持多耗材）"""
         if not (selected := self.model_tree.selection()):
@@ -574,48 +831,546 @@ class App(ttk.Window):
         model_name = self.model_tree.item(selected[0], "text")
         model = self.model_manager.find_model(model_name)
 
-        # 检查耗材是否足够
-        required = {}
-        for material in model.materials:
-            filament = self.filament_manager.find_filament(material["filament"])
-            needed = material["weight"]  # 每个耗材的总需求量
+        if not model:
+            messagebox.showerror("错误", "所选模型不存在！")
+            return
+        if not self._history_ready():
+            return
 
-            if not filament:
-                messagebox.showerror("错误", f"耗材 {material['filament']} 不存在！")
+        def on_done(result):
+            if not result.ok:
+                messagebox.showerror("错误", f"耗材不足：\n{format_shortfalls(result.shortfalls)}")
                 return
-            if filament.remaining < needed:
-                messagebox.showerror("错误",
-                                     f"{material['filament']} 需要 {needed}g\n当前剩余: {filament.remaining}g")
+
+            # 生成报告
+            report = "\n".join([f"{k}: 使用 {v}g" for k, v in result.requirements.items()])
+            messagebox.showinfo("打印成功",
+                                f"已成功打印 {model.quantity} 个 {model.name}\n{report}")
+
+        # 检查耗材是否足够，扣除耗材并添加历史记录（同一个事务中提交）
+        self.run_action(self.service.use_model, model.name, on_done=on_done)
+
+    def _history_ready(self):
+        """打印会写入历史记录，历史加载完成前不允许打印"""
+        if "history" not in self._loaded:
+            messagebox.showinfo("提示", "打印历史正在加载，请稍候再试")
+            return False
+        return True
+
+    def show_print_queue(self):
+        """批量打印：一次校验并执行多个 (模型, 盘数) 任务"""
+        if not self._history_ready():
+            return
+        dialog = ttk.Toplevel(title="批量打印")
+        dialog.geometry("600x360")
+
+        job_frame = ttk.Frame(dialog)
+        job_frame.pack(fill=X, pady=10)
+        model_names = [m.name for m in self.model_manager.models]
+
+        def add_job_row(model_name=""):
+            """添加任务行：模型 + 盘数"""
+            row_frame = ttk.Frame(job_frame)
+            row_frame.pack(fill=X, pady=2)
+
+            model_combo = ttk.Combobox(row_frame, values=model_names)
+            model_combo.pack(side=LEFT, padx=2, fill=X, expand=True)
+            if model_name:
+                model_combo.set(model_name)
+
+            count_entry = ttk.Entry(row_frame, width=8)
+            count_entry.insert(0, "1")
+            count_entry.pack(side=LEFT, padx=2)
+
+            ttk.Button(row_frame, text="×", command=lambda: row_frame.destroy(),
+                       bootstyle=DANGER, width=2).pack(side=LEFT)
+
+        # 默认带上当前选中的模型
+        selected = self.model_tree.selection()
+        add_job_row(self.model_tree.item(selected[0], "text") if selected else "")
+
+        ttk.Button(dialog, text="+ 添加任务", command=lambda: add_job_row(),
+                   bootstyle=SECONDARY).pack(anchor=W, pady=5)
+
+        @timed()
+        def on_submit():
+            try:
+                jobs = []
+                for row in job_frame.winfo_children():
+                    combo, entry = row.winfo_children()[0], row.winfo_children()[1]
+                    count = int(entry.get())
+                    if count <= 0:
+                        raise ValueError("盘数必须大于0")
+                    jobs.append((combo.get(), count))
+                if not jobs:
+                    raise ValueError("没有打印任务")
+            except ValueError as e:
+                messagebox.showerror("错误", f"输入无效: {str(e)}")
                 return
 
-            if filament not in required:
-                required[filament] = 0
-            required[filament] += needed  # 累加相同耗材的需求量
-
-        # 扣除耗材并保存
-        for filament, amount in required.items():
-            filament.remaining -= amount
-        self.filament_manager.save_data()
-
-        # 添加历史记录
-        used_materials = [
-            {
-                "filament": mat["filament"],
-                "weight": mat["weight"]  # 使用的是单个耗材的重量
-            } for mat in model.materials
-        ]
-        self.print_history_manager.add_entry(
-            PrintHistoryEntry(model.name, used_materials, datetime.now())
-        )
+            def on_done(result):
+                if not result.ok:
+                    messagebox.showerror("耗材不足", format_shortfalls(result.shortfalls), parent=dialog)
+                    return
+
+                dialog.destroy()
+                report = "\n".join([f"{k}: 使用 {v:.2f}g" for k, v in result.requirements.items()])
+                messagebox.showinfo("打印成功", f"已完成 {len(result.entries)} 盘打印\n{report}")
+
+            self.run_action(self.service.run_jobs, jobs, on_done=on_done, error_prefix="输入无效: ")
+
+        ttk.Button(dialog, text="执行", command=on_submit, bootstyle=SUCCESS).pack(pady=10)
+
+    def show_usage_stats(self):
+        """用量统计：读取按日/周/月汇总的用量表，选中一行显示其逐期明细"""
+        dialog = ttk.Toplevel(title="用量统计")
+        dialog.geometry("720x560")
+
+        options = ttk.Frame(dialog)
+        options.pack(fill=X, padx=10, pady=5)
+        ttk.Label(options, text="统计对象:").pack(side=LEFT)
+        kind_combo = ttk.Combobox(options, values=["耗材", "模型"], state="readonly", width=8)
+        kind_combo.set("耗材")
+        kind_combo.pack(side=LEFT, padx=5)
+        ttk.Label(options, text="时间范围:").pack(side=LEFT, padx=(10, 0))
+        range_combo = ttk.Combobox(options, values=list(USAGE_RANGES), state="readonly", width=12)
+        range_combo.set("最近12个月")
+        range_combo.pack(side=LEFT, padx=5)
+
+        columns = ("grams", "cost", "prints")
+        headings = [("grams", "用量(g)", 120), ("cost", "成本(元)", 120), ("prints", "打印次数", 100)]
+        totals_tree = ttk.Treeview(dialog, columns=columns, show="tree headings", height=10)
+        series_tree = ttk.Treeview(dialog, columns=columns, show="tree headings", height=8)
+        for tree, first in ((totals_tree, "名称"), (series_tree, "周期")):
+            tree.heading("#0", text=first, anchor=W)
+            tree.column("#0", width=240, anchor=W)
+            for col_id, text, width in headings:
+                tree.heading(col_id, text=text, anchor=CENTER)
+                tree.column(col_id, width=width, anchor=CENTER)
+        totals_tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+        ttk.Label(dialog, text="逐期明细（选中上方一行）").pack(anchor=W, padx=10)
+        series_tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        def query():
+            kind = "filament" if kind_combo.get() == "耗材" else "model"
+            period, count = USAGE_RANGES[range_combo.get()]
+            start = recent_start(period, count) if count else None
+            return kind, period, start
+
+        def fill(tree, rows):
+            tree.delete(*tree.get_children())
+            for text, usage in rows:
+                tree.insert("", END, text=text,
+                            values=(f"{usage.grams:.2f}", f"{usage.cost:.2f}", usage.prints))
+
+        # 汇总表由写线程更新，查询也放到写线程上与修改串行执行
+        def refresh(*_):
+            series_tree.delete(*series_tree.get_children())
+            self.tasks.submit(self.service.usage, *query(), key="usage-totals", write=True,
+                              on_done=lambda rows: fill(totals_tree, rows))
+
+        def show_series(_):
+            selected = totals_tree.selection()
+            if not selected:
+                return
+            kind, period, start = query()
+            name = totals_tree.item(selected[0], "text")
+            self.tasks.submit(self.service.usage_series, name, kind, period, start, key="usage-series",
+                              write=True, on_done=lambda rows: fill(series_tree, rows))
+
+        kind_combo.bind("<<ComboboxSelected>>", refresh)
+        range_combo.bind("<<ComboboxSelected>>", refresh)
+        totals_tree.bind("<<TreeviewSelect>>", show_series)
+        ttk.Button(options, text="刷新", command=refresh, bootstyle=SECONDARY).pack(side=RIGHT)
+        refresh()
+
+    def show_spools(self):
+        """卷管理：同一种耗材的多卷库存（按扣料顺序列出），入库新卷、修改或删除某一卷"""
+        if not (selected := self.filament_tree.selection()):
+            messagebox.showwarning("提示", "请先选择耗材！")
+            return
+        filament = self.filament_manager.find_filament(self.filament_tree.item(selected[0], "text"))
+        if filament is None:
+            messagebox.showerror("错误", "所选耗材不存在！")
+            return
+
+        dialog = ttk.Toplevel(title=f"卷管理 - {filament.name}")
+        dialog.geometry("900x480")
+        summary = ttk.Label(dialog, text="")
+        summary.pack(anchor=W, padx=10, pady=5)
+
+        tree = ttk.Treeview(dialog, columns=("order", "added", "price", "unit", "amount", "remaining"),
+                            show="tree headings", height=10)
+        for col_id, text, width in [("#0", "卷编号", 70), ("order", "扣料顺序", 80), ("added", "入库时间", 160),
+                                    ("price", "价格(元)", 90), ("unit", "单价(元/g)", 100),
+                                    ("amount", "总量(g)", 90), ("remaining", "剩余(g)", 90)]:
+            tree.heading(col_id, text=text)
+            tree.column(col_id, width=width, anchor=W if col_id == "#0" else CENTER)
+        tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        def load():
+            if not dialog.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            spools = self.service.spools(filament.name)
+            for i, spool in enumerate(spools, 1):
+                text, values, _ = views.spool_row(spool, i if spool.remaining > 0 else None)
+                tree.insert("", END, iid=str(id(spool)), text=text, values=values)
+            summary.configure(text=f"共 {len(spools)} 卷，剩余 {filament.remaining:.2f}g，"
+                                   f"平均单价 {filament.price:.4f} 元/g（扣料策略：{filament.stock.policy}）")
+
+        def selected_spool():
+            if not (chosen := tree.selection()):
+                messagebox.showwarning("提示", "请先选择一卷！", parent=dialog)
+                return None
+            text = tree.item(chosen[0], "text")
+            if not text.isdigit():
+                messagebox.showwarning("提示", "只有一卷的耗材请在“编辑耗材”中修改", parent=dialog)
+                return None
+            return int(text)
+
+        form = ttk.Frame(dialog)
+        form.pack(fill=X, padx=10, pady=5)
+        ttk.Label(form, text="价格(元):").pack(side=LEFT)
+        price_entry = ttk.Entry(form, width=10)
+        price_entry.pack(side=LEFT, padx=2)
+        ttk.Label(form, text="总量(g):").pack(side=LEFT, padx=(10, 0))
+        amount_entry = ttk.Entry(form, width=10)
+        amount_entry.pack(side=LEFT, padx=2)
+        ttk.Label(form, text="剩余(g):").pack(side=LEFT, padx=(10, 0))
+        remaining_entry = ttk.Entry(form, width=10)
+        remaining_entry.pack(side=LEFT, padx=2)
+
+        def add_spool():
+            try:
+                price, amount = float(price_entry.get()), float(amount_entry.get())
+            except ValueError:
+                messagebox.showerror("错误", "请输入有效的价格和总量", parent=dialog)
+                return
+            self.run_action(self.service.add_spool, filament.name, price, amount, error_prefix="入库失败：")
+
+        def set_remaining():
+            spool_id = selected_spool()
+            if spool_id is None:
+                return
+            try:
+                remaining = round(float(remaining_entry.get()), 2)
+            except ValueError:
+                messagebox.showerror("错误", "请输入有效的剩余量", parent=dialog)
+                return
+            self.run_action(self.service.update_spool, filament.name, spool_id, remaining=remaining,
+                            error_prefix="修改失败：")
+
+        def delete_spool():
+            spool_id = selected_spool()
+            if spool_id is not None and messagebox.askyesno("确认", f"确定删除第 {spool_id} 卷吗？", parent=dialog):
+                self.run_action(self.service.delete_spool, filament.name, spool_id, error_prefix="删除失败：")
+
+        ttk.Button(form, text="入库新卷", command=add_spool, bootstyle=SUCCESS).pack(side=LEFT, padx=5)
+        ttk.Button(form, text="修改所选卷剩余量", command=set_remaining, bootstyle=WARNING).pack(side=LEFT, padx=5)
+        ttk.Button(form, text="删除所选卷", command=delete_spool, bootstyle=DANGER).pack(side=LEFT, padx=5)
+
+        def on_filament_changed(event):
+            if event.action == RESET or event.obj is filament:
+                load()
+
+        listener = self.tasks.marshal(on_filament_changed)
+        self.filament_manager.subscribe(listener)
+
+        def on_destroy(event):
+            if event.widget is dialog:
+                self.filament_manager.unsubscribe(listener)
+        dialog.bind("<Destroy>", on_destroy)
+        load()
+
+    def show_forecast(self):
+        """库存预测：模型还能打印的盘数、耗材预计用完日期和库存预警，随库存/历史变化增量更新"""
+        forecast = self.service.forecast
+        dialog = ttk.Toplevel(title="库存预测")
+        dialog.geometry("760x640")
+
+        warning_label = ttk.Label(dialog, text="", bootstyle=DANGER, justify=LEFT, wraplength=720)
+        warning_label.pack(fill=X, padx=10, pady=5)
+
+        ttk.Label(dialog, text="模型可打印盘数").pack(anchor=W, padx=10)
+        model_tree = ttk.Treeview(dialog, columns=("prints", "limiting", "status"), show="tree headings", height=8)
+        for col_id, text, width in [("#0", "模型名称", 250), ("prints", "可打印盘数", 100),
+                                    ("limiting", "最先用完的耗材", 200), ("status", "状态", 100)]:
+            model_tree.heading(col_id, text=text)
+            model_tree.column(col_id, width=width, anchor=W if col_id == "#0" else CENTER)
+        model_tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        ttk.Label(dialog, text=f"耗材预计用完日期（按最近 {forecast.window_days} 天的用量估算）").pack(anchor=W, padx=10)
+        filament_tree = ttk.Treeview(dialog, columns=("remaining", "rate", "days", "date", "status"),
+                                     show="tree headings", height=8)
+        for col_id, text, width in [("#0", "耗材名称", 190), ("remaining", "剩余(g)", 90), ("rate", "每天用量(g)", 100),
+                                    ("days", "剩余天数", 90), ("date", "预计用完", 110), ("status", "状态", 90)]:
+            filament_tree.heading(col_id, text=text)
+            filament_tree.column(col_id, width=width, anchor=W if col_id == "#0" else CENTER)
+        filament_tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        def render_capacity(m):
+            capacity = forecast.capacity(m)
+            return views.capacity_row(m, capacity, Forecast.is_low_capacity(capacity))
+
+        def render_outlook(f):
+            outlook = forecast.outlook(f)
+            return views.outlook_row(f, outlook, Forecast.is_running_out(outlook))
+
+        def days_left(f):
+            outlook = forecast.outlook(f)
+            return outlook.days_left if outlook.days_left is not None else float("inf")
+
+        # 盘数少、先用完的排在前面
+        model_sync = TreeSync(model_tree, render_capacity, sort_key=lambda m: forecast.capacity(m).prints)
+        filament_sync = TreeSync(filament_tree, render_outlook, sort_key=days_left)
+
+        def load():
+            def show(result):
+                capacities, outlooks, warnings = result
+                model_sync.reset([m for m, _ in capacities])
+                filament_sync.reset([f for f, _ in outlooks])
+                if warnings:
+                    shown = warnings[:10]
+                    more = f"\n……另有 {len(warnings) - len(shown)} 条" if len(warnings) > len(shown) else ""
+                    warning_label.configure(text="库存预警：\n" + "\n".join(shown) + more)
+                else:
+                    warning_label.configure(text="")
+
+            # 与修改操作串行地在写线程上算好全部结果，主线程只负责填充
+            self.tasks.submit(lambda: (self.service.capacity_report(), self.service.depletion_report(),
+                                       self.service.stock_warnings()),
+                              key="forecast", write=True, on_done=show)
+
+        def on_forecast_changed(event):
+            if not dialog.winfo_exists():
+                return
+            if event.action == RESET:
+                load()
+                return
+            sync = model_sync if event.key[0] == "model" else filament_sync
+            if event.action == REMOVED:
+                sync.remove(event.obj)
+            else:
+                sync.update(event.obj)
+
+        listener = self.tasks.marshal(on_forecast_changed)
+        forecast.subscribe(listener)
+
+        def on_destroy(event):
+            if event.widget is dialog:
+                forecast.unsubscribe(listener)
+        dialog.bind("<Destroy>", on_destroy)
+
+        ttk.Button(dialog, text="刷新", command=load, bootstyle=SECONDARY).pack(pady=5)
+        load()
+
+    def show_farm(self):
+        """打印农场排产：打印机、任务队列和各打印机的排产计划，随任务/库存/模型变化重新排产"""
+        farm = self.service.farm
+        dialog = ttk.Toplevel(title="打印农场排产")
+        dialog.geometry("1000x760")
+
+        printer_frame = ttk.Frame(dialog)
+        printer_frame.pack(fill=X, padx=10, pady=5)
+        ttk.Label(printer_frame, text="打印机（逗号分隔）:").pack(side=LEFT)
+        printer_entry = ttk.Entry(printer_frame)
+        printer_entry.pack(side=LEFT, fill=X, expand=True, padx=5)
+
+        def save_printers():
+            names = printer_entry.get().replace("，", ",").split(",")
+            self.run_action(self.service.set_printers, names, error_prefix="保存失败：")
+
+        ttk.Button(printer_frame, text="保存打印机", command=save_printers, bootstyle=SECONDARY).pack(side=LEFT)
+
+        # 任务队列
+        form = ttk.Frame(dialog)
+        form.pack(fill=X, padx=10, pady=5)
+        ttk.Label(form, text="模型:").pack(side=LEFT)
+        model_combo = ttk.Combobox(form, values=[m.name for m in self.model_manager.models], width=20)
+        model_combo.pack(side=LEFT, padx=2)
+        if selected := self.model_tree.selection():
+            model_combo.set(self.model_tree.item(selected[0], "text"))
+        ttk.Label(form, text="盘数:").pack(side=LEFT, padx=(10, 0))
+        count_entry = ttk.Entry(form, width=6)
+        count_entry.insert(0, "1")
+        count_entry.pack(side=LEFT, padx=2)
+        ttk.Label(form, text="每盘(分钟):").pack(side=LEFT, padx=(10, 0))
+        duration_entry = ttk.Entry(form, width=8)
+        duration_entry.pack(side=LEFT, padx=2)
+        ttk.Label(form, text="限定打印机:").pack(side=LEFT, padx=(10, 0))
+        allowed_entry = ttk.Entry(form, width=16)
+        allowed_entry.pack(side=LEFT, padx=2)
+
+        def add_job():
+            try:
+                count, duration = int(count_entry.get()), float(duration_entry.get())
+            except ValueError:
+                messagebox.showerror("错误", "请输入有效的盘数和每盘时长", parent=dialog)
+                return
+            allowed = [p.strip() for p in allowed_entry.get().replace("，", ",").split(",") if p.strip()]
+            self.run_action(self.service.add_farm_job, model_combo.get(), count, duration, allowed,
+                            error_prefix="加入失败：")
+
+        ttk.Button(form, text="加入队列", command=add_job, bootstyle=SUCCESS).pack(side=LEFT, padx=5)
+
+        job_tree = ttk.Treeview(dialog, columns=("model", "count", "duration", "printers"),
+                                show="tree headings", height=6)
+        for col_id, text, width in [("#0", "任务", 60), ("model", "模型", 250), ("count", "剩余盘数", 90),
+                                    ("duration", "每盘(分钟)", 90), ("printers", "限定打印机", 200)]:
+            job_tree.heading(col_id, text=text)
+            job_tree.column(col_id, width=width, anchor=W if col_id in ("#0", "model") else CENTER)
+        job_tree.pack(fill=X, padx=10, pady=5)
+        job_sync = TreeSync(job_tree, views.farm_job_row)
+
+        def remove_job():
+            if not (chosen := job_tree.selection()):
+                messagebox.showwarning("提示", "请先选择任务！", parent=dialog)
+                return
+            self.run_action(self.service.remove_farm_job, int(job_tree.item(chosen[0], "text")),
+                            error_prefix="删除失败：")
+
+        ttk.Button(dialog, text="删除所选任务", command=remove_job, bootstyle=DANGER).pack(anchor=W, padx=10)
+
+        # 排产计划
+        summary = ttk.Label(dialog, text="")
+        summary.pack(anchor=W, padx=10, pady=(10, 0))
+        unscheduled_label = ttk.Label(dialog, text="", bootstyle=DANGER, justify=LEFT, wraplength=960)
+        unscheduled_label.pack(fill=X, padx=10)
+        plan_tree = ttk.Treeview(dialog, columns=("status", "start", "end"), show="tree headings", height=12)
+        for col_id, text, width in [("#0", "打印机 / 模型", 260), ("status", "状态", 120),
+                                    ("start", "开始", 140), ("end", "完成", 140)]:
+            plan_tree.heading(col_id, text=text)
+            plan_tree.column(col_id, width=width, anchor=W if col_id == "#0" else CENTER)
+        plan_tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        def load():
+            def show(result):
+                if not dialog.winfo_exists():
+                    return
+                printers, jobs, schedule = result
+                if dialog.focus_get() is not printer_entry:
+                    printer_entry.delete(0, END)
+                    printer_entry.insert(0, ", ".join(printers))
+                job_sync.reset(jobs)
+                plates = {p: [] for p in printers}
+                for a in schedule.running + schedule.assignments:
+                    plates.setdefault(a.printer, []).append(a)
+                plan_tree.delete(*plan_tree.get_children())
+                for printer, items in plates.items():
+                    text, values, children = views.printer_row(printer, items, FARM_PLATE_ROWS)
+                    item = plan_tree.insert("", END, text=text, values=values, open=True)
+                    for child_text, child_values, tags in children:
+                        plan_tree.insert(item, END, text=child_text, values=child_values, tags=tags)
+                finish = f"{schedule.makespan:%Y-%m-%d %H:%M}" if schedule.makespan else "-"
+                summary.configure(text=f"正在打印 {len(schedule.running)} 盘，计划 {len(schedule.assignments)} 盘，"
+                                       f"预计全部完成：{finish}")
+                if schedule.unscheduled:
+                    lines = [f"任务 {u.job} {u.model}：{u.count} 盘，{u.reason}" for u in schedule.unscheduled[:10]]
+                    more = len(schedule.unscheduled) - len(lines)
+                    unscheduled_label.configure(text="未排产：\n" + "\n".join(lines)
+                                                     + (f"\n……另有 {more} 个任务" if more > 0 else ""))
+                else:
+                    unscheduled_label.configure(text="")
+
+            # 与修改操作串行地在写线程上排产，主线程只负责填充
+            self.tasks.submit(lambda: (self.service.printers(), self.service.farm_jobs(), self.service.plan_farm()),
+                              key="farm", write=True, on_done=show)
+
+        def selected_printer():
+            if not (chosen := plan_tree.selection()):
+                messagebox.showwarning("提示", "请先选择打印机！", parent=dialog)
+                return None
+            item = plan_tree.parent(chosen[0]) or chosen[0]
+            return plan_tree.item(item, "text")
+
+        def start():
+            if not self._history_ready():
+                return
 
-        # 刷新界面
-        self.refresh_filaments()
-        self.refresh_print_history()
+            def on_done(result):
+                report, plates = result
+                if not report.ok:
+                    messagebox.showerror("耗材不足", format_shortfalls(report.shortfalls), parent=dialog)
+                elif not plates:
+                    messagebox.showinfo("提示", "没有空闲的打印机或可以开始的盘", parent=dialog)
+
+            self.run_action(self.service.start_farm, on_done=on_done, error_prefix="开始失败：")
+
+        def complete():
+            printer = selected_printer()
+            if printer is not None:
+                self.run_action(self.service.complete_farm_plate, printer, error_prefix="操作失败：")
+
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill=X, padx=10, pady=5)
+        ttk.Button(buttons, text="空闲打印机开始下一盘", command=start, bootstyle=SUCCESS).pack(side=LEFT, padx=5)
+        ttk.Button(buttons, text="所选打印机完成当前盘", command=complete, bootstyle=INFO).pack(side=LEFT, padx=5)
+        ttk.Button(buttons, text="刷新", command=load, bootstyle=SECONDARY).pack(side=RIGHT, padx=5)
+
+        # 任务、打印机、库存或模型变化都会改变计划：重新排产（key 相同的旧排产被取消）
+        listener = self.tasks.marshal(lambda event: load() if dialog.winfo_exists() else None)
+        farm.subscribe(listener)
+
+        def on_destroy(event):
+            if event.widget is dialog:
+                farm.unsubscribe(listener)
+        dialog.bind("<Destroy>", on_destroy)
+        load()
+
+    def show_profile(self):
+        """性能统计：各埋点的调用次数、累计/平均/p50/p99 耗时和写入字节数，可导出 JSON 或 cProfile"""
+        dialog = ttk.Toplevel(title="性能统计")
+        dialog.geometry("900x560")
+
+        columns = ("count", "total", "mean", "p50", "p99", "bytes")
+        tree = ttk.Treeview(dialog, columns=columns, show="tree headings")
+        for col_id, text, width in [("#0", "埋点", 330), ("count", "次数", 70), ("total", "累计(ms)", 90),
+                                    ("mean", "平均(ms)", 90), ("p50", "p50(ms)", 90), ("p99", "p99(ms)", 90),
+                                    ("bytes", "写入字节", 100)]:
+            tree.heading(col_id, text=text)
+            tree.column(col_id, width=width, anchor=W if col_id == "#0" else CENTER)
+        tree.pack(fill=BOTH, expand=True, padx=10, pady=5)
+
+        # 直接填充而不用 TreeSync，避免窗口自身的刷新计入 TreeSync 的埋点
+        def fill(stats):
+            tree.delete(*tree.get_children())
+            for stat in stats:  # 按累计耗时降序
+                text, values, _ = views.profile_row(stat)
+                tree.insert("", END, text=text, values=values)
+
+        def refresh():
+            if not dialog.winfo_exists():
+                return
+            fill(instrument.snapshot())
+            dialog.after(PROFILE_REFRESH, refresh)
+
+        def reset():
+            instrument.reset()
+            fill([])
+
+        def export(kind):
+            extension = ".json" if kind == "json" else ".prof"
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=extension,
+                                                filetypes=[(kind, "*" + extension)])
+            if not path:
+                return
+            try:
+                if kind == "json":
+                    instrument.export_json(path)
+                else:
+                    instrument.dump_profile(path)
+            except Exception as e:
+                messagebox.showerror("错误", f"导出失败：{str(e)}", parent=dialog)
 
-        # 生成报告
-        report = "\n".join([f"{k.name}: 使用 {v}g" for k, v in required.items()])
-        messagebox.showinfo("打印成功",
-                            f"已成功打印 {model.quantity} 个 {model.name}\n{report}")
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill=X, padx=10, pady=5)
+        ttk.Button(buttons, text="导出 JSON", command=lambda: export("json"),
+                   bootstyle=PRIMARY).pack(side=LEFT, padx=5)
+        ttk.Button(buttons, text="导出 cProfile", command=lambda: export("cprofile"), bootstyle=PRIMARY,
+                   state=NORMAL if instrument.profiling() else DISABLED).pack(side=LEFT, padx=5)
+        ttk.Button(buttons, text="清零", command=reset, bootstyle=SECONDARY).pack(side=RIGHT, padx=5)
+        refresh()
 
     def show_edit_model(self):
         """显示编辑模型对话框"""
@@ -681,47 +1436,38 @@ class App(ttk.Window):
         quantity_entry.insert(0, str(model.quantity))  # 设置模型数量
         quantity_entry.pack(side=LEFT)
 
+        @timed()
         def on_submit():
             try:
                 # 收集所有耗材数据
                 material_list = []
-                total_cost = 0  # 总成本初始化
-                total_weight = 0  # 总重量初始化
 
                 for row in material_frame.winfo_children():
                     combo = row.winfo_children()[0]  # Combobox for filament
                     entry = row.winfo_children()[1]  # Entry for weight
-                    filament_name = combo.get()
-                    weight = float(entry.get())
-
-                    if not filament_name or weight <= 0:
-                        raise ValueError("耗材信息不完整")
-
                     material_list.append({
-                        "filament": filament_name,
-                        "weight": round(weight, 2)
+                        "filament": combo.get(),
+                        "weight": float(entry.get())
                     })
 
-                    # 计算每个耗材的成本
-                    filament = self.filament_manager.find_filament(filament_name)
-                    if filament:
-                        material_cost = filament.price * weight
-                        total_cost += material_cost
-                        total_weight += weight
+                def on_done(_):
+                    # 更新后的总成本和单价
+                    cost = self.model_manager.cost(model)
 
-                # 更新模型
-                model.name = name_entry.get()
-                model.quantity = int(quantity_entry.get())
-                model.materials = material_list
+                    dialog.destroy()
+                    messagebox.showinfo("成功",
+                                        f"模型信息已更新！\n新总价: {cost.total:.2f}元, 单价: {cost.unit:.2f}元")
 
-                # 更新模型的总成本和单价
-                model_unit_cost = total_cost / model.quantity if model.quantity > 0 else 0
-
-                self.model_manager.save_data()
-                self.refresh_models()
-                dialog.destroy()
-                messagebox.showinfo("成功",
-                                    f"模型信息已更新！\n新总价: {total_cost:.2f}元, 单价: {model_unit_cost:.2f}元")
+                # 更新模型（耗材信息由 PrintService 校验）
+                self.run_action(
+                    self.service.update_model,
+                    model.name,
+                    name=name_entry.get(),
+                    quantity=int(quantity_entry.get()),
+                    materials=material_list,
+                    on_done=on_done,
+                    error_prefix="输入无效: "
+                )
             except Exception as e:
                 messagebox.showerror("错误", f"输入无效: {str(e)}")
 
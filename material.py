@@ -0,0 +1,62 @@
+from collections import namedtuple
+from sys import intern
+
+
+class Material(namedtuple("Material", ["filament", "weight", "filament_id"], defaults=(None,))):
+    """模型/打印记录中的一条耗材用量：(耗材名称, 重量g, 耗材 ID)
+
+    引用以耗材 ID 为准，名称是随耗材改名同步更新的副本；旧数据没有 ID，加载时按名称补上
+    （见 link_materials），耗材被删除后引用退回按名称匹配。
+    用元组代替 {"filament": ..., "weight": ...} 字典以节省内存，耗材名称经过 intern 共享；
+    仍支持 mat["filament"] / mat["weight"] 的写法。
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if isinstance(key, str) else default
+
+    def to_dict(self) -> dict:
+        data = {"filament": self.filament, "weight": self.weight}
+        if self.filament_id is not None:
+            data["filament_id"] = self.filament_id
+        return data
+
+
+def pack_materials(items) -> tuple:
+    """把 [{"filament": ..., "weight": ...}, ...] 或 Material 序列转换为紧凑的 Material 元组"""
+    return tuple(
+        item if isinstance(item, Material) else Material(intern(item["filament"]), item["weight"],
+                                                         item.get("filament_id"))
+        for item in items
+    )
+
+
+def link_materials(materials: tuple, filament_manager) -> tuple:
+    """按耗材 ID 刷新名称，没有 ID 的按名称补上 ID；没有变化时返回原元组（调用方可用 is 判断）"""
+    linked = []
+    changed = False
+    for mat in materials:
+        if mat.filament_id is not None:
+            filament = filament_manager.find_by_id(mat.filament_id)
+            if filament is not None and filament.name != mat.filament:
+                mat = mat._replace(filament=filament.name)
+                changed = True
+        else:
+            filament = filament_manager.find_filament(mat.filament)
+            if filament is not None:
+                mat = mat._replace(filament_id=filament.id)
+                changed = True
+        linked.append(mat)
+    return tuple(linked) if changed else materials
+
+
+def unpack_materials(materials) -> list:
+    return [mat.to_dict() for mat in materials]
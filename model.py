@@ -1,32 +1,52 @@
-import json
+from sys import intern
 from typing import List, Dict
+from events import ChangeNotifier, ADDED, UPDATED, REMOVED, RESET
+from storage import JsonStorage, MODELS
+from cost import CostEngine, compute_cost
+from material import pack_materials, unpack_materials, link_materials
+from instrument import timed
 
 class Model:
-    def __init__(self, name: str, materials: list, quantity: int = 1):
+    __slots__ = ("id", "_name", "_materials", "quantity")
+
+    def __init__(self, name: str, materials: list, quantity: int = 1, model_id: int = None):
         """
-        :param materials: [{"filament": "耗材名称", "weight": 重量(g)}, ...]
+        :param materials: [{"filament": "耗材名称", "weight": 重量(g)}, ...]，内部保存为 Material 元组
         """
+        self.id = model_id  # 稳定的唯一 ID，加入管理器时分配；其他进程改名后仍能对应到同一模型
         self.name = name
         self.materials = materials  # 改为耗材列表
         self.quantity = quantity
 
     @property
-    def total_cost(self, filament_manager) -> float:
-        total = 0
-        for material in self.materials:
-            filament = filament_manager.find_filament(material["filament"])
-            if filament:
-                total += filament.price * material["weight"]
-        return total * self.quantity
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name = intern(value)
 
     @property
+    def materials(self) -> tuple:
+        return self._materials
+
+    @materials.setter
+    def materials(self, value):
+        self._materials = pack_materials(value)
+
+    def total_cost(self, filament_manager) -> float:
+        """每盘总成本（不缓存；批量场景请用 ModelManager.total_cost）"""
+        return compute_cost(self, filament_manager).total
+
     def unit_cost(self, filament_manager) -> float:
-        return self.total_cost(filament_manager) / self.quantity if self.quantity > 0 else 0
+        """单个成本 = 总成本 / 单盘数量"""
+        return compute_cost(self, filament_manager).unit
 
     def to_dict(self) -> dict:
         return {
+            "id": self.id,
             "name": self.name,
-            "materials": self.materials,
+            "materials": unpack_materials(self.materials),
             "quantity": self.quantity
         }
 
@@ -35,32 +55,253 @@ class Model:
         return cls(
             name=data["name"],
             materials=data["materials"],
-            quantity=data.get("quantity", 1)
+            quantity=data.get("quantity", 1),
+            model_id=data.get("id")
         )
-class ModelManager:
-    def __init__(self, filename: str = "models.json"):
+class ModelManager(ChangeNotifier):
+    def __init__(self, filename: str = "models.json", storage=None, filament_manager=None,
+                 autoload: bool = True):
         self.models = []
         self.filename = filename
-        self.load_data()
+        self.storage = storage or JsonStorage(models_file=filename)
+        self.storage.bind(MODELS, lambda: [m.to_dict() for m in self.models])
+        self.storage.watch(MODELS, self.sync)
+        self._by_name = {}  # 名称 -> 模型
+        self._by_id = {}  # ID -> 模型
+        self._next_id = 1
+        # 反向索引：耗材改名/删除时只处理引用它的模型
+        self._dependents = {}  # 耗材 ID -> {id(model): model}
+        self._unlinked = {}  # 没有 ID 的引用（耗材不存在）：耗材名称 -> {id(model): model}
+        self.filament_manager = filament_manager
+        if filament_manager is not None:
+            # 先于成本引擎订阅，改名时先更新模型中的耗材名称
+            filament_manager.subscribe(self.on_filament_changed)
+        # 传入耗材管理器时启用带缓存的成本计算
+        self.costs = CostEngine(filament_manager, self) if filament_manager is not None else None
+        if autoload:
+            self.load_data()
+
+    def _rebuild_index(self):
+        self._by_name = {}
+        self._by_id = {}
+        self._dependents = {}
+        self._unlinked = {}
+        for m in self.models:
+            self._by_name.setdefault(m.name, m)
+            self._by_id[m.id] = m
+            self._track(m)
+        self._next_id = max((i for i in self._by_id if i is not None), default=0) + 1
+
+    def _track(self, model: Model):
+        for mat in model.materials:
+            if mat.filament_id is not None:
+                self._dependents.setdefault(mat.filament_id, {})[id(model)] = model
+            else:
+                self._unlinked.setdefault(mat.filament, {})[id(model)] = model
+
+    def _untrack(self, model: Model):
+        for mat in model.materials:
+            index, key = (self._dependents, mat.filament_id) if mat.filament_id is not None \
+                else (self._unlinked, mat.filament)
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(id(model), None)
+                if not bucket:
+                    del index[key]
+
+    def _link(self, model: Model) -> bool:
+        """按耗材 ID 刷新模型中的耗材名称，旧数据按名称补上 ID；返回是否有变化"""
+        if self.filament_manager is None:
+            return False
+        materials = link_materials(model.materials, self.filament_manager)
+        if materials is model.materials:
+            return False
+        model.materials = materials
+        return True
+
+    def dependents(self, filament_id: int) -> list:
+        """按 ID 引用了该耗材的模型"""
+        return list(self._dependents.get(filament_id, {}).values())
 
     def add_model(self, model: Model):
+        if model.id is None or model.id in self._by_id:
+            # 与耗材相同，共享存储由所有进程统一分配
+            model.id = self.storage.allocate_id(MODELS, self._next_id)
+        self._next_id = max(self._next_id, model.id + 1)
+        self._link(model)
         self.models.append(model)
-        self.save_data()
+        self._by_name.setdefault(model.name, model)
+        self._by_id[model.id] = model
+        self._track(model)
+        self.storage.put(MODELS, model.name, model.to_dict())
+        self._emit(ADDED, model.name, model)
 
+    @timed()
     def find_model(self, name: str) -> Model:
-        for m in self.models:
-            if m.name == name:
-                return m
-        return None
+        return self._by_name.get(name)
+
+    def find_by_id(self, model_id: int) -> Model:
+        return self._by_id.get(model_id)
 
+    def cost(self, model: Model):
+        """模型成本明细（ModelCost），结果会被缓存直到相关耗材或模型变化"""
+        return self.costs.cost(model)
+
+    def total_cost(self, model: Model) -> float:
+        return self.costs.total_cost(model)
+
+    def unit_cost(self, model: Model) -> float:
+        return self.costs.unit_cost(model)
+
+    def update_model(self, model: Model, **changes):
+        """修改模型属性并只保存这一条记录，名称变化时同步更新索引"""
+        old_name = model.name
+        self._untrack(model)
+        for field, value in changes.items():
+            setattr(model, field, value)
+        if "materials" in changes:
+            self._link(model)
+        self._track(model)
+        if model.name != old_name and self._by_name.get(old_name) is model:
+            del self._by_name[old_name]
+            # 若存在同名模型，让下一个顶上
+            other = next((m for m in self.models if m.name == old_name), None)
+            if other is not None:
+                self._by_name[old_name] = other
+            self._by_name.setdefault(model.name, model)
+        elif model.name != old_name:
+            self._by_name.setdefault(model.name, model)
+        self.storage.put(MODELS, model.name, model.to_dict(), old_key=old_name)
+        self._emit(UPDATED, model.name, model, old_key=old_name)
+
+    def delete_model(self, name: str):
+        removed = [m for m in self.models if m.name == name]
+        self.models = [m for m in self.models if m.name != name]
+        self._by_name.pop(name, None)
+        for model in removed:
+            self._by_id.pop(model.id, None)
+            self._untrack(model)
+        self.storage.delete(MODELS, name)
+        for model in removed:
+            self._emit(REMOVED, name, model)
+
+    @timed()
     def save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump([model.to_dict() for model in self.models], f)
+        self.storage.save_all(MODELS)
+
+    @timed()
+    def read_data(self) -> List[Model]:
+        """读取并解析全部模型，不修改管理器状态（可在后台线程调用）"""
+        columns = self.storage.load_columns(MODELS)
+        if columns is not None:
+            with columns:  # 二进制快照：整列读取，耗材用量组合只构建一次
+                sets = columns.material_sets()
+                return [Model(n, sets[m], q, i) for i, n, q, m in zip(
+                    columns.ids("id"), columns.texts("name"), columns.column("quantity"),
+                    columns.column("materials"))]
+        return [Model.from_dict(item) for item in self.storage.load(MODELS)]
 
+    @timed()
+    def install(self, models: List[Model]):
+        """用 read_data 的结果替换当前数据并广播 RESET
+
+        耗材已加载时按 ID 关联耗材；旧数据（按名称引用）补上耗材 ID 后立即写回，
+        没有模型 ID 的旧数据同样按文件顺序补发 ID 并写回
+        """
+        self.models = models
+        ids = [m.id for m in models if m.id is not None]
+        next_id = max(ids, default=0) + 1
+        missing = len(set(ids)) < len(models)
+        if missing:
+            seen = set()
+            for model in models:
+                if model.id is None or model.id in seen:
+                    model.id = next_id
+                    next_id += 1
+                seen.add(model.id)
+        linked = self._link_all()
+        self._rebuild_index()
+        if linked or missing:
+            self.storage.save_all(MODELS)
+        self._emit(RESET)
+
+    def _link_all(self) -> bool:
+        changed = False
+        for model in self.models:
+            changed = self._link(model) or changed
+        return changed
+
+    def on_filament_changed(self, event):
+        """耗材新增/改名/删除时通过反向索引只更新引用它的模型，不扫描全部模型"""
+        if event.action == RESET:
+            # 模型先于耗材加载完成时，在这里完成关联
+            if self._link_all():
+                self._rebuild_index()
+                self.storage.save_all(MODELS)
+                self._emit(RESET)
+            return
+        filament = event.obj
+        if event.action == UPDATED and event.key == event.old_key:
+            return  # 没有改名（如扣料）不影响引用
+        if event.action == REMOVED:
+            # 被删除耗材的引用退回按名称匹配，之后新建同名耗材时自动重新关联
+            affected = self._dependents.get(filament.id, {})
+            relink = lambda m: tuple(mat._replace(filament_id=None) if mat.filament_id == filament.id else mat
+                                     for mat in m.materials)
+        else:
+            affected = dict(self._dependents.get(filament.id, {}))
+            affected.update(self._unlinked.get(filament.name, {}))
+            relink = lambda m: link_materials(m.materials, self.filament_manager)
+        changed = []
+        for model in list(affected.values()):
+            materials = relink(model)
+            if materials != model.materials:
+                self._untrack(model)
+                model.materials = materials
+                self._track(model)
+                changed.append(model)
+        if not changed:
+            return
+        with self.storage.transaction():
+            for model in changed:
+                self.storage.put(MODELS, model.name, model.to_dict())
+        for model in changed:
+            self._emit(UPDATED, model.name, model)
+
+    @timed()
     def load_data(self):
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-                self.models = [Model.from_dict(item) for item in data]
-        except FileNotFoundError:
-            self.models = []
+        self.install(self.read_data())
+
+    @timed()
+    def sync(self, records: List[Dict]):
+        """采用其他进程保存的模型列表（由共享存储回调，不写回存储）
+
+        按 ID 原地更新已有的模型对象（其他进程改名后仍是同一个对象），没有 ID 的旧数据按名称对应；
+        只为实际变化的模型广播事件，改名的 UPDATED 事件带 old_key
+        """
+        by_id = {m.id: m for m in self.models if m.id is not None}
+        by_name = {}
+        for m in self.models:
+            by_name.setdefault(m.name, m)
+        unmatched = {id(m): m for m in self.models}
+        models, events = [], []
+        for data in records:
+            incoming = Model.from_dict(data)
+            model = by_id.get(incoming.id) if incoming.id is not None else by_name.get(incoming.name)
+            if model is None or unmatched.pop(id(model), None) is None:
+                models.append(incoming)
+                events.append((ADDED, incoming, None))
+                continue
+            models.append(model)
+            if model.to_dict() != incoming.to_dict():
+                old_name = model.name
+                model.name = incoming.name
+                model.materials = incoming.materials
+                model.quantity = incoming.quantity
+                events.append((UPDATED, model, old_name))
+        self.models = models
+        self._rebuild_index()
+        for model in unmatched.values():
+            self._emit(REMOVED, model.name, model)
+        for action, model, old_name in events:
+            self._emit(action, model.name, model, old_key=old_name)
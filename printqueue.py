@@ -0,0 +1,76 @@
+from collections import namedtuple
+from datetime import datetime
+from history import PrintHistoryEntry
+from spool import AllocationCursor
+
+# model: Model 对象；count: 打印盘数
+PrintJob = namedtuple("PrintJob", ["model", "count"])
+# available 为 None 表示耗材不存在
+Shortfall = namedtuple("Shortfall", ["filament", "required", "available"])
+# ok 为 False 时 shortfalls 非空、没有任何修改
+PrintResult = namedtuple("PrintResult", ["ok", "requirements", "shortfalls", "entries"])
+
+
+def aggregate_requirements(jobs) -> dict:
+    """汇总所有任务对每种耗材的总需求量：耗材名称 -> 克"""
+    required = {}
+    for job in jobs:
+        for mat in job.model.materials:
+            required[mat.filament] = required.get(mat.filament, 0) + mat.weight * job.count
+    return required
+
+
+def check_stock(filament_manager, required: dict) -> list:
+    """一次性检查全部需求，返回所有不足的耗材（而不是遇到第一个就停止）
+
+    剩余量是各卷的合计（增量维护），不需要逐卷累加
+    """
+    shortfalls = []
+    for name, amount in required.items():
+        filament = filament_manager.find_filament(name)
+        if filament is None:
+            shortfalls.append(Shortfall(name, amount, None))
+        elif filament.remaining < amount:
+            shortfalls.append(Shortfall(name, amount, filament.remaining))
+    return shortfalls
+
+
+def execute_jobs(filament_manager, history_manager, jobs, timestamp: datetime = None) -> PrintResult:
+    """校验并执行一批打印任务：全部扣料和历史记录在同一个事务中提交
+
+    每种耗材整批扣料一次（按扣料策略跨卷分配），再按顺序分给各条记录，记下分卷成本
+    """
+    jobs = [job for job in jobs if job.count > 0]
+    required = aggregate_requirements(jobs)
+    timestamp = timestamp or datetime.now()
+    entries = []
+    with filament_manager.storage.transaction():
+        # 共享存储在事务开始时读入其他进程的扣料，库存检查必须在事务内进行
+        shortfalls = check_stock(filament_manager, required)
+        if shortfalls:
+            return PrintResult(False, required, shortfalls, [])
+        cursors = {}
+        for name, amount in required.items():
+            filament = filament_manager.find_filament(name)
+            cursors[name] = AllocationCursor(filament.id, filament_manager.consume(filament, amount))
+        for job in jobs:
+            for _ in range(job.count):
+                uses = []
+                for mat in job.model.materials:
+                    uses.extend(cursors[mat.filament].take(mat.weight))
+                # Material 元组不可变，各条记录直接共享模型的耗材列表
+                entry = PrintHistoryEntry(job.model.name, job.model.materials, timestamp, spools=uses)
+                history_manager.add_entry(entry)
+                entries.append(entry)
+    return PrintResult(True, required, [], entries)
+
+
+def format_shortfalls(shortfalls) -> str:
+    lines = []
+    for s in shortfalls:
+        if s.available is None:
+            lines.append(f"{s.filament}: 耗材不存在（需要 {s.required:.2f}g）")
+        else:
+            lines.append(f"{s.filament}: 需要 {s.required:.2f}g，当前剩余 {s.available:.2f}g，"
+                         f"缺少 {s.required - s.available:.2f}g")
+    return "\n".join(lines)
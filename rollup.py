@@ -0,0 +1,214 @@
+"""打印历史的用量汇总表：每个耗材/模型在每天、每周、每月的用量（克）、成本和打印次数
+
+汇总表随 add_entry / 删除增量更新，和历史一起持久化（见 PrintHistoryManager.save_rollups）；
+查询不必扫描历史记录；给定起止时间时只按键读取范围内的桶（一年的月汇总最多 12 个桶），
+不限起止时间时遍历每个名称的全部桶。
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from timeutil import from_seconds, as_seconds
+
+PERIODS = ("day", "week", "month")
+KINDS = ("filament", "model")
+PERIOD_NAMES = {"day": "日", "week": "周", "month": "月"}
+VERSION = 2  # 汇总规则变化时加一，旧版本保存的汇总表在加载时重新汇总（2：同一耗材在一条记录中只计一次）
+
+Usage = namedtuple("Usage", ["grams", "cost", "prints"])
+
+
+def bucket_keys(ts: int) -> tuple:
+    """整数秒 -> (日, 周, 月) 桶键；键按字符串排序即按时间排序"""
+    d = from_seconds(ts)
+    year, week, _ = d.isocalendar()
+    return d.strftime("%Y-%m-%d"), f"{year}-W{week:02d}", d.strftime("%Y-%m")
+
+
+def bucket_key(value, period: str) -> str:
+    """datetime / 时间字符串（可只有日期）/ 整数秒 -> 指定周期的桶键"""
+    return bucket_keys(as_seconds(value))[PERIODS.index(period)]
+
+
+def recent_start(period: str, count: int, now: datetime = None) -> datetime:
+    """最近 count 个周期（含当前周期）中第一个周期内的时间点，用作 totals/series 的 start"""
+    now = now or datetime.now()
+    if period == "day":
+        return now - timedelta(days=count - 1)
+    if period == "week":
+        return now - timedelta(weeks=count - 1)
+    months = now.year * 12 + now.month - 1 - (count - 1)
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+class Rollups:
+    """tables[周期][类别][名称][桶键] = [克数, 成本, 打印次数]
+
+    成本优先取记录中按实际扣料的卷计算的成本（分卷成本），旧记录按记录时耗材的单价（price_fn）计算；
+    删除时按该桶内的平均单价扣减，桶内克数减为 0 时成本也归零，不会因为之后调价而留下残差。
+    """
+
+    def __init__(self, price_fn=None):
+        self.price_fn = price_fn or (lambda name: 0)
+        self.tables = {period: {kind: {} for kind in KINDS} for period in PERIODS}
+        self.entries = 0  # 已汇总的记录数和 ID 之和，用于校验持久化的汇总表是否与历史一致
+        self.id_sum = 0
+        self._buckets = {}  # 天数 -> 桶键，同一天的记录只计算一次
+
+    def _keys(self, ts: int) -> tuple:
+        day = ts // 86400
+        keys = self._buckets.get(day)
+        if keys is None:
+            keys = self._buckets[day] = bucket_keys(ts)
+        return keys
+
+    def _apply(self, entry, sign: int):
+        keys = self._keys(entry.ts)
+        # 同一耗材在一条记录中出现多次时合并（按耗材 ID，旧数据没有 ID 时按名称），一次打印只计一次
+        merged = {}  # 键 -> [名称, 克数]
+        for mat in entry.used_materials:
+            key = mat.filament_id if mat.filament_id is not None else mat.filament
+            row = merged.get(key)
+            if row is None:
+                merged[key] = [mat.filament, mat.weight]
+            else:
+                row[1] += mat.weight
+        # (类别, 名称, 克数, 成本)；删除时成本按桶内平均单价扣减，不需要单价
+        rows = []
+        model_grams = model_cost = 0
+        costs = entry.cost_by_filament() if sign > 0 and entry.spools else {}
+        for key, (name, grams) in merged.items():
+            if sign < 0:
+                cost = 0
+            elif key in costs:
+                cost = costs[key]
+            else:
+                cost = grams * self.price_fn(name)
+            rows.append(("filament", name, grams, cost))
+            model_grams += grams
+            model_cost += cost
+        rows.append(("model", entry.model_name, model_grams, model_cost))
+
+        for period, key in zip(PERIODS, keys):
+            table = self.tables[period]
+            for kind, name, grams, cost in rows:
+                buckets = table[kind].setdefault(name, {})
+                row = buckets.get(key)
+                if sign > 0:
+                    if row is None:
+                        buckets[key] = [grams, cost, 1]
+                    else:
+                        row[0] += grams
+                        row[1] += cost
+                        row[2] += 1
+                elif row is not None:
+                    if row[2] <= 1 or row[0] <= grams:
+                        del buckets[key]
+                    else:
+                        row[1] -= row[1] * grams / row[0]
+                        row[0] -= grams
+                        row[2] -= 1
+                if not buckets:
+                    del table[kind][name]
+        self.entries += sign
+        self.id_sum += sign * entry.id
+
+    def add(self, entry):
+        self._apply(entry, 1)
+
+    def remove(self, entry):
+        self._apply(entry, -1)
+
+    def rename(self, kind: str, old: str, new: str):
+        """耗材/模型改名：把旧名称的桶合并到新名称下"""
+        for period in PERIODS:
+            table = self.tables[period][kind]
+            buckets = table.pop(old, None)
+            if buckets is None:
+                continue
+            target = table.setdefault(new, {})
+            for key, row in buckets.items():
+                current = target.get(key)
+                if current is None:
+                    target[key] = row
+                else:
+                    for i, value in enumerate(row):
+                        current[i] += value
+
+    def rebuild(self, entries):
+        """从历史记录重新汇总（成本按当前单价）"""
+        self.tables = {period: {kind: {} for kind in KINDS} for period in PERIODS}
+        self.entries = self.id_sum = 0
+        for entry in entries:
+            self.add(entry)
+
+    def matches(self, entries) -> bool:
+        return self.entries == len(entries) and self.id_sum == sum(entry.id for entry in entries)
+
+    # ------------------ 查询 ------------------
+    @staticmethod
+    def _range(period: str, start, end) -> tuple:
+        return (bucket_key(start, period) if start is not None else "",
+                bucket_key(end, period) if end is not None else "\uffff")
+
+    @staticmethod
+    def _keys_between(period: str, start, end, limit: int):
+        """start 到 end 所在桶之间的全部桶键；超过 limit 个时返回 None（逐个查找不如直接遍历）"""
+        first = from_seconds(as_seconds(start)).date()
+        last = from_seconds(as_seconds(end)).date()
+        if period == "month":
+            lo, hi = first.year * 12 + first.month - 1, last.year * 12 + last.month - 1
+            if hi - lo + 1 > limit:
+                return None
+            days = [date(m // 12, m % 12 + 1, 1) for m in range(lo, hi + 1)]
+        else:
+            step = 1 if period == "day" else 7
+            if period == "week":
+                first -= timedelta(days=first.weekday())
+            if (last - first).days // step + 1 > limit:
+                return None
+            days = [first + timedelta(days=i) for i in range(0, (last - first).days + 1, step)]
+        return [bucket_key(datetime(d.year, d.month, d.day), period) for d in days]
+
+    def series(self, kind: str, name: str, period: str = "month", start=None, end=None) -> list:
+        """某个耗材/模型按周期的用量 [(桶键, Usage), ...]，时间正序；start/end 所在的桶都包含在内"""
+        lo, hi = self._range(period, start, end)
+        buckets = self.tables[period][kind].get(name, {})
+        return sorted((key, Usage(*row)) for key, row in buckets.items() if lo <= key <= hi)
+
+    def totals(self, kind: str = "filament", period: str = "month", start=None, end=None) -> dict:
+        """时间范围内每个耗材/模型的合计 {名称: Usage}（按 period 的桶粒度截取范围）
+
+        起止时间都给定时范围内的桶键有限，桶比范围多的名称按键查找，只读取范围内的桶
+        """
+        lo, hi = self._range(period, start, end)
+        table = self.tables[period][kind]
+        keys = None
+        if start is not None and end is not None and table:
+            keys = self._keys_between(period, start, end, max(map(len, table.values())))
+        result = {}
+        for name, buckets in table.items():
+            if keys is not None and len(keys) < len(buckets):
+                rows = [buckets[key] for key in keys if key in buckets]
+            else:
+                rows = [row for key, row in buckets.items() if lo <= key <= hi]
+            grams = cost = prints = 0
+            for row in rows:
+                grams += row[0]
+                cost += row[1]
+                prints += row[2]
+            if prints:
+                result[name] = Usage(grams, cost, prints)
+        return result
+
+    # ------------------ 持久化 ------------------
+    def to_dict(self) -> dict:
+        return {"version": VERSION, "entries": self.entries, "id_sum": self.id_sum, "tables": self.tables}
+
+    def load(self, data: dict):
+        if data.get("version") != VERSION:
+            raise KeyError("version")
+        self.tables = data["tables"]
+        for period in PERIODS:
+            for kind in KINDS:
+                self.tables[period].setdefault(kind, {})
+        self.entries = data["entries"]
+        self.id_sum = data["id_sum"]
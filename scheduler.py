@@ -0,0 +1,281 @@
+"""打印农场排产：把待打印的任务分配到多台打印机，尽量缩短全部打完的时间（makespan），且不超用耗材
+
+任务为 (模型, 盘数, 每盘时长, 可用打印机)，一盘是最小的调度单位，同一任务的各盘可以在不同打印机上并行。
+采用最长时长优先（LPT）的列表调度：各盘按时长降序，依次放到能打印它的打印机中最早空闲的一台，
+对相同的打印机结果不超过最优 makespan 的 4/3；限定打印机的盘按 时长×打印机总数/可用台数 排序，
+选择少的先排，避免被不限打印机的长任务占满。不限打印机的盘从按空闲时间排序的堆中取打印机（O(log m)），
+限定打印机的盘只比较它允许的几台；上万盘的排产也在几十毫秒内完成。
+耗材：按排产顺序累计每种耗材的用量，会超过当前剩余量的盘不排入计划（列为未排产并说明原因），
+因此计划中的盘全部开始也不会缺料。
+
+开始打印时才扣料并记录历史（与执行打印相同），正在打印的盘固定在各自的打印机上；
+完成一盘后该打印机从完成时刻起空闲。盘的顺序只在任务增删时重新排序，开始/完成后重新排产
+只是按已排好的顺序重新分配打印机。
+排产数据（打印机、任务、正在打印的盘）保存为存储的附属文档 farm。
+"""
+import heapq
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime
+from events import ChangeNotifier, ADDED, UPDATED, REMOVED, RESET
+from timeutil import TIME_FORMAT, as_seconds, from_seconds, parse_time
+from instrument import timed
+
+DOCUMENT = "farm"
+EPSILON = 1e-9
+
+# duration: 每盘分钟数；printers: 允许使用的打印机名称元组，空元组表示不限
+FarmJob = namedtuple("FarmJob", ["id", "model", "count", "duration", "printers"])
+# 排在某台打印机上的一盘；job 为任务 ID，正在打印的盘为 None；start/end 为 datetime
+Assignment = namedtuple("Assignment", ["printer", "model", "start", "end", "job"])
+# 排不进计划的盘：count 盘，reason 为原因
+Unscheduled = namedtuple("Unscheduled", ["job", "model", "count", "reason"])
+# running: 正在打印的盘；assignments: 计划中的盘（按开始时间排序）；makespan: 全部打完的时间，没有任务时为 None
+Schedule = namedtuple("Schedule", ["running", "assignments", "unscheduled", "makespan"])
+
+# 正在打印的一盘（时间为整数秒）
+_Running = namedtuple("_Running", ["model", "start", "end"])
+
+
+class FarmScheduler(ChangeNotifier):
+    """打印机、任务队列和正在打印的盘；plan 根据当前库存给出排产计划
+
+    自身的修改以 (对象类别, 键) 为 key 广播；耗材和模型的变化会改变计划，原样转发为 UPDATED
+    """
+
+    def __init__(self, model_manager, filament_manager, storage):
+        self.model_manager = model_manager
+        self.filament_manager = filament_manager
+        self.storage = storage
+        self.printers = []  # 打印机名称
+        self.jobs = {}  # 任务 ID -> FarmJob（加入顺序）
+        self.running = {}  # 打印机名称 -> _Running
+        self._next_id = 1
+        self._order = None  # 未开始的盘 [(-排序权重, 任务 ID), ...]，升序即先排的在前；任务或打印机变化时作废
+        self._loaded = False
+        model_manager.subscribe(self.on_model_changed)
+        filament_manager.subscribe(self.on_filament_changed)
+
+    # ------------------ 持久化 ------------------
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        data = self.storage.load_document(DOCUMENT)
+        if not data:
+            return
+        self.printers = list(data.get("printers", []))
+        for item in data.get("jobs", []):
+            job = FarmJob(item["id"], item["model"], item["count"], item["duration"], tuple(item.get("printers", ())))
+            self.jobs[job.id] = job
+        for printer, item in data.get("running", {}).items():
+            self.running[printer] = _Running(item["model"], parse_time(item["start"]), parse_time(item["end"]))
+        self._next_id = data.get("next_id", max(self.jobs, default=0) + 1)
+
+    def _save(self):
+        self.storage.save_document(DOCUMENT, {
+            "printers": self.printers,
+            "jobs": [job._asdict() for job in self.jobs.values()],
+            "running": {printer: {"model": r.model,
+                                  "start": from_seconds(r.start).strftime(TIME_FORMAT),
+                                  "end": from_seconds(r.end).strftime(TIME_FORMAT)}
+                        for printer, r in self.running.items()},
+            "next_id": self._next_id,
+        })
+
+    # ------------------ 打印机 ------------------
+    def printer_list(self) -> list:
+        self._ensure_loaded()
+        return list(self.printers)
+
+    def set_printers(self, names):
+        """设置打印机列表；正在打印的打印机不能移除"""
+        self._ensure_loaded()
+        names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+        busy = [printer for printer in self.running if printer not in names]
+        if busy:
+            raise ValueError(f"打印机正在打印，不能移除：{'、'.join(busy)}")
+        self.printers = names
+        self._order = None
+        self._save()
+        self._emit(RESET)
+
+    # ------------------ 任务 ------------------
+    def job_list(self) -> list:
+        self._ensure_loaded()
+        return list(self.jobs.values())
+
+    def add_job(self, model: str, count: int, duration: float, printers=()) -> FarmJob:
+        """加入 count 盘，每盘 duration 分钟；printers 为空表示任意打印机都可以打印"""
+        return self.add_jobs([(model, count, duration, printers)])[0]
+
+    def add_jobs(self, items) -> list:
+        """批量加入 [(模型名称, 盘数, 每盘分钟, 打印机), ...]：全部校验通过后一次保存"""
+        self._ensure_loaded()
+        jobs = []
+        for model, count, duration, printers in items:
+            if count <= 0:
+                raise ValueError(f"{model}: 盘数必须大于0")
+            if duration <= 0:
+                raise ValueError(f"{model}: 每盘时长必须大于0")
+            unknown = [p for p in printers if p not in self.printers]
+            if unknown:
+                raise ValueError(f"{model}: 打印机不存在：{'、'.join(unknown)}")
+            jobs.append(FarmJob(self._next_id + len(jobs), model, int(count), float(duration), tuple(printers)))
+        self._next_id += len(jobs)
+        for job in jobs:
+            self.jobs[job.id] = job
+        self._order = None
+        self._save()
+        for job in jobs:
+            self._emit(ADDED, ("job", job.id), job)
+        return jobs
+
+    def remove_job(self, job_id: int) -> FarmJob:
+        self._ensure_loaded()
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            raise ValueError(f"任务 {job_id} 不存在")
+        self._order = None
+        self._save()
+        self._emit(REMOVED, ("job", job_id), job)
+        return job
+
+    def _key(self, job) -> tuple:
+        """排产顺序：每盘时长按可用打印机的比例放大（不限打印机时就是时长）"""
+        allowed = sum(1 for p in job.printers if p in self.printers) if job.printers else len(self.printers)
+        return -round(job.duration * 60 * len(self.printers) / max(allowed, 1)), job.id
+
+    def _ordered(self) -> list:
+        if self._order is None:
+            self._order = sorted(self._key(job) for job in self.jobs.values() for _ in range(job.count))
+        return self._order
+
+    # ------------------ 排产 ------------------
+    def _requirements(self, job, index: dict):
+        """一盘的 (可用打印机序号列表或 None, [(耗材名称, 克), ...])；无法排产时返回原因"""
+        model = self.model_manager.find_model(job.model)
+        if model is None:
+            return f"模型 {job.model} 不存在"
+        grams = {}
+        for mat in model.materials:
+            grams[mat.filament] = grams.get(mat.filament, 0) + mat.weight
+        for name in grams:
+            if self.filament_manager.find_filament(name) is None:
+                return f"耗材 {name} 不存在"
+        allowed = None
+        if job.printers:
+            allowed = [index[p] for p in job.printers if p in index]
+            if not allowed:
+                return "没有可用的打印机"
+        return allowed, list(grams.items())
+
+    @timed()
+    def plan(self, now=None) -> Schedule:
+        """按当前库存排产；空闲的打印机从 now 起可用，正在打印的从预计完成时起可用"""
+        self._ensure_loaded()
+        now = as_seconds(now or datetime.now())
+        free = [max(now, self.running[p].end) if p in self.running else now for p in self.printers]
+        index = {p: i for i, p in enumerate(self.printers)}
+        heap = [(t, i) for i, t in enumerate(free)]  # 条目的时间与 free 不一致时已过期，弹出时跳过
+        heapq.heapify(heap)
+        budget = {}  # 耗材名称 -> 还能分配的克数
+        needs = {}  # 任务 ID -> _requirements 的结果
+        skipped = {}  # 任务 ID -> [盘数, 原因]
+        planned = []  # (开始, 打印机序号, 结束, 任务)
+        for _, job_id in self._ordered():
+            job = self.jobs[job_id]
+            need = needs.get(job_id)
+            if need is None:
+                need = needs[job_id] = self._requirements(job, index) if self.printers else "没有打印机"
+            if isinstance(need, str):
+                skipped.setdefault(job_id, [0, need])[0] += 1
+                continue
+            allowed, grams = need
+            seconds = round(job.duration * 60)
+            for name, amount in grams:
+                if name not in budget:
+                    budget[name] = self.filament_manager.find_filament(name).remaining
+            short = [name for name, amount in grams if budget[name] < amount - EPSILON]
+            if short:
+                skipped.setdefault(job_id, [0, f"耗材不足：{'、'.join(short)}"])[0] += 1
+                continue
+            for name, amount in grams:
+                budget[name] -= amount
+
+            if allowed is None:
+                while heap[0][0] != free[heap[0][1]]:
+                    heapq.heappop(heap)
+                start, i = heap[0]
+                free[i] = start + seconds
+                heapq.heapreplace(heap, (free[i], i))
+            else:
+                i = min(allowed, key=lambda k: (free[k], k))
+                start = free[i]
+                free[i] = start + seconds
+                heapq.heappush(heap, (free[i], i))
+            planned.append((start, i, free[i], job))
+
+        planned.sort(key=lambda item: item[:2])
+        assignments = [Assignment(self.printers[i], job.model, from_seconds(start), from_seconds(end), job.id)
+                       for start, i, end, job in planned]
+        running = [Assignment(p, self.running[p].model, from_seconds(self.running[p].start),
+                              from_seconds(self.running[p].end), None)
+                   for p in self.printers if p in self.running]
+        unscheduled = [Unscheduled(job_id, self.jobs[job_id].model, count, reason)
+                       for job_id, (count, reason) in skipped.items()]
+        ends = [end for _, _, end, _ in planned] + [r.end for r in self.running.values()]
+        return Schedule(running, assignments, unscheduled, from_seconds(max(ends)) if ends else None)
+
+    def next_plates(self, now=None) -> list:
+        """空闲的打印机接下来要开始的盘（每台最多一盘）"""
+        first = {}
+        for a in self.plan(now).assignments:
+            if a.printer not in self.running:
+                first.setdefault(a.printer, a)
+        return list(first.values())
+
+    # ------------------ 开始/完成 ------------------
+    def begin(self, plates):
+        """plates（next_plates 的结果）已扣料开始打印：从任务中移出，固定在各自的打印机上"""
+        self._ensure_loaded()
+        order = self._ordered()
+        for a in plates:
+            job = self.jobs[a.job]
+            if job.count > 1:
+                self.jobs[job.id] = job._replace(count=job.count - 1)
+            else:
+                del self.jobs[job.id]
+            del order[bisect_left(order, self._key(job))]
+            self.running[a.printer] = _Running(a.model, as_seconds(a.start), as_seconds(a.end))
+        self._save()
+        for a in plates:
+            self._emit(UPDATED, ("printer", a.printer), a)
+
+    def complete(self, printer: str):
+        """打印机上的一盘已完成，打印机空闲；返回完成的盘"""
+        self._ensure_loaded()
+        plate = self.running.pop(printer, None)
+        if plate is None:
+            raise ValueError(f"打印机 {printer} 没有正在打印的任务")
+        self._save()
+        done = Assignment(printer, plate.model, from_seconds(plate.start), from_seconds(plate.end), None)
+        self._emit(UPDATED, ("printer", printer), done)
+        return done
+
+    # ------------------ 事件 ------------------
+    def on_model_changed(self, event):
+        """模型改名时任务跟随新名称；增删模型和修改用量都会改变计划"""
+        if event.action == UPDATED and event.old_key is not None and event.old_key != event.key:
+            self._ensure_loaded()
+            renamed = False
+            for job in list(self.jobs.values()):
+                if job.model == event.old_key:
+                    self.jobs[job.id] = job._replace(model=event.key)
+                    renamed = True
+            if renamed:
+                self._save()
+        self._emit(UPDATED if event.action != RESET else RESET, ("model", event.key), event.obj)
+
+    def on_filament_changed(self, event):
+        self._emit(UPDATED if event.action != RESET else RESET, ("filament", event.key), event.obj)
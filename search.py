@@ -0,0 +1,179 @@
+import threading
+from itertools import count
+from events import ADDED, UPDATED, REMOVED, RESET
+
+NGRAM = 3  # 索引的 n-gram 长度（中文名称多为短词，3 个字符足以大幅缩小候选集）
+
+
+def normalize(text) -> str:
+    """统一大小写和首尾空白，搜索不区分大小写"""
+    return str(text).strip().casefold()
+
+
+def ngrams(term: str, n: int = NGRAM) -> set:
+    """term 的所有 n-gram；比 n 短的词整体作为一个 gram"""
+    if len(term) <= n:
+        return {term}
+    return {term[i:i + n] for i in range(len(term) - n + 1)}
+
+
+class SearchIndex:
+    """增量维护的 n-gram 子串索引（前缀搜索是子串搜索的特例）
+
+    两级倒排：gram -> 词，词 -> 记录。重复出现的词（如历史中的模型名称、耗材种类）
+    只建一次 gram，内存随不同词的数量增长而不是随记录数增长。
+    fields(obj) 返回该记录可被搜索的文本；监听管理器的变更事件保持同步，
+    首次搜索（或 build）时才为 RESET 后的数据建立索引。
+    """
+
+    def __init__(self, fields, source=None, n: int = NGRAM):
+        self.fields = fields
+        self.source = source  # 返回全部记录的函数，RESET 后用于重建
+        self.n = n
+        self._grams = {}     # gram -> {词}
+        self._postings = {}  # 词 -> {id(obj)}
+        self._objs = {}      # id(obj) -> (序号, obj, 词元组)
+        self._seq = count()
+        self._stale = source is not None
+        self._lock = threading.RLock()  # 写线程更新、主线程搜索
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_built()
+            return len(self._objs)
+
+    # ------------------ 维护 ------------------
+    def _terms(self, obj) -> tuple:
+        terms = {normalize(text) for text in self.fields(obj) if text}
+        terms.discard("")
+        return tuple(terms)
+
+    def add(self, obj):
+        with self._lock:
+            if not self._stale:  # 过期时重建会包含它
+                self._add(obj, next(self._seq))
+
+    def _add(self, obj, seq):
+        terms = self._terms(obj)
+        self._objs[id(obj)] = (seq, obj, terms)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                for gram in ngrams(term, self.n):
+                    self._grams.setdefault(gram, set()).add(term)
+            postings.add(id(obj))
+
+    def remove(self, obj):
+        with self._lock:
+            if not self._stale:
+                self._remove(obj)
+
+    def _remove(self, obj):
+        record = self._objs.pop(id(obj), None)
+        if record is None:
+            return None
+        for term in record[2]:
+            postings = self._postings[term]
+            postings.discard(id(obj))
+            if postings:
+                continue
+            del self._postings[term]  # 最后一个引用该词的记录：清理 gram
+            for gram in ngrams(term, self.n):
+                terms = self._grams[gram]
+                terms.discard(term)
+                if not terms:
+                    del self._grams[gram]
+        return record
+
+    def update(self, obj):
+        """记录原地修改后重新索引（旧词元在 _objs 中，可正确移除）；保留原有顺序"""
+        with self._lock:
+            if self._stale:
+                return
+            record = self._remove(obj)
+            self._add(obj, record[0] if record is not None else next(self._seq))
+
+    def reset(self, objs=None):
+        """清空；传入 objs 时立即重建，否则标记为过期，下次搜索时再从 source 重建"""
+        with self._lock:
+            self._grams, self._postings, self._objs = {}, {}, {}
+            self._seq = count()
+            self._stale = objs is None and self.source is not None
+            for obj in objs or ():
+                self._add(obj, next(self._seq))
+
+    def build(self):
+        """立即建立（过期的）索引，可在后台线程预先调用"""
+        with self._lock:
+            self._ensure_built()
+
+    def _ensure_built(self):
+        if self._stale:
+            self._stale = False
+            for obj in list(self.source()):
+                self._add(obj, next(self._seq))
+
+    def on_change(self, event):
+        """订阅管理器的变更事件"""
+        if event.action == ADDED:
+            self.add(event.obj)
+        elif event.action == UPDATED:
+            self.update(event.obj)
+        elif event.action == REMOVED:
+            self.remove(event.obj)
+        elif event.action == RESET:
+            self.reset()
+
+    # ------------------ 查询 ------------------
+    def _matching_terms(self, token: str) -> list:
+        if len(token) < self.n:
+            # 短查询：直接扫描不同的词（数量远小于记录数）
+            return [term for term in self._postings if token in term]
+        candidates = None
+        for gram in sorted(ngrams(token, self.n), key=lambda g: len(self._grams.get(g, ()))):
+            terms = self._grams.get(gram)
+            if not terms:
+                return []
+            candidates = set(terms) if candidates is None else candidates & terms
+            if not candidates:
+                return []
+        # gram 全部命中不代表连续出现，逐个确认
+        return [term for term in candidates if token in term]
+
+    def search(self, query: str, limit: int = None, reverse: bool = False) -> list:
+        """返回匹配 query 的记录（多个关键词以空格分隔，需全部匹配），按加入顺序排列
+
+        任一字段包含关键词即为匹配。reverse=True 时最新加入的在前。
+        """
+        tokens = [normalize(t) for t in query.split()]
+        with self._lock:
+            self._ensure_built()
+            if not tokens:
+                records = list(self._objs.values())
+            else:
+                ids = None
+                for token in sorted(tokens, key=len, reverse=True):  # 长关键词更有选择性
+                    matched = set()
+                    for term in self._matching_terms(token):
+                        matched |= self._postings[term]
+                    ids = matched if ids is None else ids & matched
+                    if not ids:
+                        return []
+                records = [self._objs[i] for i in ids]
+        records.sort(key=lambda r: r[0], reverse=reverse)
+        if limit is not None:
+            records = records[:limit]
+        return [r[1] for r in records]
+
+
+def filament_fields(f):
+    return (f.name, f.category)
+
+
+def model_fields(m):
+    return (m.name,) + tuple(mat.filament for mat in m.materials)
+
+
+def history_fields(entry):
+    return (entry.model_name,)
@@ -0,0 +1,384 @@
+"""与界面无关的业务层：耗材/模型增删改、成本计算、打印扣料与历史查询
+
+本模块及其依赖不导入 tkinter / ttkbootstrap，可在无界面的打印农场控制机上使用，
+也是命令行（cli.py）和图形界面（main.py）共用的入口。
+"""
+from datetime import datetime
+from filament import Filament, FilamentManager
+from spool import Spool
+from timeutil import to_seconds
+from model import Model, ModelManager
+from history import PrintHistoryManager
+from storage import open_storage
+from printqueue import PrintJob, PrintResult, execute_jobs
+from search import SearchIndex, filament_fields, model_fields, history_fields
+from forecast import Forecast
+from scheduler import FarmScheduler
+from slicer import ImportReport, SliceResult, find_files, match_filament, read_files
+from instrument import timed
+try:
+    from bulk import CostMatrix
+except ImportError:  # numpy 是可选依赖，没有时逐个模型计算
+    CostMatrix = None
+
+
+class PrintService:
+    def __init__(self, storage=None, autoload: bool = True):
+        """autoload=False 时不读取数据，由调用方自行调用各管理器的 read_data/install（如界面后台加载）"""
+        self.storage = storage or open_storage()
+        self.filaments = FilamentManager(storage=self.storage, autoload=autoload)
+        self.models = ModelManager(storage=self.storage, filament_manager=self.filaments, autoload=autoload)
+        self.history = PrintHistoryManager(storage=self.storage, autoload=autoload, price_fn=self._price,
+                                           filament_manager=self.filaments)
+        self.forecast = Forecast(self.filaments, self.models, self.history)
+        self.farm = FarmScheduler(self.models, self.filaments, self.storage)
+        self._matrix = None  # 批量成本矩阵（首次 bulk_costs 时建立，之后随变更事件增量更新）
+
+        # 搜索索引随管理器的变更事件增量更新（RESET 后在首次搜索时重建）
+        self.filament_index = SearchIndex(filament_fields, lambda: self.filaments.filaments)
+        self.model_index = SearchIndex(model_fields, lambda: self.models.models)
+        self.history_index = SearchIndex(history_fields, lambda: self.history.history)
+        self.filaments.subscribe(self.filament_index.on_change)
+        self.models.subscribe(self.model_index.on_change)
+        self.history.subscribe(self.history_index.on_change)
+
+    def close(self):
+        self.history.save_rollups()
+        self.storage.close()
+
+    def _price(self, filament_name: str) -> float:
+        """用量汇总计算成本用的单价（耗材已删除时为 0）"""
+        filament = self.filaments.find_filament(filament_name)
+        return filament.price if filament else 0
+
+    # ------------------ 耗材 ------------------
+    def get_filament(self, name: str) -> Filament:
+        filament = self.filaments.find_filament(name)
+        if filament is None:
+            raise ValueError(f"耗材 {name} 不存在")
+        return filament
+
+    def add_filament(self, name: str, category: str, total_price: float, initial_amount: int) -> Filament:
+        name = name.strip()
+        if not name:
+            raise ValueError("名称不能为空")
+        self._check_filament_name(name)
+        filament = Filament(name=name, category=category,
+                            total_price=float(total_price), initial_amount=int(initial_amount))
+        self.filaments.add_filament(filament)
+        return filament
+
+    def _check_filament_name(self, name: str, current: Filament = None):
+        """名称是耗材的查找键（SQLite 存储中也是主键），不允许与其他耗材重名"""
+        existing = self.filaments.find_filament(name)
+        if existing is not None and existing is not current:
+            raise ValueError(f"耗材 {name} 已存在")
+
+    def update_filament(self, name: str, /, **changes) -> Filament:
+        """修改耗材（name/category/total_price/initial_amount/remaining）"""
+        filament = self.get_filament(name)
+        if "name" in changes:
+            changes["name"] = changes["name"].strip()
+            if not changes["name"]:
+                raise ValueError("名称不能为空")
+            self._check_filament_name(changes["name"], filament)
+        if changes.get("total_price", 1) <= 0:
+            raise ValueError("总价必须大于0")
+        if changes.get("initial_amount", 1) <= 0:
+            raise ValueError("总量必须大于0")
+        if changes.get("remaining", 0) < 0:
+            raise ValueError("剩余量不能为负数")
+        self.filaments.update_filament(filament, **changes)
+        return filament
+
+    # ------------------ 多卷库存 ------------------
+    def spools(self, name: str) -> list:
+        """耗材的各卷，按扣料顺序排列（已用完的在最后）"""
+        filament = self.get_filament(name)
+        ordered = filament.stock.order()
+        return ordered + [s for s in filament.spools if s not in ordered]
+
+    def _get_spool(self, filament: Filament, spool_id: int) -> Spool:
+        spool = filament.stock.find(spool_id)
+        if spool is None:
+            raise ValueError(f"耗材 {filament.name} 没有编号为 {spool_id} 的卷")
+        return spool
+
+    def add_spool(self, name: str, price: float, amount: float, added: datetime = None) -> Spool:
+        """入库一卷（同一种耗材的新批次，价格可以不同）"""
+        filament = self.get_filament(name)
+        if float(price) < 0:
+            raise ValueError("价格不能为负数")
+        if float(amount) <= 0:
+            raise ValueError("总量必须大于0")
+        spool = Spool(float(price), float(amount), added=to_seconds(added or datetime.now()))
+        self.filaments.add_spool(filament, spool)
+        return spool
+
+    def update_spool(self, name: str, spool_id: int, **changes) -> Spool:
+        """修改一卷（price/amount/remaining）"""
+        filament = self.get_filament(name)
+        spool = self._get_spool(filament, spool_id)
+        if changes.get("price", 0) < 0:
+            raise ValueError("价格不能为负数")
+        if changes.get("amount", 1) <= 0:
+            raise ValueError("总量必须大于0")
+        if changes.get("remaining", 0) < 0:
+            raise ValueError("剩余量不能为负数")
+        self.filaments.update_spool(filament, spool, **changes)
+        return spool
+
+    def delete_spool(self, name: str, spool_id: int):
+        filament = self.get_filament(name)
+        self.filaments.remove_spool(filament, self._get_spool(filament, spool_id))
+
+    def filament_dependents(self, name: str) -> list:
+        """引用了该耗材的模型（反向索引，不扫描全部模型）"""
+        return self.models.dependents(self.get_filament(name).id)
+
+    def delete_filament(self, name: str) -> list:
+        """删除耗材，返回受影响的模型（其成本不再包含该耗材，直到新建同名耗材）"""
+        affected = self.filament_dependents(name)
+        self.filaments.delete_filament(name)
+        return affected
+
+    # ------------------ 模型 ------------------
+    def get_model(self, name: str) -> Model:
+        model = self.models.find_model(name)
+        if model is None:
+            raise ValueError(f"模型 {name} 不存在")
+        return model
+
+    @staticmethod
+    def _check_materials(materials: list) -> list:
+        checked = []
+        for mat in materials:
+            if not mat.get("filament") or float(mat.get("weight", 0)) <= 0:
+                raise ValueError("耗材信息不完整")
+            checked.append({"filament": mat["filament"], "weight": round(float(mat["weight"]), 2)})
+        return checked
+
+    def _check_model_name(self, name: str, current: Model = None):
+        """与耗材相同，模型名称不允许重复"""
+        existing = self.models.find_model(name)
+        if existing is not None and existing is not current:
+            raise ValueError(f"模型 {name} 已存在")
+
+    def add_model(self, name: str, materials: list, quantity: int = 1) -> Model:
+        self._check_model_name(name)
+        model = Model(name=name, materials=self._check_materials(materials), quantity=int(quantity))
+        self.models.add_model(model)
+        return model
+
+    def update_model(self, name: str, /, **changes) -> Model:
+        """修改模型（name/materials/quantity）"""
+        model = self.get_model(name)
+        if "name" in changes:
+            self._check_model_name(changes["name"], model)
+        if "materials" in changes:
+            changes["materials"] = self._check_materials(changes["materials"])
+        self.models.update_model(model, **changes)
+        return model
+
+    def delete_model(self, name: str):
+        self.get_model(name)
+        self.models.delete_model(name)
+
+    def slice_materials(self, result: SliceResult, aliases: dict = None) -> tuple:
+        """切片文件的耗材用量 -> ([{"filament": 库存耗材名称, "weight": 克}, ...], 未匹配的名称集合)
+
+        找不到对应耗材的按切片软件中的名称保存，之后添加同名耗材时自动关联
+        """
+        materials, unmatched = [], set()
+        for name, grams in result.materials:
+            filament = match_filament(name, self.filaments, aliases)
+            if filament is None or self.filaments.find_filament(filament) is None:
+                unmatched.add(filament or name)
+            materials.append({"filament": filament or name, "weight": grams})
+        return materials, unmatched
+
+    @timed()
+    def import_sliced(self, paths, aliases: dict = None, quantity: int = 1, workers: int = None,
+                      on_progress=None) -> ImportReport:
+        """从切片文件（G-code / 3MF，可传目录）批量创建模型，模型名称取文件名
+
+        即 read_sliced + create_sliced；界面把两步分开提交，解析期间不占用写线程
+        """
+        results, failed = self.read_sliced(paths, workers, on_progress)
+        return self.create_sliced(results, failed, aliases, quantity)
+
+    @staticmethod
+    def read_sliced(paths, workers: int = None, on_progress=None) -> tuple:
+        """在多个进程中并行解析切片文件，返回 ([SliceResult, ...] 按路径排序, [(路径, 错误信息), ...])
+
+        只读文件，不访问库存数据，可在任意线程调用
+        """
+        results, failed = [], []
+        for result in read_files(find_files(paths), workers, on_progress):
+            if isinstance(result, SliceResult):
+                results.append(result)
+            else:
+                failed.append(result)
+        results.sort(key=lambda r: r.path)
+        return results, failed
+
+    def create_sliced(self, results, failed=(), aliases: dict = None, quantity: int = 1) -> ImportReport:
+        """按 read_sliced 的结果创建模型：已存在的同名模型跳过，
+        全部模型在一个事务中创建（JSON 存储只写一次文件）
+        """
+        created, skipped, failed, unmatched = [], [], list(failed), set()
+        with self.storage.transaction():
+            for result in results:
+                if self.models.find_model(result.name) is not None:
+                    skipped.append(result.name)
+                    continue
+                materials, missing = self.slice_materials(result, aliases)
+                try:
+                    created.append(self.add_model(result.name, materials, quantity))
+                except ValueError as e:
+                    failed.append((result.path, str(e)))
+                    continue
+                unmatched |= missing
+        return ImportReport(created, skipped, failed, unmatched)
+
+    # ------------------ 成本 ------------------
+    def model_cost(self, name: str):
+        """模型成本明细 ModelCost(total, unit, weight, materials)"""
+        return self.models.cost(self.get_model(name))
+
+    def all_costs(self) -> dict:
+        """模型名称 -> ModelCost"""
+        return {m.name: self.models.cost(m) for m in self.models.models}
+
+    @timed()
+    def bulk_costs(self) -> dict:
+        """全部模型的 名称 -> (total, unit, weight)，用于列出全部模型的成本
+
+        装有 numpy 时由 CostMatrix 一次向量化算出（结果与逐个计算相同）；
+        没有 numpy 时退回逐个模型的成本缓存。矩阵不加锁，只在修改数据的同一线程中使用（如命令行）
+        """
+        if CostMatrix is None:
+            return self.all_costs()
+        if self._matrix is None:
+            self._matrix = CostMatrix(self.filaments, self.models)
+        return self._matrix.results()
+
+    # ------------------ 打印 ------------------
+    @timed()
+    def use_model(self, name: str, count: int = 1):
+        """打印一个模型 count 盘，返回 PrintResult（耗材不足时不做任何修改）"""
+        return self.run_jobs([(name, count)])
+
+    @timed()
+    def run_jobs(self, jobs, timestamp: datetime = None):
+        """批量打印 [(模型名称, 盘数), ...]，全部校验后一次提交"""
+        print_jobs = [PrintJob(self.get_model(name), int(count)) for name, count in jobs]
+        return execute_jobs(self.filaments, self.history, print_jobs, timestamp)
+
+    # ------------------ 打印农场排产 ------------------
+    def printers(self) -> list:
+        return self.farm.printer_list()
+
+    def set_printers(self, names):
+        self.farm.set_printers(names)
+
+    def farm_jobs(self) -> list:
+        """排产队列中的任务 [FarmJob, ...]（加入顺序，盘数为尚未开始的盘数）"""
+        return self.farm.job_list()
+
+    def add_farm_job(self, model: str, count: int, duration: float, printers=()):
+        """排产队列加入 count 盘 model，每盘 duration 分钟，printers 为允许的打印机（空表示不限）"""
+        return self.add_farm_jobs([(model, count, duration, printers)])[0]
+
+    def add_farm_jobs(self, jobs) -> list:
+        """批量加入 [(模型名称, 盘数, 每盘分钟, 打印机), ...]，有一个无效时都不加入"""
+        jobs = [(model, int(count), float(duration), tuple(printers)) for model, count, duration, printers in jobs]
+        for model, *_ in jobs:
+            self.get_model(model)
+        return self.farm.add_jobs(jobs)
+
+    def remove_farm_job(self, job_id: int):
+        return self.farm.remove_job(job_id)
+
+    def plan_farm(self, now: datetime = None):
+        """按当前库存排产，返回 Schedule（正在打印的盘、计划、排不进的盘和全部打完的时间）"""
+        return self.farm.plan(now)
+
+    @timed()
+    def start_farm(self, now: datetime = None) -> tuple:
+        """空闲的打印机开始计划中的下一盘：一次扣料并记录历史，返回 (PrintResult, 开始的盘)
+
+        耗材不足（如其他进程刚刚扣料）时不开始任何一盘
+        """
+        now = now or datetime.now()
+        plates = self.farm.next_plates(now)
+        if not plates:
+            return PrintResult(True, {}, [], []), []
+        result = self.run_jobs([(a.model, 1) for a in plates], now)
+        if result.ok:
+            self.farm.begin(plates)
+        return result, plates
+
+    def complete_farm_plate(self, printer: str):
+        """打印机上的一盘已完成，该打印机空闲；返回完成的盘"""
+        return self.farm.complete(printer)
+
+    # ------------------ 历史 ------------------
+    def latest_history(self, limit: int = 20, model_name: str = None, filament: str = None) -> list:
+        """最新的 limit 条打印记录（时间倒序），可按模型/耗材筛选"""
+        return self.history.latest(limit, model_name, filament)
+
+    def history_for_model(self, name: str) -> list:
+        return self.history.for_model(name)
+
+    def history_between(self, start=None, end=None, model_name: str = None, filament: str = None) -> list:
+        """时间在 [start, end) 内的打印记录（时间正序）"""
+        return self.history.between(start, end, model_name, filament)
+
+    def delete_history(self, entry_id: int):
+        if not self.history.delete_entry(entry_id):
+            raise ValueError(f"打印记录 {entry_id} 不存在")
+
+    # ------------------ 用量统计 ------------------
+    def usage(self, kind: str = "filament", period: str = "month", start=None, end=None) -> list:
+        """时间范围内各耗材/模型的用量合计 [(名称, Usage(克数, 成本, 次数)), ...]，按克数降序
+
+        读取按 period 汇总的用量表，start/end 所在的桶都包含在内
+        """
+        totals = self.history.rollups.totals(kind, period, start, end)
+        return sorted(totals.items(), key=lambda item: -item[1].grams)
+
+    def usage_series(self, name: str, kind: str = "filament", period: str = "month", start=None, end=None) -> list:
+        """单个耗材/模型按周期的用量 [(桶键, Usage), ...]"""
+        return self.history.rollups.series(kind, name, period, start, end)
+
+    # ------------------ 库存预测 ------------------
+    def capacity_report(self) -> list:
+        """每个模型用现有库存还能打印的盘数 [(模型, ModelCapacity), ...]，盘数少的在前"""
+        rows = [(m, self.forecast.capacity(m)) for m in self.models.models]
+        return sorted(rows, key=lambda row: row[1].prints)
+
+    def depletion_report(self) -> list:
+        """每种耗材的消耗速度和预计用完日期 [(耗材, FilamentOutlook), ...]，先用完的在前"""
+        rows = [(f, self.forecast.outlook(f)) for f in self.filaments.filaments]
+        return sorted(rows, key=lambda row: _days_left(row[1]))
+
+    def stock_warnings(self) -> list:
+        return self.forecast.warnings()
+
+    # ------------------ 搜索 ------------------
+    def search_filaments(self, query: str, limit: int = None) -> list:
+        """名称或种类包含关键词的耗材（空格分隔多个关键词，不区分大小写）"""
+        return self.filament_index.search(query, limit)
+
+    def search_models(self, query: str, limit: int = None) -> list:
+        """名称或所用耗材名称包含关键词的模型"""
+        return self.model_index.search(query, limit)
+
+    def search_history(self, query: str, limit: int = None) -> list:
+        """模型名称包含关键词的打印记录（最新的在前）"""
+        return self.history_index.search(query, limit, reverse=True)
+
+
+def _days_left(outlook) -> float:
+    return outlook.days_left if outlook.days_left is not None else float("inf")
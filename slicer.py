@@ -0,0 +1,291 @@
+"""切片文件导入：从 G-code / 3MF 的元数据读取每种耗材的用量（克），用于批量创建模型
+
+只读元数据，不解析打印路径：
+- G-code：内存映射后只扫描开头和结尾的注释区（PrusaSlicer / OrcaSlicer / Bambu Studio
+  的用量和配置都写在这两处，Cura / Simplify3D 写在开头），几百 MB 的文件也只读取约 1 MB；
+- 3MF：zip 条目按需读取，不解压整个文件。优先读取 Metadata/slice_info.config 中每个耗材的
+  used_g，耗材名称取自 Metadata/project_settings.config；没有时退回逐行扫描内嵌 G-code 的注释。
+只有长度没有重量时按耗材密度和直径换算（缺省按 PLA 1.24 g/cm³、1.75 mm）。
+
+read_files 在多个进程中并行解析，同时在途的文件数有上限，内存占用与文件大小和数量无关。
+用法：
+    python slicer.py 文件或目录 ...     —— 只解析并打印每个文件的耗材用量
+"""
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from xml.etree import ElementTree
+
+GCODE_SUFFIXES = (".gcode", ".gco", ".g")
+SUFFIXES = GCODE_SUFFIXES + (".3mf",)
+HEAD_BYTES = 256 * 1024  # 扫描开头多少字节的注释
+TAIL_BYTES = 1024 * 1024  # 扫描结尾多少字节的注释（配置区）
+DEFAULT_DENSITY = 1.24  # g/cm³
+DEFAULT_DIAMETER = 1.75  # mm
+PENDING_PER_WORKER = 4  # 每个进程最多排队的文件数
+
+# name: 模型名称（文件名）；materials: [(切片软件中的耗材名称, 克), ...]
+SliceResult = namedtuple("SliceResult", ["path", "name", "materials"])
+# created: 新建的模型；skipped: 已存在而跳过的模型名称；failed: [(路径, 错误信息)]；
+# unmatched: 找不到对应耗材、按切片软件中的名称保存的耗材名称
+ImportReport = namedtuple("ImportReport", ["created", "skipped", "failed", "unmatched"])
+
+# 只保留这些注释键，其余配置项直接丢弃
+_KEYS = {
+    "filament used [g]", "total filament weight [g]", "plastic weight",
+    "filament used [mm]", "total filament length [mm]", "filament used",
+    "filament_settings_id", "filament_type", "filament_density", "filament_diameter",
+}
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+# ------------------ G-code 注释 ------------------
+def _comment(line: bytes, meta: dict):
+    """解析一行注释 "; 键 = 值" / "; 键: 值"，只保留关心的键（先出现的优先）"""
+    if not line.startswith(b";"):
+        return
+    text = line[1:].decode("utf-8", "replace").strip()
+    eq, colon = text.find("="), text.find(":")
+    cut = min(i for i in (eq, colon) if i >= 0) if eq >= 0 or colon >= 0 else -1
+    if cut < 0:
+        return
+    key = text[:cut].strip().lower()
+    if key in _KEYS and key not in meta:
+        meta[key] = text[cut + 1:].strip()
+
+
+def _scan_gcode(path: str) -> dict:
+    meta = {}
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("文件为空")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            windows = [(0, min(size, HEAD_BYTES))]
+            if size > HEAD_BYTES:
+                windows.append((max(HEAD_BYTES, size - TAIL_BYTES), size))
+            for start, end in windows:
+                chunk = data[start:end]
+                # 窗口边界上的半行丢弃
+                if end < size:
+                    chunk = chunk[:chunk.rfind(b"\n") + 1]
+                if start > 0:
+                    chunk = chunk[chunk.find(b"\n") + 1:]
+                for line in chunk.splitlines():
+                    _comment(line.lstrip(), meta)
+    return meta
+
+
+def _stream_gcode(stream) -> dict:
+    """逐行扫描（3MF 中内嵌的 G-code 无法随机访问）"""
+    meta = {}
+    for line in stream:
+        _comment(line.lstrip(), meta)
+    return meta
+
+
+def _numbers(value: str) -> list:
+    return [float(v) for v in _NUMBER.findall(value or "")]
+
+
+def _names(value: str) -> list:
+    if not value:
+        return []
+    if '"' in value:
+        return [name.strip() for name in _QUOTED.findall(value)]
+    return [name.strip() for name in re.split(r"[;,]", value)]
+
+
+def _grams(meta: dict) -> list:
+    for key in ("filament used [g]", "total filament weight [g]", "plastic weight"):
+        if key in meta:
+            grams = _numbers(meta[key])
+            return grams[:1] if key == "plastic weight" else grams  # "3.70 g (0.01 lb)"
+    # 只有长度：按截面积和密度换算，Cura 的 "Filament used" 单位是米
+    if "filament used [mm]" in meta:
+        lengths = _numbers(meta["filament used [mm]"])
+    elif "total filament length [mm]" in meta:
+        lengths = _numbers(meta["total filament length [mm]"])
+    elif "filament used" in meta:
+        lengths = [v * 1000 for v in _numbers(meta["filament used"])]
+    else:
+        raise ValueError("没有找到耗材用量（不是切片软件生成的 G-code？）")
+    densities = _numbers(meta.get("filament_density"))
+    diameters = _numbers(meta.get("filament_diameter"))
+    grams = []
+    for i, length in enumerate(lengths):
+        density = densities[i] if i < len(densities) else DEFAULT_DENSITY
+        diameter = diameters[i] if i < len(diameters) else DEFAULT_DIAMETER
+        grams.append(length * math.pi * (diameter / 2) ** 2 / 1000 * density)
+    return grams
+
+
+def _materials(meta: dict) -> list:
+    """每个挤出机/耗材槽的 (名称, 克)，用量为 0 的略过"""
+    names = _names(meta.get("filament_settings_id")) or _names(meta.get("filament_type"))
+    materials = []
+    for i, grams in enumerate(_grams(meta)):
+        grams = round(grams, 2)
+        if grams > 0:
+            name = names[i] if i < len(names) and names[i] else f"T{i}"
+            materials.append((name, grams))
+    return materials
+
+
+# ------------------ 3MF ------------------
+def _read_3mf(path: str) -> list:
+    with zipfile.ZipFile(path) as archive:
+        entries = set(archive.namelist())
+        if "Metadata/slice_info.config" in entries:
+            names = []
+            if "Metadata/project_settings.config" in entries:
+                with archive.open("Metadata/project_settings.config") as f:
+                    names = _setting_names(json.load(f))
+            used = {}  # 耗材序号 -> [名称, 克]，多个盘的用量累加
+            with archive.open("Metadata/slice_info.config") as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag == "filament":
+                        index = int(element.get("id", 0))
+                        grams = float(element.get("used_g") or 0)
+                        name = (names[index - 1] if 0 < index <= len(names) else "") or element.get("type")
+                        row = used.setdefault(index, [name or f"T{index - 1}", 0.0])
+                        row[1] += grams
+                    element.clear()
+            return [(name, round(grams, 2)) for _, (name, grams) in sorted(used.items()) if round(grams, 2) > 0]
+        for entry in sorted(entries):
+            if entry.startswith("Metadata/") and entry.endswith(".gcode"):
+                with archive.open(entry) as f:
+                    return _materials(_stream_gcode(f))
+    raise ValueError("3MF 中没有切片用量信息（请在切片软件中切片后导出）")
+
+
+def _setting_names(settings) -> list:
+    """project_settings.config 中各耗材槽的预设名称；结构不对时抛出 ValueError"""
+    if not isinstance(settings, dict):
+        raise ValueError("project_settings.config 格式不正确")
+    names = settings.get("filament_settings_id", [])
+    if isinstance(names, str):
+        names = [names]
+    if not isinstance(names, list):
+        raise ValueError("project_settings.config 中的 filament_settings_id 格式不正确")
+    return [name if isinstance(name, str) else "" for name in names]
+
+
+# ------------------ 入口 ------------------
+def model_name(path: str) -> str:
+    """文件名去掉扩展名：齿轮.gcode.3mf -> 齿轮"""
+    name = os.path.basename(path)
+    for suffix in (".3mf",) + GCODE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def read_file(path: str) -> SliceResult:
+    """解析一个切片文件；不是切片文件或没有用量信息时抛出 ValueError"""
+    if path.lower().endswith(".3mf"):
+        materials = _read_3mf(path)
+    elif path.lower().endswith(GCODE_SUFFIXES):
+        materials = _materials(_scan_gcode(path))
+    else:
+        raise ValueError(f"不支持的文件类型: {os.path.basename(path)}")
+    if not materials:
+        raise ValueError("没有耗材用量")
+    return SliceResult(path, model_name(path), materials)
+
+
+def _try_read(path: str):
+    """进程池中执行：错误以文字返回，不让一个坏文件中断整批导入
+
+    格式异常的文件可能引发任何异常（不只是 ValueError），都记为该文件失败
+    """
+    try:
+        return read_file(path)
+    except Exception as e:
+        return path, str(e) or type(e).__name__
+
+
+def find_files(paths) -> list:
+    """展开目录（递归），只保留支持的文件类型；按路径排序"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in files if name.lower().endswith(SUFFIXES))
+        else:
+            found.append(path)
+    return sorted(found)
+
+
+def read_files(paths, workers: int = None, on_progress=None):
+    """并行解析多个文件，逐个产出 SliceResult 或 (路径, 错误信息)（顺序不定）
+
+    on_progress(已完成, 总数) 在调用方线程中回调；workers=1 或只有一个文件时不启动子进程
+    """
+    paths = list(paths)
+    total = len(paths)
+    workers = min(workers or os.cpu_count() or 1, total) or 1
+    if workers == 1:
+        for done, path in enumerate(paths, 1):
+            yield _try_read(path)
+            if on_progress is not None:
+                on_progress(done, total)
+        return
+    pending = iter(paths)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        while True:
+            # 在途的任务数有上限：结果取走之后才继续提交
+            while len(running) < workers * PENDING_PER_WORKER:
+                path = next(pending, None)
+                if path is None:
+                    break
+                running.add(pool.submit(_try_read, path))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += 1
+                yield future.result()
+                if on_progress is not None:
+                    on_progress(done, total)
+
+
+def match_filament(name: str, filament_manager, aliases: dict = None):
+    """切片软件中的耗材名称 -> 库存中的耗材名称，找不到时返回 None
+
+    依次尝试：别名表、同名、忽略大小写和空白、去掉 "@打印机" 后缀（Bambu/Orca 的预设名）
+    """
+    if aliases and name in aliases:
+        return aliases[name]
+    if filament_manager.find_filament(name) is not None:
+        return name
+    wanted = {_normalize(name), _normalize(name.split("@")[0])}
+    for f in filament_manager.filaments:
+        if _normalize(f.name) in wanted:
+            return f.name
+    return None
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python slicer.py 文件或目录 ...")
+        sys.exit(1)
+    for result in read_files(find_files(sys.argv[1:])):
+        if isinstance(result, SliceResult):
+            usage = ", ".join(f"{name}({grams}g)" for name, grams in result.materials)
+            print(f"{result.name}\t{usage}")
+        else:
+            print(f"失败\t{result[0]}\t{result[1]}", file=sys.stderr)
@@ -0,0 +1,350 @@
+"""二进制列式快照：冷启动时不做逐条 JSON 解析和时间字符串解析
+
+文件布局（小端或大端由头部标明）：
+    头部      magic(8) 版本(H) 表号(H) 行数(I) 列数(I) 字节序(1s) 填充(3x)
+    列目录    每列：名称(24s) 类型码(1s) 填充(7x) 偏移(Q) 字节数(Q)
+    列数据    定长数值数组（array 类型码），每列按 8 字节对齐
+
+字符串（名称、种类）统一放进字符串表（strings.data，以 \0 分隔的 UTF-8），列中只保存序号；
+耗材用量按组合去重（同一模型的打印记录共用一组），列中保存组合序号。
+多卷耗材的各卷、打印记录的分卷成本是可变长度的子表：起始位置列 + 扁平的明细列。
+数值列按 double 保存，原为整数的值另有 "<列名>#int" 标记列，读回时恢复为 int。
+
+读取时整个文件 mmap 映射，每列用 memoryview.cast 整列一次性解码为列表（不逐条解析）；
+加载时用到的列全部解码，记录对象也一次全部构造，不按行延迟解码。
+JSON 仍是交换/导出格式；用法：
+    python snapshot.py to-binary [目录]   —— 把 JSON 数据（含历史日志）写成二进制快照
+    python snapshot.py to-json [目录]     —— 把二进制快照导出为 JSON 并删除快照
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from sys import intern
+from material import Material
+from spool import Spool, SpoolUse, unpack_uses
+from storage import FILAMENTS, MODELS, TABLES
+from timeutil import TIME_FORMAT, from_seconds, parse_time
+from writebehind import atomic_write
+
+MAGIC = b"PRTSNAP\x01"
+VERSION = 1
+SUFFIX = ".snap"
+_HEADER = struct.Struct("<8sHHII1s3x")
+_COLUMN = struct.Struct("<24s1s7xQQ")
+_ALIGN = 8
+_NONE = -1  # 整数列中表示 None（ID 都是正数）
+
+
+def snapshot_path(json_path: str) -> str:
+    """JSON 文件对应的二进制快照路径：filaments.json -> filaments.snap"""
+    return os.path.splitext(json_path)[0] + SUFFIX
+
+
+# ------------------ 写入 ------------------
+class _Builder:
+    def __init__(self):
+        self.columns = {}  # 列名 -> array
+        self._strings = {}  # 字符串 -> 序号
+        self._sets = {}  # 耗材用量组合 -> 序号
+        self._set_start = array("q", [0])
+        self._mat_filament = array("i")
+        self._mat_fid = array("q")
+        self._mat_weight = []
+
+    def string(self, text: str) -> int:
+        index = self._strings.get(text)
+        if index is None:
+            index = self._strings[text] = len(self._strings)
+        return index
+
+    def material_set(self, materials: list) -> int:
+        key = tuple((m["filament"], m["weight"], m.get("filament_id")) for m in materials)
+        index = self._sets.get(key)
+        if index is None:
+            index = self._sets[key] = len(self._sets)
+            for name, weight, filament_id in key:
+                self._mat_filament.append(self.string(name))
+                self._mat_weight.append(weight)
+                self._mat_fid.append(_NONE if filament_id is None else filament_id)
+            self._set_start.append(len(self._mat_filament))
+        return index
+
+    def nested(self, prefix: str, rows: list, fields: list):
+        """可变长度的子表：rows 为每条记录的明细列表（没有为空），fields 为 [(列名, 取值函数, 类型)]"""
+        starts = array("q", [0])
+        for items in rows:
+            starts.append(starts[-1] + len(items))
+        self.columns[prefix + ".start"] = starts
+        flat = [item for items in rows for item in items]
+        for name, get, kind in fields:
+            if kind == "d":
+                self.numbers(f"{prefix}.{name}", [get(item) for item in flat])
+            else:
+                self.ints(f"{prefix}.{name}", [get(item) for item in flat])
+
+    def ints(self, name: str, values, typecode: str = "q"):
+        self.columns[name] = array(typecode, (_NONE if v is None else v for v in values))
+
+    def numbers(self, name: str, values: list):
+        """double 列；有整数值时附加标记列以便原样读回"""
+        self.columns[name] = array("d", values)
+        flags = array("B", (isinstance(v, int) for v in values))
+        if any(flags):
+            self.columns[name + "#int"] = flags
+
+    def finish(self) -> dict:
+        if self._sets:
+            self.columns["sets.start"] = self._set_start
+            self.columns["mat.filament"] = self._mat_filament
+            self.columns["mat.filament_id"] = self._mat_fid
+            self.numbers("mat.weight", self._mat_weight)
+        self.columns["strings.data"] = array("B", "\0".join(self._strings).encode("utf-8"))
+        return self.columns
+
+
+def _build(table: str, records: list) -> dict:
+    b = _Builder()
+    if table == FILAMENTS:
+        b.ints("id", [r.get("id") for r in records])
+        b.ints("name", [b.string(r["name"]) for r in records], "i")
+        b.ints("category", [b.string(r.get("category", "未分类")) for r in records], "i")
+        b.numbers("total_price", [r["total_price"] for r in records])
+        b.numbers("initial_amount", [r["initial_amount"] for r in records])
+        b.numbers("remaining", [r.get("remaining", r["initial_amount"]) for r in records])
+        if any(r.get("spools") for r in records):
+            b.nested("spool", [r.get("spools") or [] for r in records], [
+                ("id", lambda s: s.get("id"), "q"),
+                ("price", lambda s: s["price"], "d"),
+                ("amount", lambda s: s["amount"], "d"),
+                ("remaining", lambda s: s.get("remaining", s["amount"]), "d"),
+                ("added", lambda s: parse_time(s["added"]) if s.get("added") else None, "q"),
+            ])
+    elif table == MODELS:
+        b.ints("id", [r.get("id") for r in records])
+        b.ints("name", [b.string(r["name"]) for r in records], "i")
+        b.ints("quantity", [r.get("quantity", 1) for r in records])
+        b.ints("materials", [b.material_set(r["materials"]) for r in records], "i")
+    else:
+        b.ints("id", [r.get("id") for r in records])
+        b.ints("ts", [parse_time(r["timestamp"]) for r in records])
+        b.ints("model", [b.string(r["model_name"]) for r in records], "i")
+        b.ints("materials", [b.material_set(r["used_materials"]) for r in records], "i")
+        if any(r.get("spools") for r in records):
+            b.nested("use", [r.get("spools") or [] for r in records], [
+                ("filament_id", lambda u: u.get("filament_id"), "q"),
+                ("spool", lambda u: u.get("spool"), "q"),
+                ("weight", lambda u: u["weight"], "d"),
+                ("cost", lambda u: u["cost"], "d"),
+            ])
+    return b.finish()
+
+
+def encode(table: str, records: list) -> bytes:
+    columns = _build(table, records)
+    directory_end = _HEADER.size + _COLUMN.size * len(columns)
+    offset = -(-directory_end // _ALIGN) * _ALIGN
+    entries, chunks = [], []
+    for name, values in columns.items():
+        raw = values.tobytes()
+        entries.append(_COLUMN.pack(name.encode("ascii"), values.typecode.encode("ascii"), offset, len(raw)))
+        padded = -(-len(raw) // _ALIGN) * _ALIGN
+        chunks.append(raw + b"\0" * (padded - len(raw)))
+        offset += padded
+    header = _HEADER.pack(MAGIC, VERSION, TABLES.index(table), len(records), len(columns),
+                          b"<" if sys.byteorder == "little" else b">")
+    head = header + b"".join(entries)
+    return head + b"\0" * (-(-len(head) // _ALIGN) * _ALIGN - len(head)) + b"".join(chunks)
+
+
+def write_snapshot(path: str, table: str, records: list):
+    """把记录（to_dict 的结果）写成二进制快照（临时文件 + 原子替换）"""
+    atomic_write(path, encode(table, records))
+
+
+# ------------------ 读取 ------------------
+class Snapshot:
+    """只读的快照：列在首次访问时从 mmap 解码，用完需 close()（或用 with）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, table, self.count, ncols, order = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"不是有效的快照文件: {path}")
+            self.table = TABLES[table]
+            self._swap = order != (b"<" if sys.byteorder == "little" else b">")
+            self._columns = {}
+            for i in range(ncols):
+                name, typecode, offset, size = _COLUMN.unpack_from(self._map, _HEADER.size + i * _COLUMN.size)
+                self._columns[name.rstrip(b"\0").decode("ascii")] = (typecode.decode("ascii"), offset, size)
+        except BaseException:
+            self._map.close()
+            raise
+        self._cache = {}
+        self.journal = []  # 打印历史快照之后的日志操作（由存储填充）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def has(self, name: str) -> bool:
+        return name in self._columns
+
+    def column(self, name: str) -> list:
+        """解码一列为 Python 列表（整列一次转换，不逐条解析）"""
+        values = self._cache.get(name)
+        if values is None:
+            typecode, offset, size = self._columns[name]
+            if self._swap:
+                raw = array(typecode, self._map[offset:offset + size])
+                raw.byteswap()
+                values = raw.tolist()
+            else:
+                # 视图必须全部释放，之后才能关闭 mmap
+                with memoryview(self._map) as whole, whole[offset:offset + size] as view, \
+                        view.cast(typecode) as typed:
+                    values = typed.tolist()
+            flags = self._columns.get(name + "#int")
+            if flags is not None:
+                values = [int(v) if flag else v for v, flag in zip(values, self.column(name + "#int"))]
+            self._cache[name] = values
+        return values
+
+    def ids(self, name: str) -> list:
+        """ID 列；旧版快照没有该列时全为 None（加载后由管理器补发）"""
+        if not self.has(name):
+            return [None] * self.count
+        return [None if v == _NONE else v for v in self.column(name)]
+
+    def strings(self) -> list:
+        values = self._cache.get("#strings")
+        if values is None:
+            typecode, offset, size = self._columns["strings.data"]
+            # 整体解码一次再按分隔符切分，比逐个解码快
+            values = [intern(text) for text in self._map[offset:offset + size].decode("utf-8").split("\0")]
+            self._cache["#strings"] = values
+        return values
+
+    def texts(self, name: str) -> list:
+        strings = self.strings()
+        return [strings[i] for i in self.column(name)]
+
+    def material_sets(self) -> list:
+        """耗材用量组合 -> Material 元组（各组合只构建一次，记录之间共享）"""
+        values = self._cache.get("#sets")
+        if values is None:
+            values = []
+            if self.has("sets.start"):
+                starts = self.column("sets.start")
+                names = self.texts("mat.filament")
+                weights = self.column("mat.weight")
+                fids = self.ids("mat.filament_id")
+                materials = [Material(n, w, f) for n, w, f in zip(names, weights, fids)]
+                values = [tuple(materials[a:b]) for a, b in zip(starts, starts[1:])]
+            self._cache["#sets"] = values
+        return values
+
+    def _nested(self, prefix: str, build) -> list:
+        """可变长度子表 -> 每条记录的明细列表；没有该子表时为 None"""
+        if not self.has(prefix + ".start"):
+            return None
+        starts = self.column(prefix + ".start")
+        items = build()
+        return [items[a:b] for a, b in zip(starts, starts[1:])]
+
+    def spools(self) -> list:
+        """耗材表：每条耗材的 Spool 列表（只有一卷的旧格式耗材为空列表）；没有多卷数据时为 None"""
+        return self._nested("spool", lambda: [
+            Spool(p, a, r, t, i) for i, p, a, r, t in zip(
+                self.ids("spool.id"), self.column("spool.price"), self.column("spool.amount"),
+                self.column("spool.remaining"), self.ids("spool.added"))])
+
+    def spool_uses(self) -> list:
+        """打印历史：每条记录的 SpoolUse 元组列表；没有分卷成本数据时为 None"""
+        rows = self._nested("use", lambda: [
+            SpoolUse(f, s, w, c) for f, s, w, c in zip(
+                self.ids("use.filament_id"), self.ids("use.spool"), self.column("use.weight"),
+                self.column("use.cost"))])
+        return None if rows is None else [tuple(uses) for uses in rows]
+
+    def records(self) -> list:
+        """转换回 to_dict 格式的记录（用于导出 JSON 和通用的 load）"""
+        if self.table == FILAMENTS:
+            records = [
+                {"id": i, "name": n, "category": c, "total_price": p, "initial_amount": a, "remaining": r}
+                for i, n, c, p, a, r in zip(self.ids("id"), self.texts("name"), self.texts("category"),
+                                            self.column("total_price"), self.column("initial_amount"),
+                                            self.column("remaining"))
+            ]
+            for record, spools in zip(records, self.spools() or ()):
+                if spools:
+                    record["spools"] = [s.to_dict() for s in spools]
+            return records
+        sets = [[m.to_dict() for m in materials] for materials in self.material_sets()]
+        if self.table == MODELS:
+            return [
+                {"id": i, "name": n, "materials": sets[m], "quantity": q}
+                for i, n, q, m in zip(self.ids("id"), self.texts("name"), self.column("quantity"),
+                                      self.column("materials"))
+            ]
+        records = [
+            {"id": i, "model_name": n, "used_materials": sets[m],
+             "timestamp": from_seconds(ts).strftime(TIME_FORMAT)}
+            for i, ts, n, m in zip(self.ids("id"), self.column("ts"), self.texts("model"),
+                                   self.column("materials"))
+        ]
+        for record, uses in zip(records, self.spool_uses() or ()):
+            if uses:
+                record["spools"] = unpack_uses(uses)
+        return records
+
+
+def read_records(path: str) -> list:
+    with Snapshot(path) as snapshot:
+        return snapshot.records()
+
+
+# ------------------ 转换 ------------------
+def to_binary(directory: str = "."):
+    """JSON（含历史日志）-> 二进制快照；同时把日志合并进 JSON 快照，两种格式内容一致"""
+    from storage import JsonStorage
+    source = JsonStorage(**_files(directory))
+    for table in TABLES:
+        records = source.load(table)
+        write_snapshot(snapshot_path(source.files[table]), table, records)
+        source.replace_all(table, records)
+
+
+def to_json(directory: str = "."):
+    """二进制快照（含历史日志）-> JSON，然后删除快照，之后以 JSON 文件为准"""
+    from storage import JsonStorage
+    source = JsonStorage(binary=True, **_files(directory))
+    target = JsonStorage(**_files(directory))
+    for table in TABLES:
+        target.replace_all(table, source.load(table))
+        path = snapshot_path(source.files[table])
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _files(directory: str) -> dict:
+    return dict(filaments_file=os.path.join(directory, "filaments.json"),
+                models_file=os.path.join(directory, "models.json"),
+                history_file=os.path.join(directory, "print_history.json"))
+
+
+if __name__ == "__main__":
+    commands = {"to-binary": to_binary, "to-json": to_json}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("用法: python snapshot.py to-binary|to-json [目录]")
+        sys.exit(1)
+    commands[sys.argv[1]](sys.argv[2] if len(sys.argv) > 2 else ".")
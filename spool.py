@@ -0,0 +1,230 @@
+"""多卷库存：同一种耗材可以有多卷（不同批次、不同价格），打印时按策略从各卷扣料
+
+每种耗材的卷放在一个堆中，堆顶是下一卷要用的：
+- fifo：先入库的先用（默认）；
+- least：剩余最少的先用，尽快用完零头卷，减少换卷浪费。
+扣除涉及 k 卷时只需 O(k log n)；总价、总量、剩余量的合计随增删卷和扣料增量维护，
+库存检查直接读取合计。打印记录按实际扣料的卷记下成本（SpoolUse）。
+策略可由环境变量 PRINTING_SPOOL_POLICY=fifo|least 指定。
+"""
+import heapq
+import os
+from collections import namedtuple
+from itertools import count
+from timeutil import TIME_FORMAT, from_seconds, parse_time
+
+FIFO = "fifo"
+LEAST = "least"
+POLICIES = (FIFO, LEAST)
+DEFAULT_POLICY = os.environ.get("PRINTING_SPOOL_POLICY", FIFO)
+SPOOLS = "spools"  # 分配卷 ID 的计数器名称（storage.allocate_id）
+EPSILON = 1e-9  # 剩余量小于此值视为用完（浮点误差）
+
+# 一条打印记录从某一卷扣除的用量 (耗材 ID, 卷 ID, 克, 成本)；成本按该卷的单价计算
+SpoolUse = namedtuple("SpoolUse", ["filament_id", "spool_id", "weight", "cost"])
+
+
+class Spool:
+    __slots__ = ("id", "price", "amount", "remaining", "added")
+
+    def __init__(self, price: float, amount: float, remaining: float = None, added: int = None,
+                 spool_id: int = None):
+        self.id = spool_id  # 只有一卷的旧数据没有 ID，添加第二卷时补发
+        self.price = price  # 整卷价格
+        self.amount = amount  # 整卷克数
+        self.remaining = remaining if remaining is not None else amount
+        self.added = added  # 入库时间（整数秒），旧数据为 None，视为最早入库
+
+    @property
+    def unit_price(self) -> float:
+        return self.price / self.amount if self.amount > 0 else 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "price": self.price,
+            "amount": self.amount,
+            "remaining": self.remaining,
+            "added": from_seconds(self.added).strftime(TIME_FORMAT) if self.added is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Spool':
+        return cls(
+            price=data["price"],
+            amount=data["amount"],
+            remaining=data.get("remaining", data["amount"]),
+            added=parse_time(data["added"]) if data.get("added") else None,
+            spool_id=data.get("id")
+        )
+
+
+class SpoolPool:
+    """一种耗材的全部卷：消耗顺序的堆，以及总价/总量/剩余量的合计
+
+    堆在第一次扣料时才建立（大多数耗材只有一卷）；卷被移除时只把堆中的条目作废，弹出时跳过。
+    """
+
+    def __init__(self, spools, policy: str = DEFAULT_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的扣料策略: {policy}")
+        self.spools = list(spools)  # 入库顺序
+        self.policy = policy
+        self._heap = None
+        self._entries = {}  # id(卷) -> 堆条目 [键, 序号, 卷]
+        self._seq = count()
+        self._recount()
+
+    def _recount(self):
+        """重新计算合计（增删卷时调用，同时消除扣料累积的浮点误差）"""
+        self.total_price = sum(s.price for s in self.spools)
+        self.initial_amount = sum(s.amount for s in self.spools)
+        self.remaining = sum(s.remaining for s in self.spools)
+
+    # ------------------ 堆 ------------------
+    def _key(self, spool: Spool) -> tuple:
+        added = spool.added if spool.added is not None else -1
+        return (spool.remaining, added) if self.policy == LEAST else (added,)
+
+    def _push(self, spool: Spool):
+        entry = [self._key(spool), next(self._seq), spool]
+        self._entries[id(spool)] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _drop(self, spool: Spool):
+        entry = self._entries.pop(id(spool), None)
+        if entry is not None:
+            entry[-1] = None  # 作废，弹出时跳过
+
+    def _ensure_heap(self) -> list:
+        if self._heap is None:
+            self._heap = []
+            for spool in self.spools:
+                if spool.remaining > EPSILON:
+                    entry = [self._key(spool), next(self._seq), spool]
+                    self._entries[id(spool)] = entry
+                    self._heap.append(entry)
+            heapq.heapify(self._heap)
+        return self._heap
+
+    def order(self) -> list:
+        """按消耗顺序排列的卷（用于显示，不修改堆）"""
+        position = {id(s): i for i, s in enumerate(self.spools)}
+        return sorted((s for s in self.spools if s.remaining > EPSILON),
+                      key=lambda s: self._key(s) + (position[id(s)],))
+
+    # ------------------ 扣料 ------------------
+    def allocate(self, grams: float) -> list:
+        """从堆顶的卷开始扣除 grams 克，返回 [(卷, 克), ...]；剩余量不足时不做任何修改并抛出 ValueError
+
+        用完的卷移出（至少保留一卷，用来记住这种耗材的价格）
+        """
+        if grams > self.remaining + EPSILON:
+            raise ValueError(f"剩余量不足：需要 {grams:.2f}g，剩余 {self.remaining:.2f}g")
+        heap = self._ensure_heap()
+        taken = []
+        need = grams
+        while need > EPSILON and heap:
+            entry = heap[0]
+            spool = entry[-1]
+            if spool is None:
+                heapq.heappop(heap)
+                continue
+            take = min(spool.remaining, need)
+            spool.remaining -= take
+            need -= take
+            taken.append((spool, take))
+            if spool.remaining <= EPSILON:
+                spool.remaining = 0
+                heapq.heappop(heap)
+                del self._entries[id(spool)]
+            elif self.policy == LEAST:
+                entry[0] = self._key(spool)  # 堆顶的键只会变小，堆的性质不变
+        self.remaining -= grams - need
+        emptied = [spool for spool, _ in taken if spool.remaining == 0]
+        if emptied and len(self.spools) > 1:
+            for spool in emptied[:len(self.spools) - 1]:
+                self.spools.remove(spool)
+            self._recount()
+        return taken
+
+    # ------------------ 增删改 ------------------
+    def find(self, spool_id: int) -> Spool:
+        for spool in self.spools:
+            if spool.id == spool_id:
+                return spool
+        return None
+
+    def add(self, spool: Spool):
+        """入库一卷；原先只剩一卷且已用完时由新卷替换"""
+        if len(self.spools) == 1 and self.spools[0].remaining <= EPSILON:
+            self._drop(self.spools.pop())
+        self.spools.append(spool)
+        if self._heap is not None and spool.remaining > EPSILON:
+            self._push(spool)
+        self._recount()
+
+    def remove(self, spool: Spool):
+        if len(self.spools) <= 1:
+            raise ValueError("至少保留一卷（删除整种耗材请使用删除耗材）")
+        self.spools.remove(spool)
+        self._drop(spool)
+        self._recount()
+
+    def update(self, spool: Spool, **changes):
+        """修改一卷的价格/总量/剩余量"""
+        for field, value in changes.items():
+            setattr(spool, field, value)
+        self._drop(spool)
+        if self._heap is not None and spool.remaining > EPSILON:
+            self._push(spool)
+        self._recount()
+
+    def set_total(self, field: str, value):
+        """按旧的单卷方式修改总价/总量/剩余量（total_price/initial_amount/remaining），多卷时不允许"""
+        if len(self.spools) > 1:
+            raise ValueError("该耗材有多卷，请在卷管理中修改各卷的价格和剩余量")
+        spool_field = {"total_price": "price", "initial_amount": "amount", "remaining": "remaining"}[field]
+        self.update(self.spools[0], **{spool_field: value})
+
+
+class AllocationCursor:
+    """把一种耗材整批扣料的结果按顺序分给各条打印记录
+
+    整批扣料一次完成（O(k log n)），每条记录依次从分配结果中取走自己的用量，
+    与逐条扣料的结果相同；take 返回该记录的 SpoolUse 列表
+    """
+
+    def __init__(self, filament_id: int, allocations: list):
+        self.filament_id = filament_id
+        self._allocations = allocations
+        self._index = 0
+        self._left = allocations[0][1] if allocations else 0
+
+    def take(self, grams: float) -> list:
+        uses = []
+        need = grams
+        while need > EPSILON and self._index < len(self._allocations):
+            spool = self._allocations[self._index][0]
+            take = min(self._left, need)
+            uses.append(SpoolUse(self.filament_id, spool.id, round(take, 4), round(take * spool.unit_price, 4)))
+            need -= take
+            self._left -= take
+            if self._left <= EPSILON:
+                self._index += 1
+                if self._index < len(self._allocations):
+                    self._left = self._allocations[self._index][1]
+        return uses
+
+
+def pack_uses(items) -> tuple:
+    """[{"filament_id", "spool", "weight", "cost"}, ...] 或 SpoolUse 序列 -> SpoolUse 元组"""
+    return tuple(
+        item if isinstance(item, SpoolUse) else SpoolUse(item.get("filament_id"), item.get("spool"),
+                                                         item["weight"], item["cost"])
+        for item in items or ()
+    )
+
+
+def unpack_uses(uses) -> list:
+    return [{"filament_id": u.filament_id, "spool": u.spool_id, "weight": u.weight, "cost": u.cost} for u in uses]
@@ -0,0 +1,725 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+from filelock import FileLock
+from journal import Journal
+from writebehind import WriteBehind, atomic_dump, atomic_write
+
+FILAMENTS = "filaments"
+MODELS = "models"
+HISTORY = "history"
+TABLES = (FILAMENTS, MODELS, HISTORY)
+DELTA_FIELDS = ("remaining",)  # 多个进程同时修改时按增量合并的数值字段（各自的扣料互不覆盖）
+
+
+def history_keys(data: Dict) -> list:
+    """打印历史记录可被删除墓碑匹配的键：记录 ID，以及旧版墓碑使用的 (模型名称, 时间字符串)"""
+    keys = [(data["model_name"], data["timestamp"])]
+    if data.get("id") is not None:
+        keys.append(data["id"])
+    return keys
+
+
+class JsonStorage:
+    """JSON 文件存储：耗材/模型各一个文件，打印历史使用 快照 + 追加日志
+
+    JSON 文件无法只改一行，put/delete 会重写整个文件；
+    在 transaction() 内的写入会推迟到事务结束时每个文件只写一次。
+    write_delay > 0 时所有写入交给后台线程（WriteBehind）：同一文件在窗口内的多次保存
+    合并为一次，界面线程不再等待磁盘；退出前需调用 flush()/close()。
+    binary=True 时整表写成二进制列式快照（见 snapshot.py），没有快照的表仍从 JSON 读取。
+    """
+
+    shared = False  # 是否与其他进程共用数据文件（见 SharedJsonStorage）
+
+    def __init__(self, filaments_file: str = "filaments.json", models_file: str = "models.json",
+                 history_file: str = "print_history.json", compact_threshold: int = 1000,
+                 write_delay: float = 0, binary: bool = False):
+        self.files = {FILAMENTS: filaments_file, MODELS: models_file, HISTORY: history_file}
+        self.binary = binary
+        if binary:
+            self.journal = Journal(self._snapshot_file(HISTORY), os.path.splitext(history_file)[0] + ".journal",
+                                   compact_threshold, read_snapshot=lambda path: self._read_table(HISTORY),
+                                   write_snapshot=lambda path, records: self._write_table(HISTORY, records))
+        else:
+            self.journal = Journal(history_file, compact_threshold=compact_threshold)
+        self.writer = WriteBehind(write_delay) if write_delay > 0 else None
+        self._sources = {}  # 表名 -> 返回全部记录的函数（由管理器注册）
+        self._watchers = {}  # 表名 -> 其他进程写入后的同步回调（由管理器注册）
+        # 事务嵌套计数和暂存的写入由界面线程、写任务线程和后台写入线程共用，都在可重入锁内修改；
+        # 事务期间一直持有锁，其他线程的写入和整表取数等待事务结束
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._dirty = set()
+        self._pending_history = []  # 事务中暂存的历史日志操作
+
+    def bind(self, table: str, dump: Callable[[], List[Dict]]):
+        """注册表的数据来源，整表写回时调用"""
+        self._sources[table] = dump
+
+    def watch(self, table: str, callback: Callable):
+        """注册其他进程修改了该表时的同步回调：callback(records) 或 callback(ops=日志操作)"""
+        self._watchers[table] = callback
+
+    def poll(self) -> bool:
+        """检查并读入其他进程的写入，返回是否有变化（独占使用数据文件时总是 False）"""
+        return False
+
+    def allocate_id(self, table: str, floor: int) -> int:
+        """分配新记录的 ID；floor 为调用方已知的下一个可用 ID"""
+        return floor
+
+    def load(self, table: str) -> List[Dict]:
+        if table == HISTORY:
+            records = self.journal.load(history_keys)
+            if self.journal.needs_compaction():
+                self.journal.compact(records)
+            return records
+        return self._read_table(table)
+
+    def load_columns(self, table: str):
+        """二进制模式下返回表的快照（snapshot.Snapshot，用完需关闭），否则返回 None
+
+        管理器据此直接从列构建对象，不逐条解析 JSON；打印历史快照之后的日志操作
+        放在返回值的 journal 属性中，由调用方重放。
+        """
+        if not self.binary or not os.path.exists(self._snapshot_file(table)):
+            return None
+        from snapshot import Snapshot
+        columns = Snapshot(self._snapshot_file(table))
+        if table == HISTORY:
+            columns.journal = self.journal.read_ops()
+        return columns
+
+    def _snapshot_file(self, table: str) -> str:
+        return os.path.splitext(self.files[table])[0] + ".snap"
+
+    def _read_table(self, table: str) -> List[Dict]:
+        if self.binary and os.path.exists(self._snapshot_file(table)):
+            from snapshot import read_records
+            return read_records(self._snapshot_file(table))
+        try:
+            with open(self.files[table], 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _write_table(self, table: str, records: List[Dict]):
+        if self.binary:
+            from snapshot import write_snapshot
+            write_snapshot(self._snapshot_file(table), table, records)
+        elif table == HISTORY:
+            atomic_dump(self.files[table], records, indent=4)
+        else:
+            atomic_dump(self.files[table], records)
+
+    def put(self, table: str, key, record: Dict, old_key=None):
+        """新增或更新一条记录"""
+        self._touch(table)
+
+    def delete(self, table: str, key):
+        if table == HISTORY:
+            self._journal_op(("delete", key))  # 历史记录按 ID 删除
+        else:
+            self._touch(table)
+
+    def append(self, table: str, record: Dict):
+        """追加一条打印历史"""
+        self._journal_op(("add", record))
+
+    def save_all(self, table: str):
+        """按注册的数据来源整表写回"""
+        if self.writer is None:
+            self.replace_all(table, self._records(table))
+        elif table == HISTORY:
+            # 压缩必须和日志追加严格有序，所以在当前线程取快照、按顺序排队写入
+            records = self._records(table)
+            self.writer.submit(lambda: self.replace_all(table, records))
+        else:
+            # 在后台线程写入时才序列化，窗口内的多次保存只写最后一次
+            self.writer.mark_dirty(table, lambda: self.replace_all(table, self._records(table)))
+
+    def _records(self, table: str) -> List[Dict]:
+        """在锁内从数据来源取出整表记录的副本，不会读到其他线程事务中改了一半的数据"""
+        with self._lock:
+            return self._sources[table]()
+
+    def replace_all(self, table: str, records: List[Dict]):
+        if table == HISTORY:
+            self.journal.compact(records)
+        else:
+            self._write_table(table, records)
+
+    def _document_path(self, name: str) -> str:
+        return os.path.splitext(self.files[HISTORY])[0] + f".{name}.json"
+
+    def load_document(self, name: str):
+        """读取附属于打印历史的文档（如用量汇总表），不存在或损坏时返回 None"""
+        try:
+            with open(self._document_path(name), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_document(self, name: str, data):
+        # 在当前线程序列化，后台写入的是调用时的快照
+        text = json.dumps(data)
+        if self.writer is None:
+            atomic_write(self._document_path(name), text)
+        else:
+            self.writer.submit(lambda: atomic_write(self._document_path(name), text))
+
+    def compact(self):
+        """把历史日志合并进快照"""
+        self.flush()
+        if self.journal.pending and HISTORY in self._sources:
+            self.save_all(HISTORY)
+
+    def _touch(self, table: str):
+        with self._lock:
+            if self._depth:
+                self._dirty.add(table)
+            else:
+                self.save_all(table)
+
+    def _journal_op(self, op):
+        with self._lock:
+            if self._depth:
+                self._pending_history.append(op)
+            else:
+                self._apply_journal_op(op)
+
+    def _apply_journal_op(self, op):
+        if self.writer is not None:
+            self.writer.submit(lambda: self._write_journal_op(op))
+        else:
+            self._write_journal_op(op)
+
+    def _write_journal_op(self, op):
+        kind, payload = op
+        if kind == "add":
+            self.journal.append(payload)
+        else:
+            self.journal.delete(payload)
+
+    @contextmanager
+    def transaction(self):
+        """事务：内部的修改在结束时一次性写出（JSON 无法跨文件原子提交，只做到尽量少写）
+
+        整个事务期间持有锁，其他线程的写入等待事务结束
+        """
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    dirty, self._dirty = self._dirty, set()
+                    pending, self._pending_history = self._pending_history, []
+                    for table in (FILAMENTS, MODELS):
+                        if table in dirty:
+                            self.save_all(table)
+                    for op in pending:
+                        self._apply_journal_op(op)
+
+    def flush(self):
+        """等待后台写入全部落盘；后台写入失败时抛出该异常（如磁盘已满、没有写权限）"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        try:
+            self.compact()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+
+
+def _by_name(records: List[Dict]) -> Dict:
+    return {record["name"]: record for record in records}
+
+
+def merge_records(base: Dict, local: List[Dict], disk: List[Dict], renamed: Dict = None) -> List[Dict]:
+    """三方合并按名称标识的记录列表
+
+    base 为本进程上次同步时磁盘上的记录 {名称: 记录}，local 为本进程当前的数据，
+    disk 为其他进程写入后的数据，renamed 为本进程尚未写出的改名 {新名称: 旧名称}。
+    本进程改过的字段覆盖磁盘上的值，DELTA_FIELDS 中的数值按 磁盘值 + 本地增量 合并；
+    本进程新增/删除的记录同样应用到磁盘数据上，其余记录保持磁盘上的版本。
+    """
+    renamed = renamed or {}
+    result = _by_name(disk)
+    # 有稳定 ID 的记录（耗材、模型）按 ID 对应：其他进程改过名时按名称找不到或会找到另一条同名记录
+    by_id = {record["id"]: record["name"] for record in disk if record.get("id") is not None}
+    seen = set()
+    for record in local:
+        name = record["name"]
+        origin = renamed.get(name, name)
+        seen.add(origin)
+        old = base.get(origin)
+        if old is None:  # 本进程新增
+            result[name] = record
+            continue
+        if record == old:  # 本进程没有修改，保持磁盘上的版本
+            continue
+        current = result.get(origin)
+        record_id = old.get("id")
+        if record_id in by_id and (current is None or current.get("id") != record_id):
+            origin = by_id[record_id]
+            current = result.get(origin)
+            if name == old["name"]:  # 本进程没有改名，沿用其他进程改后的名称
+                name = origin
+        if current is None:  # 已被其他进程删除，保留本进程修改后的版本
+            result[name] = record
+            continue
+        merged = dict(current)
+        for field, value in record.items():
+            before, now = old.get(field), current.get(field)
+            if field == "spools" and value != before:
+                merged[field] = _merge_spools(before or [], value, now or [])
+            elif field in DELTA_FIELDS and all(isinstance(v, (int, float)) for v in (value, before, now)):
+                merged[field] = now + (value - before)
+            elif value != before:
+                merged[field] = value
+        if merged.get("spools"):
+            # 合计以合并后的各卷为准
+            merged["total_price"] = sum(s["price"] for s in merged["spools"])
+            merged["initial_amount"] = sum(s["amount"] for s in merged["spools"])
+            merged["remaining"] = sum(s["remaining"] for s in merged["spools"])
+        if origin != name:
+            del result[origin]
+        result[name] = merged
+    for name in base.keys() - seen:  # 本进程删除
+        record_id = base[name].get("id")
+        if record_id in by_id:
+            result.pop(by_id[record_id], None)
+        elif result.get(name, {}).get("id") is None:
+            result.pop(name, None)
+    return list(result.values())
+
+
+def _merge_spools(base: List[Dict], local: List[Dict], disk: List[Dict]) -> List[Dict]:
+    """耗材的各卷按卷 ID 三方合并：剩余量按增量合并，本进程增删的卷应用到磁盘数据上"""
+    before = {s["id"]: s for s in base}
+    result = {s["id"]: s for s in disk}
+    for spool in local:
+        old, current = before.get(spool["id"]), result.get(spool["id"])
+        if old is None:  # 本进程新增
+            result[spool["id"]] = spool
+        elif spool != old and current is not None:
+            merged = dict(current)
+            for field, value in spool.items():
+                if field in DELTA_FIELDS:
+                    merged[field] = current[field] + (value - old[field])
+                elif value != old.get(field):
+                    merged[field] = value
+            result[spool["id"]] = merged
+    for spool_id in before.keys() - {s["id"] for s in local}:  # 本进程删除或用完移出
+        result.pop(spool_id, None)
+    return list(result.values())
+
+
+class SharedJsonStorage(JsonStorage):
+    """多个进程（如多台操作终端）共用同一目录下的 JSON 数据文件
+
+    - 所有读写都在跨进程文件锁（printing.lock）内进行，写入同步完成，不使用后台合并写入；
+    - 清单文件（printing.manifest.json）记录每个数据文件的代数，每次写入加一。保存时若代数
+      与本进程上次同步时不同，说明其他进程写过，先与磁盘数据三方合并（merge_records）再写回；
+    - 打印历史日志只追加：追加前先读入其他进程新写的行；新记录的 ID 由清单统一分配；
+    - poll() 只比较清单和日志的文件状态，确有其他进程写入时才读取变化的部分，
+      再通过 watch() 注册的回调让管理器原地同步。
+    """
+
+    shared = True
+    LOCK_FILE = "printing.lock"
+    MANIFEST_FILE = "printing.manifest.json"
+
+    def __init__(self, filaments_file: str = "filaments.json", models_file: str = "models.json",
+                 history_file: str = "print_history.json", compact_threshold: int = 1000,
+                 lock_timeout: float = 30):
+        super().__init__(filaments_file, models_file, history_file, compact_threshold)
+        directory = os.path.dirname(os.path.abspath(history_file))
+        # 文件锁的重入计数不区分线程：总是先取得本进程的线程锁再取文件锁
+        self.lock = FileLock(os.path.join(directory, self.LOCK_FILE), lock_timeout)
+        self.manifest_path = os.path.join(directory, self.MANIFEST_FILE)
+        self._generations = {}  # 表名 -> 本进程最近一次同步时的代数（只包含已加载的表）
+        self._base = {FILAMENTS: {}, MODELS: {}}  # 表名 -> 最近一次同步时磁盘上的记录 {名称: 记录}
+        self._renamed = {FILAMENTS: {}, MODELS: {}}  # 表名 -> 尚未写出的改名 {新名称: 旧名称}
+        self._offset = 0  # 已读入的历史日志长度（字节）
+        self._stamp = None  # 完全同步时清单和日志的文件状态，poll 据此判断是否有其他进程写入
+
+    # ------------------ 清单与变更检测 ------------------
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _bump(self, manifest: Dict, table: str):
+        manifest[table] = manifest.get(table, 0) + 1
+        atomic_dump(self.manifest_path, manifest)
+        self._generations[table] = manifest[table]
+
+    def _file_stamp(self) -> tuple:
+        stamps = []
+        for path in (self.manifest_path, self.journal.journal_path):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def poll(self) -> bool:
+        # 没有其他进程写入时只需两次 stat，可以频繁调用
+        if self._file_stamp() == self._stamp:
+            return False
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """立即读入其他进程的写入"""
+        with self._exclusive():
+            pass
+
+    @contextmanager
+    def _exclusive(self, skip: str = None):
+        """持锁执行：先同步其他进程的写入（skip 表由调用方自行合并），结束时记录文件状态"""
+        with self._lock, self.lock:
+            manifest = self._read_manifest()
+            for table in (FILAMENTS, MODELS):
+                if table != skip and table in self._generations \
+                        and manifest.get(table, 0) != self._generations[table]:
+                    records = self._read_table(table)
+                    self._synced(table, records, manifest)
+                    self._notify(table, records)
+            if skip != HISTORY:
+                self._sync_history(manifest)
+            yield manifest
+            self._stamp = self._file_stamp()
+
+    def _sync_history(self, manifest: Dict):
+        if HISTORY not in self._generations:
+            return
+        if manifest.get(HISTORY, 0) != self._generations[HISTORY]:
+            # 其他进程压缩过日志，已读的偏移失效：重新读取全部历史
+            records = self.journal.load(history_keys)
+            self._generations[HISTORY] = manifest.get(HISTORY, 0)
+            self._offset = self.journal.size()
+            self._notify(HISTORY, records)
+            return
+        ops, self._offset = self.journal.read_from(self._offset)
+        if ops:
+            self._notify(HISTORY, ops=[(op.get("op"), op.get("data", op.get("key"))) for op in ops])
+
+    def _notify(self, table: str, records: List[Dict] = None, ops: list = None):
+        callback = self._watchers.get(table)
+        if callback is None:
+            return
+        if ops is None:
+            callback(records)
+        else:
+            callback(ops=ops)
+
+    def _synced(self, table: str, records: List[Dict], manifest: Dict):
+        self._base[table] = _by_name(records)
+        self._renamed[table].clear()
+        self._generations[table] = manifest.get(table, 0)
+
+    # ------------------ 读写 ------------------
+    def load(self, table: str) -> List[Dict]:
+        with self._lock, self.lock:
+            manifest = self._read_manifest()
+            if table == HISTORY:
+                records = self.journal.load(history_keys)
+                self._generations[HISTORY] = manifest.get(HISTORY, 0)
+                if self.journal.needs_compaction():
+                    self.journal.compact(records)
+                    self._bump(manifest, HISTORY)
+                self._offset = self.journal.size()
+            else:
+                records = self._read_table(table)
+                self._synced(table, records, manifest)
+        return records
+
+    def put(self, table: str, key, record: Dict, old_key=None):
+        if old_key is not None and old_key != key and table in self._renamed:
+            renamed = self._renamed[table]
+            renamed[key] = renamed.pop(old_key, old_key)
+        super().put(table, key, record, old_key)
+
+    def replace_all(self, table: str, records: List[Dict]):
+        if table == HISTORY:
+            # 先读入其他进程追加的日志，再从管理器取数据，压缩后的快照才包含它们
+            with self._exclusive() as manifest:
+                if HISTORY in self._sources:
+                    records = self._sources[HISTORY]()
+                self.journal.compact(records)
+                self._offset = 0
+                self._bump(manifest, HISTORY)
+            return
+        with self._exclusive(skip=table) as manifest:
+            merged = table in self._generations and manifest.get(table, 0) != self._generations[table]
+            if merged:
+                records = merge_records(self._base[table], records, self._read_table(table),
+                                        self._renamed[table])
+            atomic_dump(self.files[table], records)
+            self._bump(manifest, table)
+            self._synced(table, records, manifest)
+            if merged:
+                self._notify(table, records)
+
+    def _write_journal_op(self, op):
+        with self._exclusive():
+            super()._write_journal_op(op)
+            self._offset = self.journal.size()
+
+    def allocate_id(self, table: str, floor: int) -> int:
+        """从清单中分配全局递增的 ID，多个进程同时添加记录也不会重复"""
+        with self._lock, self.lock:
+            synced = self._file_stamp() == self._stamp
+            manifest = self._read_manifest()
+            key = f"next_{table}_id"
+            value = max(manifest.get(key, 1), floor)
+            manifest[key] = value + 1
+            atomic_dump(self.manifest_path, manifest)
+            if synced:  # 只改了清单中的计数器，不影响是否需要同步
+                self._stamp = self._file_stamp()
+        return value
+
+    def load_document(self, name: str):
+        with self._lock, self.lock:
+            return super().load_document(name)
+
+    def save_document(self, name: str, data):
+        with self._lock, self.lock:
+            super().save_document(name, data)
+
+    @contextmanager
+    def transaction(self):
+        """事务期间一直持有锁：开始时先读入其他进程的写入，事务内的校验和计算都基于最新数据"""
+        with self._lock, self.lock:
+            if not self._depth:
+                self.refresh()
+            with super().transaction():
+                yield self
+
+
+class SqliteStorage:
+    """SQLite 存储：每条记录一行（WAL 模式），按名称/时间建索引，支持跨表事务"""
+
+    shared = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS filaments (
+            name TEXT PRIMARY KEY,
+            category TEXT,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_filaments_category ON filaments(category);
+        CREATE TABLE IF NOT EXISTS models (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_name TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_history_model ON history(model_name, timestamp);
+        CREATE TABLE IF NOT EXISTS documents (
+            name TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = "printing.db"):
+        self.path = path
+        # 手动控制事务；连接由界面线程、线程池和写线程共用：事务状态和每次使用连接都在可重入锁内，
+        # 一个线程的事务期间其他线程的读写等待提交（否则会读到或混入未提交的修改）
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._sources = {}
+        self._depth = 0
+
+    def bind(self, table: str, dump: Callable[[], List[Dict]]):
+        self._sources[table] = dump
+
+    def watch(self, table: str, callback: Callable):
+        pass  # 多进程共用请使用 SharedJsonStorage
+
+    def poll(self) -> bool:
+        return False
+
+    def allocate_id(self, table: str, floor: int) -> int:
+        return floor
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return all(
+                self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+                for table in TABLES
+            )
+
+    def load(self, table: str) -> List[Dict]:
+        if table == HISTORY:
+            # 行 ID 即记录 ID（旧数据的 JSON 中没有 id 字段）
+            with self._lock:
+                rows = self.conn.execute("SELECT id, data FROM history ORDER BY timestamp, id").fetchall()
+            records = []
+            for row_id, data in rows:
+                record = json.loads(data)
+                record["id"] = row_id
+                records.append(record)
+            return records
+        with self._lock:
+            rows = self.conn.execute(f"SELECT data FROM {table} ORDER BY position").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def load_columns(self, table: str):
+        return None
+
+    def _columns(self, table: str, record: Dict) -> Dict:
+        if table == FILAMENTS:
+            return {"name": record["name"], "category": record.get("category")}
+        return {"name": record["name"]}
+
+    def put(self, table: str, key, record: Dict, old_key=None):
+        columns = self._columns(table, record)
+        columns["data"] = json.dumps(record, ensure_ascii=False)
+        assignments = ", ".join(f"{c} = ?" for c in columns)
+        with self.transaction():
+            cursor = self.conn.execute(
+                f"UPDATE {table} SET {assignments} WHERE name = ?",
+                (*columns.values(), old_key if old_key is not None else key)
+            )
+            if cursor.rowcount == 0:
+                self._insert(table, columns)
+
+    def _insert(self, table: str, columns: Dict):
+        names = ", ".join(columns)
+        marks = ", ".join("?" for _ in columns)
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({names}, position) "
+            f"VALUES ({marks}, (SELECT COALESCE(MAX(position), 0) + 1 FROM {table}))",
+            tuple(columns.values())
+        )
+
+    def delete(self, table: str, key):
+        with self._lock:
+            if table == HISTORY:
+                self.conn.execute("DELETE FROM history WHERE id = ?", (key,))
+            else:
+                self.conn.execute(f"DELETE FROM {table} WHERE name = ?", (key,))
+
+    def append(self, table: str, record: Dict):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO history (id, model_name, timestamp, data) VALUES (?, ?, ?, ?)",
+                (record.get("id"), record["model_name"], record["timestamp"], json.dumps(record, ensure_ascii=False))
+            )
+
+    def save_all(self, table: str):
+        self.replace_all(table, self._sources[table]())
+
+    def replace_all(self, table: str, records: List[Dict]):
+        with self.transaction():
+            self.conn.execute(f"DELETE FROM {table}")
+            if table == HISTORY:
+                for record in records:
+                    self.append(table, record)
+            else:
+                for record in records:
+                    columns = self._columns(table, record)
+                    columns["data"] = json.dumps(record, ensure_ascii=False)
+                    self._insert(table, columns)
+
+    def load_document(self, name: str):
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_document(self, name: str, data):
+        text = json.dumps(data)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)", (name, text))
+
+    def compact(self):
+        pass  # 行级写入，无需压缩
+
+    def flush(self):
+        pass  # 每次提交即落盘
+
+    @contextmanager
+    def transaction(self):
+        """跨表事务，可嵌套（只有最外层真正提交）；整个事务期间持有锁，其他线程等待提交"""
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def import_json(target: SqliteStorage, source: JsonStorage = None):
+    """一次性把现有的 JSON 数据导入 SQLite（覆盖目标库中的同名表）"""
+    source = source or JsonStorage()
+    with target.transaction():
+        for table in TABLES:
+            target.replace_all(table, source.load(table))
+
+
+def open_storage(kind: str = None, db_path: str = None):
+    """按配置打开存储后端：环境变量 PRINTING_STORAGE=json|binary|shared|sqlite（默认 json）
+    JSON 存储默认开启后台合并写入，窗口由 PRINTING_WRITE_DELAY 指定；
+    binary 为同样的文件存储但整表保存为二进制列式快照（冷启动更快，见 snapshot.py）；
+    shared 为多个进程共用同一目录下的 JSON 文件（见 SharedJsonStorage）
+
+    首次创建 SQLite 数据库时会自动导入当前目录下已有的 JSON 文件。
+    """
+    kind = kind or os.environ.get("PRINTING_STORAGE", "json")
+    if kind in ("json", "binary"):
+        # 后台合并写入的时间窗口（秒），0 表示同步写入
+        return JsonStorage(write_delay=float(os.environ.get("PRINTING_WRITE_DELAY", "0.5")),
+                           binary=kind == "binary")
+    if kind == "shared":
+        return SharedJsonStorage()
+    if kind == "sqlite":
+        storage = SqliteStorage(db_path or os.environ.get("PRINTING_DB", "printing.db"))
+        if storage.is_empty():
+            import_json(storage)
+        return storage
+    raise ValueError(f"未知的存储类型: {kind}")
+
+
+if __name__ == "__main__":
+    # 用法: python storage.py [printing.db]  —— 把当前目录的 JSON 数据导入 SQLite
+    db = SqliteStorage(sys.argv[1] if len(sys.argv) > 1 else "printing.db")
+    import_json(db)
+    db.close()
@@ -0,0 +1,146 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL = 50  # 主线程轮询结果队列的间隔（毫秒）
+
+
+class Task:
+    """一个后台任务：可取消，可在工作线程中汇报进度"""
+
+    __slots__ = ("key", "on_done", "on_error", "on_progress", "_runner", "_cancelled")
+
+    def __init__(self, runner, key=None, on_done=None, on_error=None, on_progress=None):
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self._runner = runner
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """取消任务：尚未开始的不再执行，已完成的结果被丢弃"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def progress(self, done, total, message=""):
+        """工作线程中调用：进度交给主线程的 on_progress(done, total, message)"""
+        if self.on_progress is not None and not self.cancelled:
+            self._runner._results.put(("progress", self, (done, total, message)))
+
+
+class TaskRunner:
+    """后台执行耗时操作，并通过 after() 轮询把结果交回 Tk 主线程
+
+    - 只读/计算任务在线程池中并行执行
+    - 修改数据的任务（write=True）在单独的线程上按提交顺序串行执行
+    - 相同 key 的新任务会取消旧任务（用于被新刷新取代的旧刷新）
+    - 回调（on_done / on_error / on_progress）以及 marshal 包装的函数都在主线程执行
+    """
+
+    def __init__(self, widget, workers=4, poll_interval=POLL_INTERVAL):
+        self.widget = widget
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="task")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-write")
+        self._results = queue.Queue()
+        self._current = {}  # key -> 最近提交的 Task
+        self._main_thread = threading.current_thread()
+        self._closed = False
+        self.widget.after(self.poll_interval, self._poll)
+
+    def submit(self, fn, *args, key=None, write=False, pass_task=False,
+               on_done=None, on_error=None, on_progress=None, **kwargs):
+        """提交任务 fn(*args, **kwargs)；pass_task=True 时以 fn(task, *args, **kwargs) 调用
+
+        返回 Task，可用于取消或汇报进度
+        """
+        if self._closed:
+            raise RuntimeError("任务执行器已关闭")
+        task = Task(self, key, on_done, on_error, on_progress)
+        if key is not None:
+            previous = self._current.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._current[key] = task
+        if pass_task:
+            args = (task,) + args
+        executor = self._writer if write else self._pool
+        executor.submit(self._run, task, fn, args, kwargs)
+        return task
+
+    def _run(self, task, fn, args, kwargs):
+        if task.cancelled:
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._results.put(("error", task, e))
+        else:
+            self._results.put(("done", task, result))
+
+    def call_soon(self, callback, *args):
+        """在主线程执行 callback(*args)；已在主线程时直接调用"""
+        if threading.current_thread() is self._main_thread:
+            callback(*args)
+        else:
+            self._results.put(("call", callback, args))
+
+    def marshal(self, callback):
+        """包装回调：从任何线程调用都会在主线程执行（用于订阅管理器的变更事件）"""
+        def wrapper(*args):
+            self.call_soon(callback, *args)
+        return wrapper
+
+    def _poll(self):
+        """主线程：处理已完成任务的结果、进度和转交的回调"""
+        while True:
+            try:
+                kind, target, payload = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if kind == "call":
+                    target(*payload)
+                else:
+                    self._finish(kind, target, payload)
+            except Exception as e:
+                print(f"后台任务回调出错: {str(e)}")
+        if not self._closed:
+            self.widget.after(self.poll_interval, self._poll)
+
+    def _finish(self, kind, task, payload):
+        if task.cancelled:
+            return
+        if kind == "progress":
+            if task.on_progress is not None:
+                task.on_progress(*payload)
+            return
+        if task.key is not None and self._current.get(task.key) is task:
+            del self._current[task.key]
+        if kind == "done":
+            if task.on_done is not None:
+                task.on_done(payload)
+        elif task.on_error is not None:
+            task.on_error(payload)
+        else:
+            print(f"后台任务失败: {str(payload)}")
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def busy(self, key):
+        """指定 key 的任务是否仍在进行"""
+        return key in self._current
+
+    def shutdown(self, wait=True):
+        """取消排队中的只读任务，等待已提交的写任务完成"""
+        self._closed = True
+        for task in self._current.values():
+            task.cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        self._writer.shutdown(wait=wait)
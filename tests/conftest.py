@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JsonStorage  # noqa: E402
+
+
+@pytest.fixture
+def json_storage(tmp_path):
+    """同步写入的 JSON 存储，数据文件放在临时目录"""
+    storage = JsonStorage(str(tmp_path / "filaments.json"), str(tmp_path / "models.json"),
+                          str(tmp_path / "print_history.json"))
+    yield storage
+    storage.close()
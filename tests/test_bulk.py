@@ -0,0 +1,103 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from bulk import CostMatrix  # noqa: E402
+from cost import compute_cost  # noqa: E402
+from filament import Filament, FilamentManager  # noqa: E402
+from model import Model, ModelManager  # noqa: E402
+
+
+@pytest.fixture
+def managers(json_storage):
+    filaments = FilamentManager(storage=json_storage)
+    models = ModelManager(storage=json_storage, filament_manager=filaments)
+    filaments.add_filament(Filament("PLA 白", "PLA", 89, 1000))
+    filaments.add_filament(Filament("PETG 黑", "PETG", 120, 1000))
+    for i in range(6):
+        models.add_model(Model(f"模型{i}", [{"filament": "PLA 白", "weight": 10 + i},
+                                           {"filament": "PETG 黑", "weight": 2 * i}], quantity=1 + i % 3))
+    return filaments, models
+
+
+def assert_matches_scalar(matrix, filaments, models):
+    """增量维护的矩阵与逐模型计算、以及重新构建的矩阵结果一致"""
+    results = matrix.results()
+    assert len(matrix.compute()[0]) == len(models.models)
+    assert set(results) == {m.name for m in models.models}
+    for m in models.models:
+        expected = compute_cost(m, filaments)
+        assert results[m.name].total == pytest.approx(expected.total)
+        assert results[m.name].unit == pytest.approx(expected.unit)
+        assert results[m.name].weight == pytest.approx(expected.weight)
+    fresh = CostMatrix(filaments, models).results()
+    assert fresh.keys() == results.keys()
+    for name, cost in fresh.items():
+        assert tuple(results[name]) == pytest.approx(tuple(cost))
+
+
+def test_add(managers):
+    filaments, models = managers
+    matrix = CostMatrix(filaments, models)
+    models.add_model(Model("新模型", [{"filament": "PLA 白", "weight": 33}]))
+    assert_matches_scalar(matrix, filaments, models)
+
+
+def test_update_many_times(managers):
+    """反复修改会触发压缩重建，修改后的模型只能出现一次"""
+    filaments, models = managers
+    matrix = CostMatrix(filaments, models)
+    model = models.find_model("模型3")
+    for i in range(20):
+        models.update_model(model, materials=[{"filament": "PLA 白", "weight": 5 + i}], quantity=2)
+        assert_matches_scalar(matrix, filaments, models)
+
+
+def test_update_then_delete(managers):
+    filaments, models = managers
+    matrix = CostMatrix(filaments, models)
+    for m in list(models.models):
+        models.update_model(m, quantity=m.quantity + 1)
+    models.delete_model("模型2")
+    assert "模型2" not in matrix.results()
+    assert_matches_scalar(matrix, filaments, models)
+
+
+def test_rename_and_price_change(managers):
+    filaments, models = managers
+    matrix = CostMatrix(filaments, models)
+    models.update_model(models.find_model("模型1"), name="改名模型")
+    filaments.update_filament(filaments.find_filament("PETG 黑"), total_price=150)
+    filaments.update_filament(filaments.find_filament("PLA 白"), name="PLA 白2")
+    assert "模型1" not in matrix.results()
+    assert_matches_scalar(matrix, filaments, models)
+
+
+def test_delete_filament(managers):
+    filaments, models = managers
+    matrix = CostMatrix(filaments, models)
+    filaments.delete_filament("PETG 黑")
+    assert_matches_scalar(matrix, filaments, models)
+
+
+def test_service_bulk_costs_match_cache(json_storage):
+    """PrintService.bulk_costs（命令行 models 使用）与逐个模型的成本缓存一致，并随修改增量更新"""
+    from service import PrintService
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 89, 1000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 12.5}], 4)
+    service.add_model("支架", [{"filament": "不存在", "weight": 3}])
+
+    def check():
+        costs = service.bulk_costs()
+        assert set(costs) == {m.name for m in service.models.models}
+        for name, cost in service.all_costs().items():
+            assert tuple(costs[name]) == (cost.total, cost.unit, cost.weight)
+
+    check()
+    service.update_filament("PLA 白", total_price=120)
+    service.add_filament("不存在", "PETG", 50, 500)
+    service.update_model("齿轮", name="齿轮 v2", quantity=2)
+    check()
+    service.delete_model("支架")
+    check()
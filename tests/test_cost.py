@@ -0,0 +1,47 @@
+import pytest
+
+import cost
+from cost import compute_cost
+from filament import Filament, FilamentManager
+from model import Model, ModelManager
+
+
+@pytest.fixture
+def managers(json_storage):
+    filaments = FilamentManager(storage=json_storage)
+    models = ModelManager(storage=json_storage, filament_manager=filaments)
+    filaments.add_filament(Filament("PLA 白", "PLA", 100, 1000))
+    models.add_model(Model("齿轮", [{"filament": "PLA 白", "weight": 50}]))
+    return filaments, models
+
+
+def test_cache_follows_price_change(managers):
+    filaments, models = managers
+    model = models.find_model("齿轮")
+    assert models.cost(model).total == pytest.approx(5)
+    filaments.update_filament(filaments.find_filament("PLA 白"), total_price=200)
+    assert models.cost(model).total == pytest.approx(10)
+
+
+@pytest.mark.parametrize("change_after_compute", [True, False])
+def test_price_change_during_compute_is_not_cached(managers, monkeypatch, change_after_compute):
+    """模拟后台线程计算成本的同时写线程改价：旧单价算出的结果不能留在缓存中"""
+    filaments, models = managers
+    model = models.find_model("齿轮")
+    original = cost.compute_cost
+    calls = []
+
+    def racing(m, filament_manager):
+        calls.append(m)
+        if len(calls) > 1:
+            return original(m, filament_manager)
+        if change_after_compute:
+            result = original(m, filament_manager)
+        filaments.update_filament(filaments.find_filament("PLA 白"), total_price=300)
+        if not change_after_compute:
+            result = original(m, filament_manager)
+        return result
+
+    monkeypatch.setattr(cost, "compute_cost", racing)
+    models.cost(model)
+    assert models.cost(model).total == pytest.approx(compute_cost(model, filaments).total) == pytest.approx(15)
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from forecast import WINDOW_DAYS
+from service import PrintService
+
+
+@pytest.fixture
+def service(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_filament("PETG 黑", "PETG", 120, 100)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 100}])
+    service.add_model("外壳", [{"filament": "PLA 白", "weight": 150}, {"filament": "PETG 黑", "weight": 30}])
+    return service
+
+
+def capacities(service):
+    return {m.name: tuple(c) for m, c in service.capacity_report()}
+
+
+def test_capacity_report(service):
+    assert capacities(service) == {"齿轮": (10, "PLA 白"), "外壳": (3, "PETG 黑")}
+    assert [m.name for m, _ in service.capacity_report()] == ["外壳", "齿轮"]  # 盘数少的在前
+
+
+def test_capacity_follows_stock_changes(service):
+    events = []
+    service.forecast.subscribe(lambda e: events.append(e.key))
+    capacities(service)
+    assert service.use_model("外壳").ok
+    assert capacities(service) == {"齿轮": (8, "PLA 白"), "外壳": (2, "PETG 黑")}
+    assert ("model", "外壳") in events and ("model", "齿轮") in events
+    service.add_spool("PETG 黑", 100, 1000)
+    assert capacities(service)["外壳"] == (5, "PLA 白")
+    service.update_model("齿轮", materials=[{"filament": "PETG 黑", "weight": 500}])
+    assert capacities(service)["齿轮"] == (2, "PETG 黑")
+
+
+def test_depletion_from_recent_usage(service):
+    now = datetime.now()
+    assert service.run_jobs([("齿轮", 3)], now - timedelta(days=2)).ok
+    assert service.run_jobs([("齿轮", 1)], now - timedelta(days=WINDOW_DAYS + 5)).ok  # 窗口之外
+    outlooks = {f.name: o for f, o in service.depletion_report()}
+    pla = outlooks["PLA 白"]
+    assert pla.rate == pytest.approx(300 / WINDOW_DAYS)
+    assert pla.remaining == 600
+    assert pla.days_left == pytest.approx(600 / (300 / WINDOW_DAYS))
+    assert outlooks["PETG 黑"].days_left is None and outlooks["PETG 黑"].depletion is None
+    assert [f.name for f, _ in service.depletion_report()] == ["PLA 白", "PETG 黑"]  # 先用完的在前
+
+
+def test_rate_updates_when_history_changes(service):
+    now = datetime.now()
+    assert service.run_jobs([("齿轮", 1)], now - timedelta(days=1)).ok
+    assert service.forecast.rate("PLA 白") == pytest.approx(100 / WINDOW_DAYS)
+    events = []
+    service.forecast.subscribe(lambda e: events.append(e.key))
+    assert service.run_jobs([("齿轮", 2)], now - timedelta(days=1)).ok
+    assert service.forecast.rate("PLA 白") == pytest.approx(300 / WINDOW_DAYS)
+    assert ("filament", "PLA 白") in events
+    service.delete_history(service.latest_history(1)[0].id)
+    assert service.forecast.rate("PLA 白") == pytest.approx(200 / WINDOW_DAYS)
+
+
+def test_stock_warnings(service):
+    assert service.stock_warnings() == []  # 外壳还能打印 3 盘，不低于提示线
+    assert service.run_jobs([("齿轮", 7)], datetime.now() - timedelta(days=1)).ok
+    warnings = service.stock_warnings()
+    assert len(warnings) == 2
+    assert warnings[0].startswith("耗材 PLA 白 预计 12.9 天后用完")
+    assert warnings[1] == "模型 外壳 只能再打印 2 盘（受限于 PLA 白）"
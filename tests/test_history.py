@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+from service import PrintService
+
+T0 = datetime(2026, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def service(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 10000)
+    service.add_filament("PETG 黑", "PETG", 120, 10000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 10}])
+    service.add_model("支架", [{"filament": "PETG 黑", "weight": 5}])
+    service.add_model("外壳", [{"filament": "PLA 白", "weight": 20}, {"filament": "PETG 黑", "weight": 1}])
+    # 同一秒内的多盘，以及乱序写入的较早记录
+    assert service.run_jobs([("齿轮", 2), ("支架", 1)], T0).ok
+    assert service.run_jobs([("外壳", 1)], datetime(2026, 3, 2, 9, 0)).ok
+    assert service.run_jobs([("支架", 1)], datetime(2026, 2, 27, 18, 0)).ok
+    return service
+
+
+def ids(entries):
+    return [e.id for e in entries]
+
+
+def test_entries_get_unique_ids_and_time_order(service):
+    entries = service.history.history
+    assert sorted(ids(entries)) == [1, 2, 3, 4, 5]
+    assert [(e.time_str(), e.model_name) for e in entries] == [
+        ("2026-02-27 18:00:00", "支架"),
+        ("2026-03-01 09:00:00", "齿轮"), ("2026-03-01 09:00:00", "齿轮"), ("2026-03-01 09:00:00", "支架"),
+        ("2026-03-02 09:00:00", "外壳"),
+    ]
+
+
+def test_between_is_half_open(service):
+    assert [e.model_name for e in service.history_between(T0, "2026-03-02")] == ["齿轮", "齿轮", "支架"]
+    assert [e.model_name for e in service.history_between("2026-03-01 09:00:01")] == ["外壳"]
+    assert [e.model_name for e in service.history_between(end=T0)] == ["支架"]
+    assert service.history_between("2026-03-03") == []
+
+
+def test_between_by_model_and_filament(service):
+    assert [e.time_str() for e in service.history_between(model_name="支架")] == \
+        ["2026-02-27 18:00:00", "2026-03-01 09:00:00"]
+    assert [e.model_name for e in service.history_between(T0, filament="PETG 黑")] == ["支架", "外壳"]
+    assert [e.model_name for e in service.history_between(model_name="外壳", filament="PLA 白")] == ["外壳"]
+    assert service.history_between(model_name="齿轮", filament="PETG 黑") == []
+
+
+def test_latest(service):
+    assert [e.model_name for e in service.latest_history(2)] == ["外壳", "支架"]
+    assert [e.time_str() for e in service.latest_history(5, model_name="支架")] == \
+        ["2026-03-01 09:00:00", "2026-02-27 18:00:00"]
+    assert [e.model_name for e in service.latest_history(1, filament="PLA 白")] == ["外壳"]
+    assert service.latest_history(0) == []
+
+
+def test_delete_same_second_entry_by_id(service):
+    """同一秒打印的同一模型只删除指定的那一条"""
+    first, second = [e for e in service.history.history if e.model_name == "齿轮"]
+    service.delete_history(first.id)
+    assert ids(service.history_between(T0, "2026-03-02", model_name="齿轮")) == [second.id]
+    assert service.history.get(first.id) is None
+    assert first not in service.history.for_filament("PLA 白")
+    with pytest.raises(ValueError):
+        service.delete_history(first.id)
+    # 删除后新记录的 ID 不复用
+    assert service.run_jobs([("齿轮", 1)], T0).ok
+    assert service.latest_history(1, model_name="齿轮")[0].id == 6
+
+
+def test_ids_and_order_survive_reload(service, json_storage):
+    service.delete_history(2)
+    expected = [(e.id, e.time_str(), e.model_name) for e in service.history.history]
+    json_storage.flush()
+    reloaded = PrintService(json_storage)
+    assert [(e.id, e.time_str(), e.model_name) for e in reloaded.history.history] == expected
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime
+
+from journal import Journal
+from service import PrintService
+from storage import JsonStorage, history_keys
+
+LEGACY = [
+    {"model_name": "齿轮", "used_materials": [{"filament": "PLA 白", "weight": 10.0}],
+     "timestamp": "2026-01-05 08:00:00"},
+    {"model_name": "支架", "used_materials": [{"filament": "PLA 白", "weight": 5.0}],
+     "timestamp": "2026-01-06 09:30:00"},
+]
+
+
+def open_service(directory, compact_threshold=1000):
+    return PrintService(JsonStorage(str(directory / "filaments.json"), str(directory / "models.json"),
+                                    str(directory / "print_history.json"), compact_threshold))
+
+
+def journal_ops(directory):
+    path = directory / "print_history.journal"
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] if path.exists() else []
+
+
+def history(service):
+    return [e.to_dict() for e in service.history.history]
+
+
+def test_print_appends_instead_of_rewriting(tmp_path):
+    """打印只追加一行日志，不重写历史快照；重新加载后结果相同"""
+    service = open_service(tmp_path)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 10}])
+    snapshot = (tmp_path / "print_history.json").read_bytes() if (tmp_path / "print_history.json").exists() else None
+    assert service.run_jobs([("齿轮", 2)], datetime(2026, 3, 1, 9, 0)).ok
+    assert service.run_jobs([("齿轮", 1)], datetime(2026, 3, 1, 10, 0)).ok
+    after = (tmp_path / "print_history.json").read_bytes() if (tmp_path / "print_history.json").exists() else None
+    assert after == snapshot
+    assert [op["op"] for op in journal_ops(tmp_path)] == ["add", "add", "add"]
+    expected = history(service)
+    service.storage.flush()
+    reloaded = open_service(tmp_path)
+    assert history(reloaded) == expected
+
+
+def test_legacy_history_migrates(tmp_path):
+    """旧版的整表 JSON 直接当作快照：加载后补发 ID，之后的删除写成按 ID 的墓碑"""
+    (tmp_path / "print_history.json").write_text(json.dumps(LEGACY, indent=4))
+    service = open_service(tmp_path)
+    assert [(e.id, e.model_name) for e in service.history.history] == [(1, "齿轮"), (2, "支架")]
+    service.delete_history(1)
+    assert journal_ops(tmp_path)[-1] == {"op": "delete", "key": 1}
+    service.close()
+    reloaded = open_service(tmp_path)
+    assert [(e.id, e.model_name, e.time_str()) for e in reloaded.history.history] == \
+        [(2, "支架", "2026-01-06 09:30:00")]
+
+
+def test_legacy_tombstone_matches_name_and_time(tmp_path):
+    """旧版墓碑按 (模型名称, 时间字符串) 匹配"""
+    (tmp_path / "print_history.json").write_text(json.dumps(LEGACY))
+    (tmp_path / "print_history.journal").write_text(
+        json.dumps({"op": "delete", "key": ["齿轮", "2026-01-05 08:00:00"]}) + "\n")
+    journal = Journal(str(tmp_path / "print_history.json"))
+    assert [r["model_name"] for r in journal.load(history_keys)] == ["支架"]
+    assert journal.pending == 1
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    """崩溃时写了一半的最后一行被丢弃并截掉，之后的追加从新行开始"""
+    journal = Journal(str(tmp_path / "print_history.json"))
+    journal.append(dict(LEGACY[0], id=1))
+    with open(journal.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "data": {"model_name": "半')
+    assert [r["id"] for r in journal.load(history_keys)] == [1]
+    journal.append(dict(LEGACY[1], id=2))
+    assert [r["id"] for r in Journal(journal.snapshot_path).load(history_keys)] == [1, 2]
+
+
+def test_delete_of_journalled_entry(tmp_path):
+    journal = Journal(str(tmp_path / "print_history.json"))
+    journal.append(dict(LEGACY[0], id=1))
+    journal.append(dict(LEGACY[1], id=2))
+    journal.delete(1)
+    assert [r["id"] for r in Journal(journal.snapshot_path).load(history_keys)] == [2]
+
+
+def test_compaction_folds_journal_into_snapshot(tmp_path):
+    """日志达到阈值时加载即压缩：快照包含全部记录，日志清空"""
+    service = open_service(tmp_path)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 10}])
+    service.close()
+    (tmp_path / "print_history.json").write_text(json.dumps(LEGACY))
+    service = open_service(tmp_path, compact_threshold=3)
+    for hour in (8, 9, 10):
+        assert service.run_jobs([("齿轮", 1)], datetime(2026, 3, 1, hour, 0)).ok
+    service.delete_history(2)
+    expected = history(service)
+    assert len(journal_ops(tmp_path)) > 3  # 没有关闭：日志还未合并
+    reloaded = open_service(tmp_path, compact_threshold=3)
+    assert history(reloaded) == expected
+    assert journal_ops(tmp_path) == []
+    assert [r["id"] for r in json.loads((tmp_path / "print_history.json").read_text())] == \
+        [e["id"] for e in expected]
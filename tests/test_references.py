@@ -0,0 +1,94 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from service import PrintService
+from storage import JsonStorage
+
+T0 = datetime(2026, 3, 1, 9, 0)
+
+
+def open_service(directory):
+    return PrintService(JsonStorage(str(directory / "filaments.json"), str(directory / "models.json"),
+                                    str(directory / "print_history.json")))
+
+
+@pytest.fixture
+def service(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_filament("PETG 黑", "PETG", 120, 1000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 10}])
+    service.add_model("外壳", [{"filament": "PLA 白", "weight": 20}, {"filament": "PETG 黑", "weight": 5}])
+    service.add_model("支架", [{"filament": "PETG 黑", "weight": 5}])
+    assert service.run_jobs([("齿轮", 2), ("外壳", 1)], T0).ok
+    return service
+
+
+def materials(model):
+    return [(m.filament, m.filament_id) for m in model.materials]
+
+
+def test_filaments_get_stable_ids(service):
+    pla, petg = service.get_filament("PLA 白"), service.get_filament("PETG 黑")
+    assert (pla.id, petg.id) == (1, 2)
+    assert materials(service.get_model("外壳")) == [("PLA 白", 1), ("PETG 黑", 2)]
+    assert {m.name for m in service.filament_dependents("PLA 白")} == {"齿轮", "外壳"}
+
+
+def test_rename_cascades_to_models_history_and_rollups(service):
+    cost = service.model_cost("外壳").total
+    service.update_filament("PLA 白", name="PLA 纯白")
+    assert materials(service.get_model("齿轮")) == [("PLA 纯白", 1)]
+    assert materials(service.get_model("外壳")) == [("PLA 纯白", 1), ("PETG 黑", 2)]
+    assert service.model_cost("外壳").total == cost  # 改名后成本不归零
+    assert {m.filament for e in service.history.history for m in e.used_materials} == {"PLA 纯白", "PETG 黑"}
+    assert len(service.history.for_filament("PLA 纯白")) == 3 and service.history.for_filament("PLA 白") == []
+    usage = dict(service.usage("filament"))
+    assert "PLA 白" not in usage
+    assert usage["PLA 纯白"].grams == 40 and usage["PLA 纯白"].prints == 3
+    assert {m.name for m in service.filament_dependents("PLA 纯白")} == {"齿轮", "外壳"}
+
+
+def test_delete_reports_dependents_and_relinks_new_filament(service):
+    affected = service.delete_filament("PETG 黑")
+    assert {m.name for m in affected} == {"外壳", "支架"}
+    assert materials(service.get_model("支架")) == [("PETG 黑", None)]
+    assert service.model_cost("外壳").total == service.model_cost("齿轮").total * 2
+    # 历史记录保留原名称，不受删除影响
+    assert [m.filament for m in service.latest_history(1)[0].used_materials] == ["PLA 白", "PETG 黑"]
+    service.add_filament("PETG 黑", "PETG", 90, 1000)
+    new_id = service.get_filament("PETG 黑").id
+    assert new_id == 3
+    assert materials(service.get_model("支架")) == [("PETG 黑", new_id)]
+    assert {m.name for m in service.filament_dependents("PETG 黑")} == {"外壳", "支架"}
+
+
+def test_rename_persists(service, json_storage):
+    service.update_filament("PLA 白", name="PLA 纯白")
+    json_storage.flush()
+    reloaded = PrintService(json_storage)
+    assert materials(reloaded.get_model("齿轮")) == [("PLA 纯白", 1)]
+    assert reloaded.history.for_filament("PLA 纯白") and not reloaded.history.for_filament("PLA 白")
+
+
+def test_legacy_name_references_migrate(tmp_path):
+    """旧版按名称引用的数据：加载时补发耗材 ID、关联模型和历史并写回"""
+    (tmp_path / "filaments.json").write_text(json.dumps(
+        [{"name": "PLA 白", "category": "PLA", "total_price": 100, "initial_amount": 1000, "remaining": 900}]))
+    (tmp_path / "models.json").write_text(json.dumps(
+        [{"name": "齿轮", "materials": [{"filament": "PLA 白", "weight": 10}], "quantity": 1}]))
+    (tmp_path / "print_history.json").write_text(json.dumps(
+        [{"model_name": "齿轮", "used_materials": [{"filament": "PLA 白", "weight": 10}],
+          "timestamp": "2026-01-05 08:00:00"}]))
+    service = open_service(tmp_path)
+    assert service.get_filament("PLA 白").id == 1
+    assert materials(service.get_model("齿轮")) == [("PLA 白", 1)]
+    assert [m.filament_id for m in service.history.history[0].used_materials] == [1]
+    service.close()
+    assert json.loads((tmp_path / "filaments.json").read_text())[0]["id"] == 1
+    assert json.loads((tmp_path / "models.json").read_text())[0]["materials"][0]["filament_id"] == 1
+    service = open_service(tmp_path)
+    service.update_filament("PLA 白", name="PLA 纯白")
+    assert service.history.history[0].used_materials[0].filament == "PLA 纯白"
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from history import PrintHistoryEntry
+from material import Material
+from rollup import PERIODS, Rollups
+from spool import SpoolUse
+
+WHEN = datetime(2026, 3, 5, 10, 0)
+
+
+def entry(entry_id, materials, spools=()):
+    return PrintHistoryEntry("双色齿轮", tuple(materials), WHEN, entry_id=entry_id, spools=spools)
+
+
+def test_filament_listed_twice_counts_one_print():
+    rollups = Rollups(price_fn=lambda name: 0.1)
+    e = entry(1, [Material("PLA 白", 10, 1), Material("PETG 黑", 5, 2), Material("PLA 白", 20, 1)])
+    rollups.add(e)
+    usage = rollups.totals("filament", "day")
+    assert usage["PLA 白"].prints == 1
+    assert usage["PLA 白"].grams == pytest.approx(30)
+    assert usage["PLA 白"].cost == pytest.approx(3)
+    assert rollups.totals("model", "day")["双色齿轮"].grams == pytest.approx(35)
+    rollups.remove(e)
+    assert rollups.totals("filament", "day") == {}
+    assert rollups.totals("model", "day") == {}
+
+
+def test_spool_costs_for_repeated_filament():
+    rollups = Rollups(price_fn=lambda name: 1.0)
+    uses = [SpoolUse(1, 7, 25, 2.5), SpoolUse(1, 8, 5, 0.75)]
+    rollups.add(entry(1, [Material("PLA 白", 10, 1), Material("PLA 白", 20, 1)], uses))
+    usage = rollups.totals("filament", "month")["PLA 白"]
+    assert (usage.grams, usage.prints) == (30, 1)
+    assert usage.cost == pytest.approx(3.25)
+
+
+def test_legacy_materials_without_id_merge_by_name():
+    rollups = Rollups()
+    rollups.add(entry(1, [Material("PLA 白", 10), Material("PLA 白", 20)]))
+    rollups.add(entry(2, [Material("PLA 白", 5)]))
+    usage = rollups.totals("filament", "week")["PLA 白"]
+    assert (usage.grams, usage.prints) == (35, 2)
+
+
+@pytest.mark.parametrize("period", PERIODS)
+def test_bounded_totals_read_only_buckets_in_range(period):
+    """起止时间都给定时按键查找范围内的桶，结果与逐桶比较相同（含跨年的周）"""
+    rollups = Rollups()
+    first = datetime(2024, 11, 20, 8, 0)
+    for i in range(500):
+        when = first + timedelta(days=i)
+        rollups.add(PrintHistoryEntry("齿轮", (Material("PLA 白", 1 + i % 3, 1),), when, entry_id=i + 1))
+    buckets = rollups.tables[period]["filament"]["PLA 白"]
+    for start, end in [(datetime(2024, 12, 30), datetime(2025, 1, 2, 23)), (datetime(2025, 2, 10), datetime(2025, 5, 3)),
+                       (datetime(2020, 1, 1), datetime(2030, 1, 1)), (datetime(2025, 3, 1), datetime(2025, 2, 1))]:
+        lo, hi = rollups._range(period, start, end)
+        expected = [row for key, row in buckets.items() if lo <= key <= hi]
+        usage = rollups.totals("filament", period, start, end).get("PLA 白")
+        if not expected:
+            assert usage is None
+            continue
+        assert usage.grams == sum(row[0] for row in expected)
+        assert usage.prints == sum(row[2] for row in expected)
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from service import PrintService
+
+T0 = datetime(2026, 3, 1, 9, 0)
+
+
+def minutes(n):
+    return T0 + timedelta(minutes=n)
+
+
+@pytest.fixture
+def service(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 100}])
+    service.add_model("外壳", [{"filament": "PLA 白", "weight": 200}])
+    service.set_printers(["A", "B"])
+    return service
+
+
+def layout(schedule):
+    return [(a.printer, a.model, a.start, a.end) for a in schedule.assignments]
+
+
+def test_longest_plates_first(service):
+    service.add_farm_jobs([("齿轮", 3, 60, ()), ("外壳", 2, 120, ())])
+    schedule = service.plan_farm(T0)
+    assert layout(schedule) == [
+        ("A", "外壳", T0, minutes(120)),
+        ("B", "外壳", T0, minutes(120)),
+        ("A", "齿轮", minutes(120), minutes(180)),
+        ("B", "齿轮", minutes(120), minutes(180)),
+        ("A", "齿轮", minutes(180), minutes(240)),
+    ]
+    assert schedule.makespan == minutes(240)
+    assert schedule.running == [] and schedule.unscheduled == []
+
+
+def test_restricted_plates_go_first(service):
+    """只能用 B 的盘按 时长×2 排序，先于不限打印机的长盘占住 B"""
+    service.add_farm_jobs([("外壳", 2, 90, ()), ("齿轮", 1, 60, ("B",))])
+    schedule = service.plan_farm(T0)
+    assert layout(schedule) == [
+        ("A", "外壳", T0, minutes(90)),
+        ("B", "齿轮", T0, minutes(60)),
+        ("B", "外壳", minutes(60), minutes(150)),
+    ]
+    assert schedule.makespan == minutes(150)
+    with pytest.raises(ValueError):
+        service.add_farm_job("齿轮", 1, 60, ("C",))
+    with pytest.raises(ValueError):
+        service.add_farm_job("不存在", 1, 60)
+    assert len(service.farm_jobs()) == 2
+
+
+def test_plates_beyond_stock_are_unscheduled(service):
+    job = service.add_farm_job("外壳", 6, 60)
+    schedule = service.plan_farm(T0)
+    assert len(schedule.assignments) == 5
+    assert [(u.job, u.count, u.reason) for u in schedule.unscheduled] == [(job.id, 1, "耗材不足：PLA 白")]
+    service.update_filament("PLA 白", remaining=300)  # 库存变化后重新排产
+    schedule = service.plan_farm(T0)
+    assert len(schedule.assignments) == 1
+    assert schedule.unscheduled[0].count == 5
+
+
+def test_start_deducts_stock_and_complete_replans(service):
+    service.add_farm_job("外壳", 3, 120)
+    result, plates = service.start_farm(T0)
+    assert result.ok
+    assert sorted(a.printer for a in plates) == ["A", "B"]
+    assert service.get_filament("PLA 白").remaining == 600
+    assert [e.model_name for e in service.latest_history(5)] == ["外壳", "外壳"]
+    assert service.farm_jobs()[0].count == 1
+
+    schedule = service.plan_farm(T0)
+    assert [a.printer for a in schedule.running] == ["A", "B"]
+    assert layout(schedule) == [("A", "外壳", minutes(120), minutes(240))]
+    assert service.start_farm(minutes(30))[1] == []  # 两台都在打印
+
+    done = service.complete_farm_plate("B")
+    assert (done.printer, done.end) == ("B", minutes(120))
+    schedule = service.plan_farm(minutes(60))
+    assert layout(schedule) == [("B", "外壳", minutes(60), minutes(180))]
+    with pytest.raises(ValueError):
+        service.complete_farm_plate("B")
+    with pytest.raises(ValueError):
+        service.set_printers(["B"])  # A 正在打印
+
+
+def test_jobs_follow_model_rename(service, json_storage):
+    service.add_farm_job("外壳", 2, 120)
+    service.update_model("外壳", name="外罩")
+    assert [j.model for j in service.farm_jobs()] == ["外罩"]
+    assert {a.model for a in service.plan_farm(T0).assignments} == {"外罩"}
+    json_storage.flush()
+    reloaded = PrintService(json_storage)
+    assert [j.model for j in reloaded.farm_jobs()] == ["外罩"]
+    assert reloaded.printers() == ["A", "B"]
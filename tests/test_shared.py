@@ -0,0 +1,168 @@
+from datetime import datetime
+
+import pytest
+
+from service import PrintService
+from storage import SharedJsonStorage, merge_records
+
+
+# ------------------ 三方合并 ------------------
+def test_merge_applies_remaining_deltas():
+    base = {"PLA": {"id": 1, "name": "PLA", "category": "PLA", "remaining": 1000}}
+    local = [{"id": 1, "name": "PLA", "category": "PLA", "remaining": 900}]
+    disk = [{"id": 1, "name": "PLA", "category": "PLA", "remaining": 800}]
+    assert merge_records(base, local, disk) == [{"id": 1, "name": "PLA", "category": "PLA", "remaining": 700}]
+
+
+def test_merge_keeps_other_process_rename():
+    """其他进程改了名，本进程改了种类：按 ID 合并成一条记录"""
+    base = {"PLA": {"id": 1, "name": "PLA", "category": "PLA", "remaining": 1000}}
+    local = [{"id": 1, "name": "PLA", "category": "PLA+", "remaining": 1000}]
+    disk = [{"id": 1, "name": "PLA 白", "category": "PLA", "remaining": 1000}]
+    assert merge_records(base, local, disk) == [{"id": 1, "name": "PLA 白", "category": "PLA+", "remaining": 1000}]
+
+
+def test_merge_rename_does_not_match_new_record_with_old_name():
+    base = {"PLA": {"id": 1, "name": "PLA", "remaining": 1000}}
+    local = [{"id": 1, "name": "PLA", "remaining": 950}]
+    disk = [{"id": 1, "name": "PLA 旧", "remaining": 1000}, {"id": 2, "name": "PLA", "remaining": 500}]
+    merged = {r["id"]: r for r in merge_records(base, local, disk)}
+    assert merged == {1: {"id": 1, "name": "PLA 旧", "remaining": 950}, 2: {"id": 2, "name": "PLA", "remaining": 500}}
+
+
+def test_merge_local_delete_of_renamed_record():
+    base = {"PLA": {"id": 1, "name": "PLA"}, "PETG": {"id": 2, "name": "PETG"}}
+    local = [{"id": 2, "name": "PETG"}]
+    disk = [{"id": 1, "name": "PLA 白"}, {"id": 2, "name": "PETG"}]
+    assert merge_records(base, local, disk) == [{"id": 2, "name": "PETG"}]
+
+
+def test_merge_local_add_and_rename_without_ids():
+    base = {"齿轮": {"name": "齿轮", "quantity": 1}}
+    local = [{"name": "齿轮 v2", "quantity": 1}, {"name": "支架", "quantity": 2}]
+    disk = [{"name": "齿轮", "quantity": 3}, {"name": "外壳", "quantity": 1}]
+    merged = merge_records(base, local, disk, renamed={"齿轮 v2": "齿轮"})
+    assert sorted(r["name"] for r in merged) == ["外壳", "支架", "齿轮 v2"]
+    assert next(r for r in merged if r["name"] == "齿轮 v2")["quantity"] == 3
+
+
+def test_merge_spools():
+    spool = {"id": 1, "price": 90, "amount": 1000, "remaining": 1000, "added": None}
+    base = {"PLA": {"id": 1, "name": "PLA", "spools": [spool]}}
+    local = [{"id": 1, "name": "PLA", "spools": [dict(spool, remaining=700),
+                                                  {"id": 3, "price": 80, "amount": 500, "remaining": 500,
+                                                   "added": None}]}]
+    disk = [{"id": 1, "name": "PLA", "spools": [dict(spool, remaining=900),
+                                                 {"id": 2, "price": 100, "amount": 1000, "remaining": 1000,
+                                                  "added": None}]}]
+    merged = merge_records(base, local, disk)[0]
+    assert {s["id"]: s["remaining"] for s in merged["spools"]} == {1: 600, 2: 1000, 3: 500}
+    assert merged["remaining"] == 2100
+    assert merged["total_price"] == 270
+
+
+# ------------------ 两个进程共用数据目录 ------------------
+@pytest.fixture
+def open_shared(tmp_path):
+    services = []
+
+    def open_service():
+        service = PrintService(SharedJsonStorage(str(tmp_path / "filaments.json"), str(tmp_path / "models.json"),
+                                                 str(tmp_path / "print_history.json")))
+        services.append(service)
+        return service
+
+    yield open_service
+    for service in services:
+        service.close()
+
+
+def snapshot(service):
+    return ([f.to_dict() for f in service.filaments.filaments],
+            [m.to_dict() for m in service.models.models],
+            [e.to_dict() for e in service.history.history])
+
+
+def test_concurrent_prints_deduct_both(open_shared):
+    a = open_shared()
+    a.add_filament("PLA 白", "PLA", 100, 1000)
+    a.add_model("齿轮", [{"filament": "PLA 白", "weight": 100}])
+    b = open_shared()
+    assert a.run_jobs([("齿轮", 1)], datetime(2026, 3, 1, 9, 0)).ok
+    assert b.run_jobs([("齿轮", 2)], datetime(2026, 3, 1, 9, 5)).ok
+    a.storage.poll()
+    assert a.get_filament("PLA 白").remaining == b.get_filament("PLA 白").remaining == 700
+    assert [e.id for e in a.history.history] == [e.id for e in b.history.history] == [1, 2, 3]
+    assert snapshot(a) == snapshot(b)
+
+
+def test_concurrent_rename_and_edit(open_shared):
+    a = open_shared()
+    a.add_filament("PLA 白", "PLA", 100, 1000)
+    a.add_model("齿轮", [{"filament": "PLA 白", "weight": 100}])
+    b = open_shared()
+    a.update_filament("PLA 白", name="PLA 纯白")
+    b.update_filament("PLA 白", category="PLA+")
+    b.add_model("支架", [{"filament": "PLA 白", "weight": 20}])
+    a.storage.poll()
+    b.storage.poll()
+    assert [(f.name, f.category) for f in a.filaments.filaments] == [("PLA 纯白", "PLA+")]
+    assert snapshot(a) == snapshot(b)
+    assert {m.name for m in b.models.models} == {"齿轮", "支架"}
+
+
+def test_concurrent_spools_and_delete(open_shared):
+    a = open_shared()
+    a.add_filament("PLA 白", "PLA", 100, 1000)
+    a.add_filament("PETG 黑", "PETG", 120, 1000)
+    a.add_model("齿轮", [{"filament": "PLA 白", "weight": 300}])
+    b = open_shared()
+    a.add_spool("PLA 白", 90, 1000, datetime(2026, 3, 2))
+    assert b.run_jobs([("齿轮", 1)], datetime(2026, 3, 2, 10, 0)).ok
+    b.delete_filament("PETG 黑")
+    a.storage.poll()
+    b.storage.poll()
+    assert [f.name for f in a.filaments.filaments] == ["PLA 白"]
+    assert a.get_filament("PLA 白").remaining == 1700
+    assert len(a.spools("PLA 白")) == 2
+    assert snapshot(a) == snapshot(b)
+
+
+def test_poll_picks_up_renames_in_place(open_shared):
+    """其他进程改名：poll() 按 ID 原地更新同一个对象，广播带 old_key 的 UPDATED 而不是删除 + 新增"""
+    a = open_shared()
+    a.add_filament("PLA 白", "PLA", 100, 1000)
+    a.add_model("齿轮", [{"filament": "PLA 白", "weight": 100}])
+    b = open_shared()
+    filament, model = b.get_filament("PLA 白"), b.get_model("齿轮")
+    cost = b.model_cost("齿轮").total
+    events = []
+    b.filaments.subscribe(lambda e: events.append(("filament", e.action, e.key, e.old_key)))
+    b.models.subscribe(lambda e: events.append(("model", e.action, e.key, e.old_key)))
+    a.update_filament("PLA 白", name="PLA 纯白", total_price=200)
+    a.update_model("齿轮", name="齿轮 v2")
+    assert b.storage.poll()
+    assert b.get_filament("PLA 纯白") is filament
+    assert b.get_model("齿轮 v2") is model
+    assert b.filaments.find_filament("PLA 白") is None and b.models.find_model("齿轮") is None
+    assert ("filament", "updated", "PLA 纯白", "PLA 白") in events
+    assert ("model", "updated", "齿轮 v2", "齿轮") in events
+    assert not [e for e in events if e[1] in ("added", "removed")]
+    assert [(m.filament, m.filament_id) for m in model.materials] == [("PLA 纯白", filament.id)]
+    assert b.models.dependents(filament.id) == [model]
+    assert b.model_cost("齿轮 v2").total == 2 * cost
+    assert snapshot(a) == snapshot(b)
+
+
+def test_legacy_models_get_ids(tmp_path):
+    """没有 ID 的旧模型数据加载时按顺序补发 ID 并写回"""
+    import json
+    (tmp_path / "models.json").write_text(json.dumps(
+        [{"name": "齿轮", "materials": [], "quantity": 1}, {"name": "支架", "materials": [], "quantity": 2}]))
+    service = PrintService(SharedJsonStorage(str(tmp_path / "filaments.json"), str(tmp_path / "models.json"),
+                                             str(tmp_path / "print_history.json")))
+    assert [(m.id, m.name) for m in service.models.models] == [(1, "齿轮"), (2, "支架")]
+    service.add_model("外壳", [])
+    assert service.get_model("外壳").id == 3
+    service.close()
+    assert [m["id"] for m in json.loads((tmp_path / "models.json").read_text())] == [1, 2, 3]
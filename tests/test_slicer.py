@@ -0,0 +1,79 @@
+import json
+import zipfile
+
+import pytest
+
+import slicer
+from slicer import SliceResult
+
+SLICE_INFO = """<?xml version="1.0" encoding="UTF-8"?>
+<config>
+  <plate>
+    <filament id="1" type="PLA" used_g="12.5" />
+    <filament id="2" type="PETG" used_g="3.25" />
+  </plate>
+</config>
+"""
+
+
+def write_3mf(path, settings=None, slice_info=SLICE_INFO):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Metadata/slice_info.config", slice_info)
+        if settings is not None:
+            archive.writestr("Metadata/project_settings.config", settings)
+    return str(path)
+
+
+def test_read_3mf(tmp_path):
+    path = write_3mf(tmp_path / "齿轮.gcode.3mf", json.dumps({"filament_settings_id": ["PLA 白", "PETG 黑"]}))
+    assert slicer.read_file(path) == SliceResult(path, "齿轮", [("PLA 白", 12.5), ("PETG 黑", 3.25)])
+
+
+def test_read_gcode(tmp_path):
+    path = tmp_path / "支架.gcode"
+    path.write_text("; generated by PrusaSlicer\nG1 X0\n; filament used [g] = 4.56, 1.2\n"
+                    "; filament_settings_id = \"PLA 白\";\"PETG 黑\"\n")
+    assert slicer.read_file(str(path)).materials == [("PLA 白", 4.56), ("PETG 黑", 1.2)]
+
+
+@pytest.mark.parametrize("settings", ["[1, 2]", '"PLA"', '{"filament_settings_id": 3}', "{"])
+def test_malformed_3mf_reported(tmp_path, settings):
+    path = write_3mf(tmp_path / "坏.3mf", settings)
+    path_, message = slicer._try_read(path)
+    assert path_ == path and message
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_files_do_not_abort_batch(tmp_path, workers):
+    """坏文件记为失败，其余文件照常解析"""
+    good = write_3mf(tmp_path / "好.3mf", json.dumps({"filament_settings_id": ["PLA 白"]}))
+    bad_json = write_3mf(tmp_path / "坏.3mf", "[]")
+    bad_xml = write_3mf(tmp_path / "坏 xml.3mf", slice_info="<config><filament id='x'")
+    not_zip = tmp_path / "不是 zip.3mf"
+    not_zip.write_bytes(b"not a zip")
+    results = list(slicer.read_files(slicer.find_files([str(tmp_path)]), workers))
+    parsed = [r for r in results if isinstance(r, SliceResult)]
+    failed = sorted(r[0] for r in results if not isinstance(r, SliceResult))
+    assert [r.path for r in parsed] == [good]
+    assert failed == sorted([bad_json, bad_xml, str(not_zip)])
+
+
+def test_import_in_two_steps(json_storage, tmp_path):
+    """界面先在线程池中解析，再在写线程上创建模型：结果与一步导入相同"""
+    from service import PrintService
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    service.add_model("已有", [{"filament": "PLA 白", "weight": 1}])
+    directory = tmp_path / "切片"
+    directory.mkdir()
+    write_3mf(directory / "齿轮.3mf", json.dumps({"filament_settings_id": ["PLA 白@Bambu X1C"]}))
+    write_3mf(directory / "已有.3mf", json.dumps({"filament_settings_id": ["PLA 白"]}))
+    write_3mf(directory / "坏.3mf", "[]")
+    results, failed = service.read_sliced([str(directory)], workers=1)
+    assert len(json_storage.load("models")) == 1  # 解析不写入任何数据
+    report = service.create_sliced(results, failed)
+    assert [m.name for m in report.created] == ["齿轮"]
+    assert report.skipped == ["已有"]
+    assert [path for path, _ in report.failed] == [str(directory / "坏.3mf")]
+    assert report.unmatched == {"PETG"}
+    assert [(m.filament, m.weight) for m in service.get_model("齿轮").materials] == [("PLA 白", 12.5), ("PETG", 3.25)]
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+
+from service import PrintService
+from spool import LEAST, Spool, SpoolPool
+
+T0 = datetime(2026, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def service(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)  # 第一卷 0.1 元/g
+    service.add_spool("PLA 白", 60, 500, datetime(2026, 2, 1))  # 第二卷 0.12 元/g
+    service.add_spool("PLA 白", 40, 500, datetime(2026, 2, 15))  # 第三卷 0.08 元/g
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 300}])
+    return service
+
+
+def remaining(service):
+    return [(s.id, s.remaining) for s in service.get_filament("PLA 白").spools]
+
+
+def test_aggregates_follow_spools(service):
+    filament = service.get_filament("PLA 白")
+    assert [s.id for s in filament.spools] == [1, 2, 3]
+    assert (filament.total_price, filament.initial_amount, filament.remaining) == (200, 2000, 2000)
+    assert filament.price == 0.1
+    with pytest.raises(ValueError):
+        service.update_filament("PLA 白", remaining=10)  # 多卷时只能改各卷
+
+
+def test_fifo_allocation_spans_spools_and_records_cost_basis(service):
+    """先入库的先用；一盘跨两卷时历史按各卷单价记下成本"""
+    assert service.run_jobs([("齿轮", 3)], T0).ok
+    assert remaining(service) == [(1, 100), (2, 500), (3, 500)]
+    assert service.run_jobs([("齿轮", 1)], T0).ok
+    assert remaining(service) == [(2, 300), (3, 500)]  # 用完的第一卷移出
+    entry = service.latest_history(1)[0]
+    assert [(u.spool_id, u.weight, u.cost) for u in entry.spools] == [(1, 100, 10), (2, 200, 24)]
+    assert dict(service.usage("filament"))["PLA 白"].cost == pytest.approx(3 * 30 + 34)
+    assert service.get_filament("PLA 白").remaining == 800
+
+
+def test_shortage_changes_nothing(service):
+    result = service.run_jobs([("齿轮", 7)], T0)
+    assert not result.ok
+    assert remaining(service) == [(1, 1000), (2, 500), (3, 500)]
+    assert service.history.history == []
+
+
+def test_new_spool_replaces_used_up_last_spool(json_storage):
+    service = PrintService(json_storage)
+    service.add_filament("PETG 黑", "PETG", 120, 300)
+    service.add_model("支架", [{"filament": "PETG 黑", "weight": 300}])
+    assert service.use_model("支架").ok
+    assert service.get_filament("PETG 黑").remaining == 0
+    service.add_spool("PETG 黑", 90, 1000, T0)
+    filament = service.get_filament("PETG 黑")
+    assert [(s.price, s.remaining) for s in filament.spools] == [(90, 1000)]
+    assert filament.price == 0.09
+
+
+def test_spool_edits_and_reload(service, json_storage):
+    service.update_spool("PLA 白", 3, remaining=100)
+    service.delete_spool("PLA 白", 2)
+    assert remaining(service) == [(1, 1000), (3, 100)]
+    assert service.get_filament("PLA 白").remaining == 1100
+    assert service.run_jobs([("齿轮", 1)], T0).ok
+    expected = [s.to_dict() for s in service.get_filament("PLA 白").spools]
+    json_storage.flush()
+    reloaded = PrintService(json_storage)
+    assert [s.to_dict() for s in reloaded.get_filament("PLA 白").spools] == expected
+    assert reloaded.add_spool("PLA 白", 10, 100).id == 4  # 卷 ID 不复用
+
+
+def test_least_remaining_policy():
+    """least：剩余最少的先用，零头卷优先用完"""
+    pool = SpoolPool([Spool(100, 1000, 1000, 1, 1), Spool(50, 500, 120, 2, 2), Spool(50, 500, 300, 3, 3)],
+                     policy=LEAST)
+    assert [s.id for s in pool.order()] == [2, 3, 1]
+    taken = pool.allocate(200)
+    assert [(s.id, grams) for s, grams in taken] == [(2, 120), (3, 80)]
+    assert [s.id for s in pool.spools] == [1, 3]
+    assert [s.id for s in pool.order()] == [3, 1]
+    assert pool.remaining == 1220
+    with pytest.raises(ValueError):
+        pool.allocate(5000)
+    assert pool.remaining == 1220
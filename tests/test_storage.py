@@ -0,0 +1,209 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from service import PrintService
+from storage import FILAMENTS, JsonStorage, SqliteStorage
+
+
+def test_sqlite_transactions_from_several_threads(tmp_path):
+    """多个线程同时进入事务：嵌套计数不被打乱，每个事务的写入完整提交"""
+    storage = SqliteStorage(str(tmp_path / "printing.db"))
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(30):
+                with storage.transaction():
+                    time.sleep(0.001)  # 让其他线程有机会在事务中途进入
+                    with storage.transaction():
+                        storage.put(FILAMENTS, f"t{n}-{i}", {"name": f"t{n}-{i}", "category": "PLA"})
+                    storage.load(FILAMENTS)
+        except Exception as e:  # 收集到主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert storage._depth == 0
+    assert len(storage.load(FILAMENTS)) == 4 * 30
+    storage.close()
+
+
+def test_sqlite_rollback_does_not_discard_other_thread(tmp_path):
+    """一个线程的事务回滚时，另一个线程同时提交的写入不受影响"""
+    storage = SqliteStorage(str(tmp_path / "printing.db"))
+    started = threading.Event()
+
+    def failing():
+        try:
+            with storage.transaction():
+                storage.put(FILAMENTS, "回滚", {"name": "回滚", "category": "PLA"})
+                started.set()
+                time.sleep(0.05)
+                raise RuntimeError("中止")
+        except RuntimeError:
+            pass
+
+    def writer():
+        started.wait()
+        with storage.transaction():
+            storage.put(FILAMENTS, "提交", {"name": "提交", "category": "PLA"})
+
+    threads = [threading.Thread(target=failing), threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r["name"] for r in storage.load(FILAMENTS)] == ["提交"]
+    storage.close()
+
+
+def test_json_transactions_from_several_threads(tmp_path):
+    """JSON 存储开启后台写入：多个线程同时进入事务和写入，嵌套计数不乱，最后写出的是完整数据"""
+    storage = JsonStorage(str(tmp_path / "filaments.json"), str(tmp_path / "models.json"),
+                          str(tmp_path / "print_history.json"), write_delay=0.001)
+    rows = []
+    storage.bind(FILAMENTS, lambda: [dict(r) for r in rows])
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(30):
+                with storage.transaction():
+                    rows.append({"name": f"t{n}-{i}"})
+                    time.sleep(0.001)  # 后台线程此时取数会读到事务中途的列表
+                    rows.append({"name": f"t{n}-{i} 配对"})
+                    storage.put(FILAMENTS, f"t{n}-{i}", rows[-1])
+                storage.put(FILAMENTS, f"t{n}-{i}", rows[-1])
+        except Exception as e:  # 收集到主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    storage.close()
+    assert errors == []
+    assert storage._depth == 0 and not storage._dirty
+    saved = storage.load(FILAMENTS)
+    assert len(saved) == 4 * 30 * 2
+    assert all(saved[i + 1]["name"] == saved[i]["name"] + " 配对" for i in range(0, len(saved), 2))
+
+
+# ------------------ 各存储后端读回相同的记录 ------------------
+def open_backend(kind, directory):
+    if kind == "sqlite":
+        return SqliteStorage(str(directory / "printing.db"))
+    return JsonStorage(str(directory / "filaments.json"), str(directory / "models.json"),
+                       str(directory / "print_history.json"), binary=kind == "binary")
+
+
+def populate(service):
+    """覆盖多卷库存、改名、删除、分卷成本的历史记录和旧格式的单卷耗材"""
+    service.add_filament("PLA 白", "PLA", 89, 1000)
+    service.add_filament("PETG 黑", "PETG", 120, 1000)
+    service.add_filament("待删除", "TPU", 50, 500)
+    service.add_spool("PLA 白", 99, 1000, datetime(2026, 1, 2, 8, 0))
+    service.add_model("齿轮", [{"filament": "PLA 白", "weight": 1500}, {"filament": "PETG 黑", "weight": 20}], 4)
+    service.add_model("支架", [{"filament": "PETG 黑", "weight": 35.5}])
+    service.add_model("旧模型", [{"filament": "待删除", "weight": 10}])
+    assert service.run_jobs([("齿轮", 1), ("支架", 2)], datetime(2026, 2, 1, 9, 30)).ok
+    assert service.run_jobs([("支架", 1)], datetime(2026, 2, 3, 18, 0)).ok
+    service.update_filament("PETG 黑", name="PETG 深黑")
+    service.update_model("支架", name="支架 v2", quantity=2)
+    service.delete_model("旧模型")
+    service.delete_filament("待删除")
+    service.delete_history(service.latest_history(1)[0].id)
+
+
+def records(service):
+    return ([f.to_dict() for f in service.filaments.filaments],
+            [m.to_dict() for m in service.models.models],
+            [e.to_dict() for e in service.history.history])
+
+
+def reload(kind, directory):
+    service = PrintService(open_backend(kind, directory))
+    try:
+        return records(service)
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize("kind", ["json", "binary", "sqlite"])
+def test_backends_round_trip(tmp_path, kind):
+    service = PrintService(open_backend(kind, tmp_path))
+    populate(service)
+    expected = records(service)
+    service.close()
+    assert reload(kind, tmp_path) == expected
+
+
+def test_backends_load_same_records(tmp_path):
+    loaded = {}
+    for kind in ("json", "binary", "sqlite"):
+        directory = tmp_path / kind
+        directory.mkdir()
+        service = PrintService(open_backend(kind, directory))
+        populate(service)
+        service.close()
+        loaded[kind] = reload(kind, directory)
+    assert loaded["binary"] == loaded["json"]
+    assert loaded["sqlite"] == loaded["json"]
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_history_journal_replayed_on_load(tmp_path, binary):
+    """未合并进快照的历史日志（追加和删除）在加载时重放"""
+    storage = open_backend("binary" if binary else "json", tmp_path)
+    service = PrintService(storage)
+    populate(service)
+    service.history.compact()
+    assert service.run_jobs([("支架 v2", 1)], datetime(2026, 2, 5, 7, 0)).ok
+    service.delete_history(service.history.history[0].id)
+    expected = records(service)
+    storage.flush()  # 不关闭：日志保留未合并的操作
+    assert storage.journal.pending == 2
+    assert reload("binary" if binary else "json", tmp_path) == expected
+
+
+def test_snapshot_conversion_round_trip(tmp_path):
+    import snapshot
+    service = PrintService(open_backend("json", tmp_path))
+    populate(service)
+    expected = records(service)
+    service.close()
+    snapshot.to_binary(str(tmp_path))
+    assert reload("binary", tmp_path) == expected
+    snapshot.to_json(str(tmp_path))
+    assert reload("json", tmp_path) == expected
+
+
+@pytest.mark.parametrize("kind", ["json", "binary", "sqlite"])
+def test_duplicate_names_rejected(tmp_path, kind):
+    """名称是 SQLite 表的主键：任何后端都不允许重名，否则重新打开后只剩一条"""
+    service = PrintService(open_backend(kind, tmp_path))
+    service.add_filament("PLA", "PLA", 100, 1000)
+    service.add_filament("PETG", "PETG", 120, 1000)
+    service.add_model("齿轮", [{"filament": "PLA", "weight": 10}])
+    service.add_model("支架", [{"filament": "PLA", "weight": 10}])
+    with pytest.raises(ValueError):
+        service.add_filament(" PLA ", "PETG", 50, 500)
+    with pytest.raises(ValueError):
+        service.update_filament("PETG", name="PLA")
+    with pytest.raises(ValueError):
+        service.add_model("齿轮", [{"filament": "PLA", "weight": 20}])
+    with pytest.raises(ValueError):
+        service.update_model("支架", name="齿轮")
+    service.update_filament("PLA", name="PLA", category="PLA+")  # 名称不变不算重名
+    expected = records(service)
+    service.close()
+    assert reload(kind, tmp_path) == expected
+    assert [f["name"] for f in expected[0]] == ["PLA", "PETG"]
@@ -0,0 +1,42 @@
+import pytest
+
+from service import PrintService
+from storage import JsonStorage
+from writebehind import WriteBehind
+
+
+def fail():
+    raise OSError("No space left on device")
+
+
+def test_flush_raises_failed_write():
+    writer = WriteBehind(0.01)
+    written = []
+    writer.mark_dirty("a", fail)
+    writer.submit(lambda: written.append(1))
+    with pytest.raises(OSError):
+        writer.flush()
+    assert written == [1]  # 其余写入照常执行
+    writer.flush()  # 错误只报告一次
+    writer.close()
+
+
+def test_close_raises_failed_write():
+    writer = WriteBehind(10)
+    writer.mark_dirty("a", fail)
+    with pytest.raises(OSError):
+        writer.close()
+    assert not writer._thread.is_alive()
+
+
+def test_storage_close_reports_lost_save(tmp_path):
+    """数据目录不可写时，关闭服务抛出错误而不是静默丢失修改"""
+    directory = tmp_path / "data"
+    directory.mkdir()
+    storage = JsonStorage(str(directory / "filaments.json"), str(directory / "models.json"),
+                          str(directory / "print_history.json"), write_delay=10)
+    service = PrintService(storage)
+    service.add_filament("PLA 白", "PLA", 100, 1000)
+    directory.rmdir()
+    with pytest.raises(OSError):
+        service.close()
@@ -0,0 +1,31 @@
+"""打印历史使用的时间表示：整数秒（本地时间、无时区）与 datetime / 字符串之间的转换"""
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_EPOCH = datetime(1970, 1, 1)  # 时间戳按本地时间（无时区）计秒，避免夏令时带来的往返误差
+
+
+def to_seconds(dt: datetime) -> int:
+    return (dt - _EPOCH) // timedelta(seconds=1)
+
+
+def from_seconds(ts: int) -> datetime:
+    return _EPOCH + timedelta(seconds=ts)
+
+
+def parse_time(text: str) -> int:
+    """解析 "%Y-%m-%d %H:%M:%S" 为整数秒（比 strptime 快得多）"""
+    try:
+        return to_seconds(datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                                   int(text[11:13]), int(text[14:16]), int(text[17:19])))
+    except ValueError:
+        return to_seconds(datetime.strptime(text, TIME_FORMAT))
+
+
+def as_seconds(value) -> int:
+    """datetime / 时间字符串（可只有日期）/ 整数秒 统一为整数秒"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return parse_time(value if len(value) > 10 else value + " 00:00:00")
+    return to_seconds(value)
@@ -0,0 +1,115 @@
+from bisect import bisect_right, insort
+from events import ADDED, UPDATED, REMOVED, RESET
+from instrument import timed
+
+
+class TreeSync:
+    """把管理器的变更事件增量地应用到 Treeview 上
+
+    维护 实体对象 <-> Treeview item id 的映射，单个实体变化时只改动对应的一行。
+    render(obj) 返回 (text, values, children)，children 为 [(text, values, tags), ...]。
+    sort_key 给出时按该键升序保持行的顺序，否则新行插入到 position（END 或 0）。
+    """
+
+    def __init__(self, tree, render, sort_key=None, position="end"):
+        self.tree = tree
+        self.render = render
+        self.sort_key = sort_key
+        self.position = position
+        self._items = {}  # id(obj) -> item
+        self._objs = {}  # item -> obj
+        self._order = []  # 有序模式下与行顺序一致的 (sort_key, seq)
+        self._order_keys = {}  # item -> (sort_key, seq)
+        self._seq = 0
+
+    def item_for(self, obj):
+        return self._items.get(id(obj))
+
+    def obj_for(self, item):
+        return self._objs.get(item)
+
+    @timed()
+    def reset(self, objs):
+        """全量重建（仅用于初次加载或 load_data 之后）"""
+        self.tree.delete(*self.tree.get_children())
+        self._items.clear()
+        self._objs.clear()
+        self._order.clear()
+        self._order_keys.clear()
+        if self.sort_key is not None:
+            objs = sorted(objs, key=self.sort_key)
+        for obj in objs:
+            self._insert(obj, "end")
+
+    def _insert(self, obj, index):
+        text, values, children = self.render(obj)
+        item = self.tree.insert("", index, text=text, values=values, open=False)
+        for child_text, child_values, tags in children:
+            self.tree.insert(item, "end", text=child_text, values=child_values, tags=tags)
+        self._items[id(obj)] = item
+        self._objs[item] = obj
+        if self.sort_key is not None:
+            self._seq += 1
+            order_key = (self.sort_key(obj), self._seq)
+            insort(self._order, order_key)
+            self._order_keys[item] = order_key
+        return item
+
+    @timed()
+    def insert(self, obj):
+        if self.item_for(obj) is not None:
+            return self.update(obj)
+        if self.sort_key is None:
+            return self._insert(obj, self.position)
+        index = bisect_right(self._order, (self.sort_key(obj), self._seq + 1))
+        return self._insert(obj, index)
+
+    def extend(self, objs):
+        """在末尾追加一批行（用于分页加载下一页）"""
+        for obj in objs:
+            if self.item_for(obj) is None:
+                self._insert(obj, "end")
+
+    @timed()
+    def update(self, obj):
+        item = self.item_for(obj)
+        if item is None:
+            return self.insert(obj)
+        text, values, children = self.render(obj)
+        self.tree.item(item, text=text, values=values)
+        self.tree.delete(*self.tree.get_children(item))
+        for child_text, child_values, tags in children:
+            self.tree.insert(item, "end", text=child_text, values=child_values, tags=tags)
+
+        if self.sort_key is not None:
+            old_key = self._order_keys[item]
+            new_key = (self.sort_key(obj), old_key[1])
+            if new_key != old_key:
+                self._order.pop(bisect_right(self._order, old_key) - 1)
+                index = bisect_right(self._order, new_key)
+                self._order.insert(index, new_key)
+                self._order_keys[item] = new_key
+                self.tree.move(item, "", index)
+        return item
+
+    @timed()
+    def remove(self, obj):
+        item = self._items.pop(id(obj), None)
+        if item is None:
+            return
+        del self._objs[item]
+        if self.sort_key is not None:
+            old_key = self._order_keys.pop(item)
+            self._order.pop(bisect_right(self._order, old_key) - 1)
+        self.tree.delete(item)
+
+    def apply(self, event, objs=None):
+        """应用一个 ChangeEvent；RESET 事件需要传入全部实体 objs"""
+        if event.action == ADDED:
+            self.insert(event.obj)
+        elif event.action == UPDATED:
+            self.update(event.obj)
+        elif event.action == REMOVED:
+            self.remove(event.obj)
+        elif event.action == RESET:
+            self.reset(objs if objs is not None else [])
@@ -0,0 +1,141 @@
+"""列表行的显示内容（与界面无关，App 的各个 Treeview 共用）
+
+每个函数返回 (text, values, children)，children 为 [(text, values, tags), ...]。
+"""
+from timeutil import TIME_FORMAT, from_seconds
+
+
+def filament_row(f):
+    """耗材行"""
+    # 四舍五入到小数点后两位显示
+    total_price = round(f.total_price, 2)
+    price_per_g = round(f.price, 4)  # 确保每克的价格四舍五入到小数点后 4 位
+    remaining = round(f.remaining, 2)
+    return f.name, (
+        f.category,
+        f"{total_price:.2f}",
+        f"{price_per_g:.4f}",
+        f.initial_amount,
+        f"{remaining:.2f}"
+    ), []
+
+
+def spool_row(spool, order):
+    """耗材的一卷，order 为扣料顺序（从 1 开始，已用完的为 None）"""
+    added = from_seconds(spool.added).strftime(TIME_FORMAT) if spool.added is not None else "-"
+    return str(spool.id) if spool.id is not None else "-", (
+        order or "已用完",
+        added,
+        f"{spool.price:.2f}",
+        f"{spool.unit_price:.4f}",
+        spool.amount,
+        f"{spool.remaining:.2f}"
+    ), []
+
+
+def model_row(m, cost):
+    """模型父项及其耗材子项，cost 为 ModelCost"""
+    # 子项（耗材详情）
+    children = [
+        (
+            "→ " + name,
+            (
+                f"{weight}g",  # 显示耗材重量
+                1,  # 单耗材数量固定为1
+                f"{material_cost:.2f}",  # 显示单个耗材成本
+                f"{material_unit_cost:.2f}"  # 显示子项的单价（总价/数量）
+            ),
+            ("child",)  # 添加标签用于样式控制
+        )
+        for name, weight, material_cost, material_unit_cost in cost.materials
+    ]
+
+    # 父项（模型）中的"使用耗材"和"单价"信息
+    return m.name, (
+        f"{cost.weight:.2f}g",  # 显示所有耗材的总重量
+        m.quantity,
+        f"{cost.total:.2f}",  # 总成本
+        f"{cost.unit:.2f}"  # 父项的单价（总成本/数量）
+    ), children
+
+
+def capacity_row(m, capacity, low: bool):
+    """库存预测：模型还能打印的盘数，capacity 为 ModelCapacity"""
+    return m.name, (
+        capacity.prints,
+        capacity.limiting or "-",
+        "库存不足" if low else ""
+    ), []
+
+
+def outlook_row(f, outlook, low: bool):
+    """库存预测：耗材的消耗速度和预计用完日期，outlook 为 FilamentOutlook"""
+    if outlook.days_left is None:
+        days, date = "-", "近期无消耗"
+    else:
+        days, date = f"{outlook.days_left:.1f}", f"{outlook.depletion:%Y-%m-%d}"
+    return f.name, (
+        f"{outlook.remaining:.2f}",
+        f"{outlook.rate:.2f}",
+        days,
+        date,
+        "即将用完" if low else ""
+    ), []
+
+
+def history_row(entry):
+    """打印历史行"""
+    materials_str = ", ".join(
+        [f"{mat.filament}({mat.weight}g)" for mat in entry.used_materials]
+    )
+    time_str = entry.time_str()
+    return "", (entry.model_name, materials_str, time_str), []
+
+
+def profile_row(stat):
+    """性能统计行，stat 为 instrument.snapshot() 中的一项（时间换算为毫秒）"""
+    return stat["name"], (
+        stat["count"],
+        f"{stat['total'] * 1000:.1f}",
+        f"{stat['mean'] * 1000:.3f}",
+        f"{stat['p50'] * 1000:.3f}",
+        f"{stat['p99'] * 1000:.3f}",
+        stat["bytes"] or ""
+    ), []
+
+
+def farm_job_row(job):
+    """排产队列中的任务，job 为 FarmJob"""
+    return str(job.id), (
+        job.model,
+        job.count,
+        f"{job.duration:g}",
+        "、".join(job.printers) or "不限"
+    ), []
+
+
+def printer_row(printer, plates, limit: int = None):
+    """打印机父项及其排产的盘，plates 为该打印机上按开始时间排序的 Assignment（正在打印的在前）
+
+    limit 给出时子项只列出前 limit 盘
+    """
+    children = [
+        (
+            "→ " + a.model,
+            (
+                "打印中" if a.job is None else f"任务 {a.job}",
+                f"{a.start:%m-%d %H:%M}",
+                f"{a.end:%m-%d %H:%M}"
+            ),
+            ("child",)
+        )
+        for a in plates[:limit]
+    ]
+    if limit is not None and len(plates) > limit:
+        children.append((f"……另有 {len(plates) - limit} 盘", ("", "", ""), ("child",)))
+    status = "打印中" if plates and plates[0].job is None else ("空闲" if not plates else "待开始")
+    return printer, (
+        status,
+        f"共 {len(plates)} 盘",
+        f"{plates[-1].end:%m-%d %H:%M}" if plates else "-"
+    ), children
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+import instrument
+from instrument import timed
+
+
+def atomic_dump(path: str, data, indent: int = None):
+    """以 临时文件 + fsync + 原子替换 的方式写 JSON，写到一半崩溃也不会截断原文件"""
+    atomic_write(path, json.dumps(data, indent=indent))
+
+
+@timed()
+def atomic_write(path: str, text):
+    """写入文本或字节（bytes 以二进制方式写入）"""
+    data = text if isinstance(text, bytes) else None
+    if instrument.ENABLED:
+        instrument.add_bytes(f"写入 {os.path.basename(path)}", len(data if data is not None else text.encode('utf-8')))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb' if data is not None else 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class WriteBehind:
+    """后台写入线程：合并短时间内的重复保存，按顺序执行追加类写入
+
+    mark_dirty(key, write)：标记某个集合需要保存，delay 秒内的多次标记只写一次；
+    submit(op)：按提交顺序执行的写操作（如历史日志追加）；
+    flush()：阻塞直到所有待写内容落盘（退出前调用），此前有写入失败时抛出该异常。
+    """
+
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+        self.last_error = None
+        self._cond = threading.Condition()
+        self._dirty = {}  # key -> 写函数（只保留最新的一个）
+        self._due = {}  # key -> 最晚写入时间
+        self._queue = deque()  # 顺序执行的写操作
+        self._busy = False
+        self._flushing = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, key, write):
+        with self._cond:
+            self._dirty[key] = write
+            # 第一次标记决定写入时间，窗口内的后续标记不再推迟，保证延迟有上限
+            self._due.setdefault(key, time.monotonic() + self.delay)
+            self._cond.notify_all()
+
+    def submit(self, op):
+        with self._cond:
+            self._queue.append(op)
+            self._cond.notify_all()
+
+    def pending(self) -> bool:
+        with self._cond:
+            return bool(self._queue or self._dirty or self._busy)
+
+    def _take(self):
+        """取出当前应执行的写操作；没有时返回需要等待的秒数"""
+        now = time.monotonic()
+        ops = list(self._queue)
+        self._queue.clear()
+        ready = [key for key, due in self._due.items() if self._flushing or self._closed or due <= now]
+        for key in ready:
+            ops.append(self._dirty.pop(key))
+            del self._due[key]
+        if ops:
+            return ops, None
+        return None, (min(self._due.values()) - now if self._due else None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    ops, wait = self._take()
+                    if ops or (self._closed and not self._dirty):
+                        break
+                    self._cond.wait(wait)
+                if not ops:
+                    return
+                self._busy = True
+            for op in ops:
+                try:
+                    op()
+                except Exception as e:
+                    # 记下第一个错误，由 flush()/close() 在调用方线程抛出
+                    with self._cond:
+                        self.last_error = self.last_error or e
+                    print(f"后台保存失败: {str(e)}", file=sys.stderr)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._queue or self._dirty or self._busy:
+                    self._cond.wait()
+            finally:
+                self._flushing -= 1
+            error, self.last_error = self.last_error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._thread.join()